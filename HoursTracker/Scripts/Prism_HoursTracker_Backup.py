@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Compressed, deduplicated snapshots of the user's data files.
+
+Each file is stored once per distinct content, gzip compressed, under
+backup/objects/ and named after the sha1 of its content. A snapshot is a
+small json manifest in backup/snapshots/ mapping each file name to its
+content hash, so a snapshot of files that didn't change costs a manifest,
+and a snapshot where nothing changed is skipped.
+
+Usage: python Prism_HoursTracker_Backup.py [--dir DIR] list
+       python Prism_HoursTracker_Backup.py [--dir DIR] restore SNAPSHOT TARGET
+       python Prism_HoursTracker_Backup.py [--dir DIR] prune [--weekly N]
+                                                            [--monthly M]
+"""
+
+import argparse
+from datetime import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from Prism_HoursTracker_Lock import write_file_atomic
+from Prism_HoursTracker_Variables import Prism_HoursTracker_Variables, get_setting
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class HoursBackup(object):
+    '''
+    Snapshots of files in backup_dir, see the module docstring.
+    Files are streamed in chunks, never loaded whole in memory.
+    '''
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.objects_dir = os.path.join(backup_dir, 'objects')
+        self.snapshots_dir = os.path.join(backup_dir, 'snapshots')
+
+    def get_object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2],
+                            content_hash + '.gz')
+
+    def add_object(self, filepath):
+        '''
+        Stores the content of filepath if it isn't stored yet.
+        Returns its hash, its size and the number of compressed bytes
+        written, 0 if the content was already stored.
+        '''
+        if not os.path.exists(self.objects_dir):
+            os.makedirs(self.objects_dir)
+        temp_path = os.path.join(
+            self.objects_dir, '{}.{}.tmp'.format(os.getpid(), time.time()))
+
+        # Hash and compress in one pass, the object is named afterwards
+        sha1 = hashlib.sha1()
+        size = 0
+        try:
+            with open(filepath, 'rb') as source_file:
+                with gzip.open(temp_path, 'wb') as object_file:
+                    for chunk in iter(lambda: source_file.read(CHUNK_SIZE), b''):
+                        sha1.update(chunk)
+                        size += len(chunk)
+                        object_file.write(chunk)
+
+            content_hash = sha1.hexdigest()
+            object_path = self.get_object_path(content_hash)
+            if os.path.exists(object_path):
+                return content_hash, size, 0
+            written = os.path.getsize(temp_path)
+            if not os.path.exists(os.path.dirname(object_path)):
+                os.makedirs(os.path.dirname(object_path))
+            os.replace(temp_path, object_path)
+            return content_hash, size, written
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def snapshot(self, files):
+        '''
+        Snapshots files, a dict of paths by name, skipping the missing ones.
+        Returns a dict of statistics: the snapshot name, None if nothing
+        changed since the last snapshot, the bytes of the files, the bytes
+        written and saved compared to a full copy, at least 0, and the time
+        it took.
+        '''
+        start = time.time()
+        manifest = {'time': start, 'files': {}}
+        stats = {'snapshot': None, 'bytes': 0, 'written': 0}
+        for name, filepath in sorted(files.items()):
+            if not os.path.exists(filepath):
+                continue
+            content_hash, size, written = self.add_object(filepath)
+            manifest['files'][name] = {'hash': content_hash, 'size': size}
+            stats['bytes'] += size
+            stats['written'] += written
+
+        snapshots = self.list_snapshots()
+        last = self.read_manifest(snapshots[-1]) if snapshots else None
+        if last is None or last['files'] != manifest['files']:
+            name = datetime.fromtimestamp(start).strftime('%Y-%m-%d_%H%M%S')
+            # Snapshots taken within the same second don't overwrite each
+            # other, the zero padded counter keeps them sorted by time
+            counter = 0
+            base_name = name
+            while name in snapshots:
+                counter += 1
+                name = '{}_{:03d}'.format(base_name, counter)
+            content = json.dumps(manifest, sort_keys=True)
+            if not os.path.exists(self.snapshots_dir):
+                os.makedirs(self.snapshots_dir)
+            write_file_atomic(
+                os.path.join(self.snapshots_dir, name + '.json'), content)
+            stats['snapshot'] = name
+            stats['written'] += len(content)
+
+        # The manifest and the gzip headers can outweigh small files
+        stats['saved'] = max(0, stats['bytes'] - stats['written'])
+        stats['seconds'] = time.time() - start
+        return stats
+
+    def list_snapshots(self):
+        '''
+        Returns the names of the snapshots, oldest first.
+        '''
+        try:
+            filenames = os.listdir(self.snapshots_dir)
+        except OSError:
+            return []
+        return sorted(filename[:-5] for filename in filenames
+                      if filename.endswith('.json'))
+
+    def read_manifest(self, snapshot):
+        path = os.path.join(self.snapshots_dir, snapshot + '.json')
+        with open(path, 'r') as manifest_file:
+            return json.loads(manifest_file.read())
+
+    def restore(self, snapshot, target_dir, names=None):
+        '''
+        Restores the files of a snapshot, or only the given names, to
+        target_dir. Objects are decompressed in chunks to a temporary file
+        renamed over the target.
+        Returns the paths of the restored files.
+        '''
+        manifest = self.read_manifest(snapshot)
+        if not os.path.exists(target_dir):
+            os.makedirs(target_dir)
+        restored = []
+        for name, entry in sorted(manifest['files'].items()):
+            if names is not None and name not in names:
+                continue
+            target = os.path.join(target_dir, name)
+            temp_path = '{}.{}.tmp'.format(target, os.getpid())
+            object_path = self.get_object_path(entry['hash'])
+            with gzip.open(object_path, 'rb') as object_file:
+                with open(temp_path, 'wb') as target_file:
+                    shutil.copyfileobj(object_file, target_file, CHUNK_SIZE)
+            os.replace(temp_path, target)
+            restored.append(target)
+        return restored
+
+    def prune(self, weekly=8, monthly=12):
+        '''
+        Deletes the snapshots past the retention rules, then the objects no
+        snapshot refers to. Keeps the latest snapshot, and the last snapshot
+        of each of the last weekly ISO weeks and monthly months.
+        Returns the number of snapshots and objects deleted.
+        '''
+        snapshots = self.list_snapshots()
+        keep = set(snapshots[-1:])
+        for count, get_period in (
+                (weekly, lambda day: day.isocalendar()[:2]),
+                (monthly, lambda day: (day.year, day.month))):
+            periods = []
+            for snapshot in reversed(snapshots):
+                period = get_period(datetime.strptime(snapshot[:10], '%Y-%m-%d'))
+                if period in periods:
+                    continue
+                if len(periods) == count:
+                    break
+                periods.append(period)
+                keep.add(snapshot)
+
+        deleted_snapshots = 0
+        for snapshot in snapshots:
+            if snapshot not in keep:
+                os.remove(os.path.join(self.snapshots_dir, snapshot + '.json'))
+                deleted_snapshots += 1
+
+        referenced = set()
+        for snapshot in keep:
+            files = self.read_manifest(snapshot)['files']
+            referenced.update(entry['hash'] for entry in files.values())
+        deleted_objects = 0
+        for root, dirnames, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                if filename.endswith('.gz') and filename[:-3] not in referenced:
+                    os.remove(os.path.join(root, filename))
+                    deleted_objects += 1
+
+        return deleted_snapshots, deleted_objects
+
+
+def format_stats(stats):
+    '''
+    Returns a one line report of the statistics of a snapshot.
+    '''
+    if stats['snapshot'] is None:
+        return 'Backup skipped, nothing changed since the last snapshot'
+    return ('Backup {snapshot}: {bytes} bytes, {written} written, {saved} saved '
+            'in {milliseconds:.0f} ms'.format(
+                milliseconds=stats['seconds'] * 1e3, **stats))
+
+
+def main(argv=None):
+    variables = Prism_HoursTracker_Variables(None, None)
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument(
+        '--dir', default=get_setting(variables, 'data_dir'),
+        help='HoursTracker data directory of the user')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('list', help='list the snapshots')
+    restore = commands.add_parser('restore', help='restore a snapshot')
+    restore.add_argument('snapshot')
+    restore.add_argument('target', help='directory to restore the files to')
+    prune = commands.add_parser('prune', help='delete the old snapshots')
+    prune.add_argument('--weekly', type=int,
+                       default=get_setting(variables, 'backup_keep_weekly'))
+    prune.add_argument('--monthly', type=int,
+                       default=get_setting(variables, 'backup_keep_monthly'))
+    args = parser.parse_args(argv)
+
+    backup = HoursBackup(os.path.join(args.dir, 'backup'))
+    if args.command == 'restore':
+        for path in backup.restore(args.snapshot, args.target):
+            print(path)
+    elif args.command == 'prune':
+        print('Deleted {} snapshots and {} objects'.format(
+            *backup.prune(args.weekly, args.monthly)))
+    else:
+        for snapshot in backup.list_snapshots():
+            files = backup.read_manifest(snapshot)['files']
+            print('{}  {}'.format(snapshot, ', '.join(sorted(files))))
+
+
+if __name__ == '__main__':
+    main()
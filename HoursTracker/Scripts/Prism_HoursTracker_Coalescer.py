@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+class EventCoalescer(object):
+    '''
+    Merges bursts of callbacks into a single event.
+
+    The first event on a project opens a burst and is applied straight away.
+    The following events on the same project within `window` seconds are
+    absorbed, only the last one is kept and applied when the burst ends:
+    on the next event after the window, on an event on another project, or
+    when the plugin drains the coalescer before writing its data.
+    '''
+    def __init__(self, window=2.0):
+        self.window = window
+        self._burst_project = None
+        self._burst_start = None
+        self._pending = None
+        self._received = {}
+        self._absorbed = {}
+
+    def offer(self, timestamp, project, callback):
+        '''
+        Returns the list of (timestamp, project, callback) events to apply
+        after receiving this one, empty if the event was absorbed.
+        '''
+        self._received[callback] = self._received.get(callback, 0) + 1
+        event = (timestamp, project, callback)
+
+        if (project == self._burst_project
+                and timestamp - self._burst_start < self.window):
+            self._pending = event
+            self._absorbed[callback] = self._absorbed.get(callback, 0) + 1
+            return []
+
+        events = self.drain()
+        events.append(event)
+        self._burst_project = project
+        self._burst_start = timestamp
+        return events
+
+    def drain(self):
+        '''
+        Returns the absorbed event that wasn't applied yet, if any.
+        The burst stays open, later events in its window are still absorbed.
+        '''
+        if self._pending is None:
+            return []
+        events = [self._pending]
+        self._pending = None
+        return events
+
+    def get_stats(self):
+        '''
+        Returns a dict of callback name: {'received': int, 'absorbed': int}
+        '''
+        return dict(
+            (callback, {'received': received,
+                        'absorbed': self._absorbed.get(callback, 0)})
+            for callback, received in self._received.items())
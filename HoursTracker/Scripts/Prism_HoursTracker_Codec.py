@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Serialisation of the tracker's state.
+
+JSON goes through orjson when it is installed, the stdlib json module
+otherwise. dumps() returns utf-8 bytes with either of them, so files are
+written in binary mode whatever the platform's encoding.
+
+The user's data can also be stored in a compact binary format: the days,
+sessions and project sessions are packed in arrays of 32 bits integers and
+the strings are stored once, so reading it back neither parses json nor
+times. The html report still reads json, see HoursStore.compact_data().
+
+load_data() detects the format of a file from its first bytes, so a data
+directory can switch between the formats: the next compaction rewrites
+hours.json in the configured one.
+"""
+
+from array import array
+import gzip
+import json
+import struct
+import sys
+
+from Prism_HoursTracker_Model import (Day, HoursData, ProjectSession, Session,
+                                      decode, encode, intern_project)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+DATA_FORMATS = ('json', 'binary')
+
+# Can't start a json document nor a gzip stream, and catches the usual
+# mangling of binary files like the png signature it is modeled after
+BINARY_MAGIC = b'\x89HTB\r\n\x1a\n'
+BINARY_VERSION = 1
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Version, generation, last event time, indexes of the user id and of the
+# last active project in the strings, -1 for None, and the number of
+# strings, days, sessions and project sessions
+_HEADER = struct.Struct('<HqqiiIIII')
+_LENGTH = struct.Struct('<I')
+# Arrays of 32 bits integers, stored little endian
+_INT = 'i' if array('i').itemsize == 4 else 'l'
+_SWAP = sys.byteorder != 'little'
+
+
+def dumps(obj, sort_keys=False):
+    '''
+    Returns the json of obj as utf-8 bytes.
+    '''
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, sort_keys=sort_keys, separators=(',', ':')).encode('utf-8')
+
+
+def loads(content):
+    '''
+    Returns the object of a json document, str or bytes.
+    '''
+    if orjson is not None:
+        return orjson.loads(content)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    return json.loads(content)
+
+
+def get_json_backend():
+    return 'orjson' if orjson is not None else 'json'
+
+
+def detect_format(content):
+    '''
+    Returns the format of the content of a data file or archive: 'binary',
+    'gzip' or 'json'. Raises ValueError if it is none of them, an empty or
+    truncated file for instance.
+    '''
+    if isinstance(content, bytes):
+        if content.startswith(BINARY_MAGIC):
+            return 'binary'
+        if content.startswith(GZIP_MAGIC):
+            return 'gzip'
+        start = content.lstrip()[:1]
+        if start in (b'{', b'['):
+            return 'json'
+    elif content.lstrip()[:1] in ('{', '['):
+        return 'json'
+    raise ValueError('not a HoursTracker data file')
+
+
+def load_data(content):
+    '''
+    Returns the HoursData of the content of a data file or archive, bytes in
+    any of the formats, gzip compressed or not.
+    '''
+    content_format = detect_format(content)
+    if content_format == 'gzip':
+        content = gzip.decompress(content)
+        content_format = detect_format(content)
+    if content_format == 'binary':
+        return decode_binary(content)
+    return decode(loads(content))
+
+
+def dump_data(data, data_format='json'):
+    '''
+    Returns the content of the data file of a HoursData object in
+    data_format, 'json' or 'binary', as bytes.
+    '''
+    if data_format == 'binary':
+        return encode_binary(data)
+    return dumps(encode(data))
+
+
+def _pack_ints(values):
+    if _SWAP:
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_binary(data):
+    '''
+    Returns the binary format of a HoursData object.
+    '''
+    strings = []
+    indexes = {}
+
+    def get_index(value):
+        if value is None:
+            return -1
+        index = indexes.get(value)
+        if index is None:
+            index = indexes[value] = len(strings)
+            strings.append(value)
+        return index
+
+    ordinals = array(_INT)
+    session_counts = array(_INT)
+    projects = array(_INT)
+    interval_counts = array(_INT)
+    intervals = array(_INT)
+    for day in data.days:
+        ordinals.append(day.ordinal)
+        session_counts.append(len(day.sessions))
+        for session in day.sessions:
+            projects.append(get_index(session.project))
+            interval_counts.append(len(session.project_sessions))
+            for project_session in session.project_sessions:
+                intervals.append(project_session.start)
+                intervals.append(project_session.last)
+
+    parts = [BINARY_MAGIC, _HEADER.pack(
+        BINARY_VERSION, data.generation, int(data.last_event_time),
+        get_index(data.user_id), get_index(data.last_active_project),
+        len(strings), len(ordinals), len(projects), len(intervals) // 2)]
+    for string in strings:
+        encoded = str(string).encode('utf-8')
+        parts.append(_LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+    extra = dumps(data.extra) if data.extra else b''
+    parts.append(_LENGTH.pack(len(extra)))
+    parts.append(extra)
+    for values in (ordinals, session_counts, projects, interval_counts, intervals):
+        parts.append(_pack_ints(values))
+    return b''.join(parts)
+
+
+def decode_binary(content):
+    '''
+    Returns the HoursData of the binary format. Raises ValueError if the
+    content is truncated or inconsistent.
+    '''
+    if not content.startswith(BINARY_MAGIC):
+        raise ValueError('not a HoursTracker binary file')
+    offset = len(BINARY_MAGIC)
+    try:
+        (version, generation, last_event_time, user_index, project_index,
+         string_count, day_count, session_count,
+         interval_count) = _HEADER.unpack_from(content, offset)
+        offset += _HEADER.size
+        if version != BINARY_VERSION:
+            raise ValueError('unsupported binary version {}'.format(version))
+
+        strings = []
+        for _ in range(string_count + 1):
+            length, = _LENGTH.unpack_from(content, offset)
+            offset += _LENGTH.size
+            if offset + length > len(content):
+                raise ValueError('truncated binary file')
+            strings.append(content[offset:offset + length].decode('utf-8'))
+            offset += length
+    except struct.error as error:
+        raise ValueError('truncated binary file: {}'.format(error))
+    # The extra keys follow the strings
+    extra = strings.pop()
+    strings = [intern_project(string) for string in strings]
+
+    def read_ints(count, offset):
+        size = count * 4
+        values = array(_INT)
+        values.frombytes(content[offset:offset + size])
+        if len(values) != count:
+            raise ValueError('truncated binary file')
+        if _SWAP:
+            values.byteswap()
+        return values, offset + size
+
+    ordinals, offset = read_ints(day_count, offset)
+    session_counts, offset = read_ints(day_count, offset)
+    projects, offset = read_ints(session_count, offset)
+    interval_counts, offset = read_ints(session_count, offset)
+    intervals, offset = read_ints(interval_count * 2, offset)
+    if offset != len(content):
+        raise ValueError('trailing bytes in binary file')
+    if (sum(session_counts) != session_count
+            or sum(interval_counts) != interval_count
+            or (session_count and not -1 <= min(projects) <= max(projects) < string_count)
+            or not -1 <= user_index < string_count
+            or not -1 <= project_index < string_count):
+        raise ValueError('inconsistent binary file')
+
+    data = HoursData()
+    strings.append(None)
+    starts = intervals[0::2]
+    lasts = intervals[1::2]
+    session_index = 0
+    interval_index = 0
+    for ordinal, day_session_count in zip(ordinals, session_counts):
+        sessions = []
+        for index in range(session_index, session_index + day_session_count):
+            end = interval_index + interval_counts[index]
+            sessions.append(Session(strings[projects[index]], [
+                ProjectSession(start, last) for start, last
+                in zip(starts[interval_index:end], lasts[interval_index:end])]))
+            interval_index = end
+        session_index += day_session_count
+        data.days.append(Day(ordinal, sessions))
+
+    data.last_active_project = strings[project_index]
+    data.user_id = strings[user_index]
+    data.last_event_time = last_event_time
+    data.generation = generation
+    data.extra = loads(extra) if extra else {}
+    return data
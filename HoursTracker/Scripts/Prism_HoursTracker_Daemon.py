@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Local tracker daemon shared by all the DCCs of a user.
+
+When several DCCs run at the same time, each one loading the plugin, they
+would all read and write the same hours.json. The daemon owns the user's
+data instead: the plugins send it one small json line per event over a
+localhost socket, and it is the only process writing to the data directory.
+
+Usage: python Prism_HoursTracker_Daemon.py [--dir DIR] [--cache-dir DIR]
+                                            [--port PORT]
+
+The daemon listens on a free localhost port, and writes the port and a
+random secret to daemon.json in the directory it writes, readable by the
+user only. The plugins of that directory read it, and open each connection
+with the secret, their login and their data directory, see HoursClient.
+Another user's plugins can't read the secret, and the plugins of another
+data directory are turned away.
+
+The plugins use the daemon when the daemon setting is 1, see
+Prism_HoursTracker_Variables, and track in process if it can't be reached.
+"""
+
+import argparse
+import collections
+from datetime import date
+import getpass
+import hmac
+import os
+import select
+import signal
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from Prism_HoursTracker_Codec import dumps, loads
+from Prism_HoursTracker_Totals import PERIODS
+from Prism_HoursTracker_Variables import (
+    Prism_HoursTracker_Variables, get_data_dirs, get_setting)
+
+
+# File of the daemon's port and secret, in the directory it writes
+ENDPOINT_FILE = 'daemon.json'
+
+
+def get_endpoint_path(user_data_dir):
+    return user_data_dir + ENDPOINT_FILE
+
+
+def read_endpoint(user_data_dir):
+    '''
+    Returns the {'port', 'secret', 'user', 'pid'} dict of the daemon of a
+    data directory. Raises IOError if no daemon wrote one.
+    '''
+    with open(get_endpoint_path(user_data_dir), 'rb') as endpoint_file:
+        return loads(endpoint_file.read())
+
+
+def write_endpoint(user_data_dir, endpoint):
+    '''
+    Writes the endpoint of the daemon of a data directory, readable and
+    writable by the user only.
+    '''
+    path = get_endpoint_path(user_data_dir)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    endpoint_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(endpoint_fd, 'wb') as endpoint_file:
+        endpoint_file.write(dumps(endpoint))
+    os.replace(temp_path, path)
+
+
+def is_same_dir(path, other_path):
+    return (os.path.normcase(os.path.abspath(path))
+            == os.path.normcase(os.path.abspath(other_path)))
+
+
+def get_event(message):
+    '''
+    Returns the (timestamp, project, callback, user) of an event message,
+    None if it isn't a valid event.
+    '''
+    timestamp = message.get('t')
+    project = message.get('p')
+    callback = message.get('c')
+    user = message.get('u')
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        return None
+    if project is not None and not isinstance(project, str):
+        return None
+    if not isinstance(callback, str):
+        return None
+    if user is not None and not isinstance(user, str):
+        return None
+    return int(timestamp), project, callback, user
+
+
+class HoursClient(object):
+    '''
+    Sends the plugin's events to the daemon of a data directory.
+    Has the same interface as HoursStore, raises socket.error when the
+    daemon can't be reached or turns the plugin away, so the plugin can fall
+    back to a HoursStore.
+    A request the daemon doesn't answer within request_timeout seconds
+    raises socket.timeout, the daemon may only be busy.
+    The daemon acknowledges each event with an empty line, read without
+    waiting before the next event is sent. The events it didn't acknowledge
+    when the connection breaks are returned by pop_unacked(), so the plugin
+    can record them in process.
+    '''
+    def __init__(self, user_data_dir, timeout=0.5, request_timeout=30.0):
+        self.user_data_dir = user_data_dir
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+        self._socket = None
+        self._buffer = b''
+        self._unacked = collections.deque()
+        self._connect()
+
+    def _connect(self):
+        endpoint = read_endpoint(self.user_data_dir)
+        self._socket = socket.create_connection(
+            ('127.0.0.1', endpoint['port']), self.timeout)
+        self._buffer = b''
+        # The events of a connection closed after a timeout reached the
+        # daemon, it was only busy
+        self._unacked.clear()
+        try:
+            # The daemon closes the connection if the handshake doesn't match
+            self._request({'cmd': 'hello', 'secret': endpoint['secret'],
+                           'user': getpass.getuser(), 'dir': self.user_data_dir})
+        except Exception:
+            self.close()
+            raise
+        self._socket.settimeout(self.request_timeout)
+
+    def _send(self, message):
+        if self._socket is None:
+            self._connect()
+        self._socket.sendall(dumps(message) + b'\n')
+
+    def _read_line(self, block=True):
+        '''
+        Returns the next line sent by the daemon, None if block is False and
+        no whole line arrived yet. Raises socket.error once the daemon closed
+        the connection.
+        '''
+        while b'\n' not in self._buffer:
+            if not block and not select.select([self._socket], [], [], 0)[0]:
+                return None
+            data = self._socket.recv(65536)
+            if not data:
+                raise socket.error('HoursTracker daemon closed the connection')
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def _read_acks(self):
+        '''
+        Reads the acknowledgements the daemon already sent, without waiting.
+        '''
+        while self._unacked and self._socket is not None:
+            if self._read_line(block=False) is None:
+                return
+            self._unacked.popleft()
+
+    def _request(self, message):
+        self._send(message)
+        try:
+            line = self._read_line()
+            while not line:
+                # Acknowledges an event sent before the request
+                if self._unacked:
+                    self._unacked.popleft()
+                line = self._read_line()
+        except socket.timeout:
+            # The late reply would be read by the next request, reconnects
+            self.close()
+            raise
+        reply = loads(line)
+        if 'error' in reply:
+            raise RuntimeError('HoursTracker daemon: ' + reply['error'])
+        return reply.get('result')
+
+    def record(self, timestamp, project, callback, user):
+        # Finds out the daemon died before sending it the event
+        self._read_acks()
+        self._send({'t': timestamp, 'p': project, 'c': callback, 'u': user})
+        self._unacked.append((timestamp, project, callback, user))
+
+    def pop_unacked(self):
+        '''
+        Returns the (timestamp, project, callback, user) of the events sent
+        that the daemon didn't acknowledge, and forgets them.
+        '''
+        events = list(self._unacked)
+        self._unacked.clear()
+        return events
+
+    def flush(self):
+        self._send({'cmd': 'flush'})
+
+    def generate_report(self):
+        self._request({'cmd': 'report'})
+
+    def get_event_stats(self):
+        return self._request({'cmd': 'stats'})
+
+    def get_metrics_snapshot(self):
+        return self._request({'cmd': 'metrics'})
+
+    def get_period_totals(self, period='day', day=None):
+        return self._request({'cmd': 'totals', 'period': period,
+                              'day': day.toordinal() if day else None})
+
+    def shutdown(self):
+        '''
+        Waits up to timeout seconds for the daemon to acknowledge the events
+        sent, and disconnects. Raises socket.error if the daemon closed the
+        connection first, see pop_unacked().
+        '''
+        if self._socket is None:
+            return
+        try:
+            self._socket.settimeout(self.timeout)
+            while self._unacked:
+                self._read_line()
+                self._unacked.popleft()
+        except socket.timeout:
+            # The daemon is only busy, it got the events
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        '''
+        Disconnects without waiting for the acknowledgements.
+        '''
+        if self._socket is None:
+            return
+        try:
+            self._socket.close()
+        except socket.error:
+            pass
+        self._socket = None
+        self._buffer = b''
+
+
+class HoursRequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Reads the json lines sent by a plugin and applies them to the store,
+    once the plugin passed the handshake, see HoursDaemon.check_hello().
+    Invalid lines are skipped.
+    '''
+    def handle(self):
+        store = self.server.store
+        hello = self.read_message()
+        if hello is None or not self.server.check_hello(hello):
+            store.log('HoursTracker daemon turned a connection away')
+            return
+        self.reply({})
+
+        while True:
+            message = self.read_message()
+            if message is None:
+                return
+            command = message.get('cmd')
+            try:
+                if command is None:
+                    event = get_event(message)
+                    try:
+                        if event is not None:
+                            store.record(*event)
+                    finally:
+                        # Invalid events are acknowledged too, the client
+                        # counts the acknowledgements
+                        self.wfile.write(b'\n')
+                elif command == 'flush':
+                    store.flush()
+                elif command == 'report':
+                    store.generate_report()
+                    self.reply({})
+                elif command == 'stats':
+                    self.reply(store.get_event_stats())
+                elif command == 'metrics':
+                    self.reply(store.get_metrics_snapshot())
+                elif command == 'totals':
+                    period = message.get('period')
+                    day = message.get('day')
+                    if period not in PERIODS or not (
+                            day is None or isinstance(day, int) and day > 0):
+                        self.reply_error('invalid totals request')
+                        continue
+                    self.reply(store.get_period_totals(
+                        period, date.fromordinal(day) if day else None))
+            except socket.error:
+                return
+            except Exception as error:
+                store.log('HoursTracker daemon failed to handle {}: {}'.format(
+                    command or 'an event', error))
+                if command in ('report', 'stats', 'metrics', 'totals'):
+                    self.reply_error(str(error))
+
+    def read_message(self):
+        '''
+        Returns the next json object sent by the plugin, None once the
+        connection is closed. Lines that aren't json objects are skipped.
+        '''
+        for line in self.rfile:
+            try:
+                message = loads(line)
+            except ValueError:
+                continue
+            if isinstance(message, dict):
+                return message
+        return None
+
+    def reply(self, result):
+        self.wfile.write(dumps({'result': result}) + b'\n')
+        self.wfile.flush()
+
+    def reply_error(self, error):
+        self.wfile.write(dumps({'error': error}) + b'\n')
+        self.wfile.flush()
+
+
+class HoursDaemon(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    '''
+    Serves a HoursStore to the plugins of all the running DCCs of the user.
+    Only listens on localhost, on port or on a free port if 0, and writes
+    its endpoint to the data directory, see read_endpoint().
+    '''
+    daemon_threads = True
+
+    def __init__(self, store, user_data_dir, port=0):
+        self.store = store
+        self.user_data_dir = user_data_dir
+        self.user = getpass.getuser()
+        self.secret = os.urandom(16).hex()
+        socketserver.TCPServer.__init__(
+            self, ('127.0.0.1', port), HoursRequestHandler)
+        write_endpoint(user_data_dir, {
+            'port': self.server_address[1], 'secret': self.secret,
+            'user': self.user, 'pid': os.getpid()})
+
+    def check_hello(self, hello):
+        '''
+        Whether the first message of a connection comes from a plugin of the
+        user writing the daemon's data directory.
+        '''
+        secret = hello.get('secret')
+        directory = hello.get('dir')
+        return (hello.get('cmd') == 'hello'
+                and isinstance(secret, str)
+                and hmac.compare_digest(secret, self.secret)
+                and hello.get('user') == self.user
+                and isinstance(directory, str)
+                and is_same_dir(directory, self.user_data_dir))
+
+    def stop(self):
+        '''
+        Stops serving, removes the endpoint and writes the data.
+        '''
+        self.shutdown()
+        self.server_close()
+        try:
+            if read_endpoint(self.user_data_dir).get('secret') == self.secret:
+                os.remove(get_endpoint_path(self.user_data_dir))
+        except (IOError, OSError, ValueError):
+            pass
+        self.store.shutdown()
+
+
+def main(argv=None):
+    # Only the daemon process needs the store, the plugins import this
+    # module for HoursClient
+    from Prism_HoursTracker_Log import get_log
+    from Prism_HoursTracker_Metrics import get_metrics
+    from Prism_HoursTracker_Store import create_store
+
+    variables = Prism_HoursTracker_Variables(None, None)
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument(
+        '--dir', default=get_setting(variables, 'data_dir'),
+        help='HoursTracker data directory of the user')
+    parser.add_argument(
+        '--cache-dir', default=get_setting(variables, 'cache_dir'),
+        help='local directory written to and replicated to --dir')
+    parser.add_argument(
+        '--port', type=int, default=0,
+        help='localhost port to listen on, a free one by default')
+    args = parser.parse_args(argv)
+
+    user_data_dir, replica_dir = get_data_dirs(args.dir, args.cache_dir)
+    try:
+        HoursClient(user_data_dir).shutdown()
+    except (socket.error, ValueError, KeyError):
+        pass
+    else:
+        parser.exit(1, 'A HoursTracker daemon already serves {}\n'.format(
+            user_data_dir))
+    if not os.path.exists(user_data_dir + 'backup'):
+        os.makedirs(user_data_dir + 'backup')
+    # Configures the log and the metrics of the store
+    log = get_log(user_data_dir + 'log.txt',
+                  get_setting(variables, 'log_max_bytes'),
+                  get_setting(variables, 'log_backup_count'),
+                  get_setting(variables, 'log_repeat_interval'),
+                  get_setting(variables, 'flush_interval'))
+    get_metrics(bool(get_setting(variables, 'metrics')),
+                get_setting(variables, 'metrics_dump_interval'),
+                lambda line: log.write(line, 'metrics'))
+    store = create_store(variables, user_data_dir, replica_dir)
+    daemon = HoursDaemon(store, user_data_dir, args.port)
+
+    def stop(*args):
+        # shutdown() waits for serve_forever() to return, call it from
+        # another thread
+        threading.Thread(target=daemon.stop).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    daemon.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Exports the tracked project sessions as a timesheet, CSV rows or iCalendar
+events, so they don't have to be copied from hours.html by hand.
+
+The exporter is a pipeline of generators: the files of each user directory
+are listed, read one at a time, their days filtered by date and project, and
+each project session written out as soon as it is read. Only the current
+file and the dates already exported for the current user are in memory,
+whatever the number of archives.
+
+Archives written by the store hold a single week, named after its monday,
+and the ones written by previous versions hold the days before their date,
+so the archives out of the date range are skipped without being read.
+
+A day found in hours.json and an archive is exported from hours.json, and a
+day found in several archives from the first one in date order.
+
+Usage: python Prism_HoursTracker_Export.py [--start DATE] [--end DATE]
+                                           [--project PROJECT]
+                                           [--format {csv,ics}]
+                                           [--output FILE] DIR [DIR ...]
+"""
+
+import argparse
+import csv
+from datetime import date, datetime
+import hashlib
+import os
+import sys
+import time
+
+from Prism_HoursTracker_Codec import load_data
+from Prism_HoursTracker_Model import format_duration, format_time, parse_date
+
+# Weekly archives written by the store, and the ones of previous versions
+WEEK_SUFFIX = '_hours.json.gz'
+LEGACY_SUFFIX = '_hours.json'
+CSV_HEADER = ('user', 'date', 'project', 'start', 'end', 'duration', 'hours')
+FORMATS = ('csv', 'ics')
+
+
+def get_user_dirs(directories):
+    '''
+    Yields the user directories of directories: the ones holding a
+    hours.json or a backup folder, or else their sub-directories that do.
+    '''
+    for directory in directories:
+        if is_user_dir(directory):
+            yield directory
+            continue
+        for entry in sorted(os.listdir(directory)):
+            user_dir = os.path.join(directory, entry)
+            if is_user_dir(user_dir):
+                yield user_dir
+
+
+def is_user_dir(directory):
+    return (os.path.isfile(os.path.join(directory, 'hours.json'))
+            or os.path.isdir(os.path.join(directory, 'backup')))
+
+
+def get_archive_range(filename):
+    '''
+    Returns the first and last day ordinals an archive can hold, None for no
+    bound, from its name.
+    '''
+    ordinal = parse_date(filename[:8].replace('_', '/'))
+    if filename.endswith(WEEK_SUFFIX):
+        return ordinal, ordinal + 6
+    # Previous versions archived hours.json before tracking the day
+    return None, ordinal - 1
+
+
+def get_archives(user_dir, start=None, end=None):
+    '''
+    Returns the paths of the archives of a user directory that may hold days
+    between the start and end ordinals, in date order.
+    '''
+    backup_dir = os.path.join(user_dir, 'backup')
+    if not os.path.isdir(backup_dir):
+        return []
+    archives = []
+    for filename in os.listdir(backup_dir):
+        if not filename.endswith((WEEK_SUFFIX, LEGACY_SUFFIX)):
+            continue
+        try:
+            first, last = get_archive_range(filename)
+        except ValueError:
+            # Not named by the tracker, read it whatever its dates
+            first, last = None, None
+        if start is not None and last is not None and last < start:
+            continue
+        if end is not None and first is not None and first > end:
+            continue
+        archives.append((last is None, last, filename))
+    archives.sort()
+    return [os.path.join(backup_dir, filename) for _, _, filename in archives]
+
+
+def read_file(path):
+    with open(path, 'rb') as hours_file:
+        return load_data(hours_file.read())
+
+
+def iter_days(user_dir, start=None, end=None):
+    '''
+    Yields a (user, Day) tuple for each tracked day of a user directory
+    between the start and end ordinals, included, archives first.
+    The user is the user_id of the files, or the name of the directory.
+    '''
+    default_user = os.path.basename(os.path.normpath(user_dir))
+    current = None
+    current_path = os.path.join(user_dir, 'hours.json')
+    if os.path.isfile(current_path):
+        current = read_file(current_path)
+    # Ordinals of the days already exported, hours.json has the last word
+    seen = set(day.ordinal for day in current.days) if current else set()
+
+    for path in get_archives(user_dir, start, end):
+        data = read_file(path)
+        user = data.user_id or default_user
+        for day in data.days:
+            if day.ordinal in seen:
+                continue
+            seen.add(day.ordinal)
+            if ((start is None or day.ordinal >= start)
+                    and (end is None or day.ordinal <= end)):
+                yield user, day
+
+    if current is not None:
+        user = current.user_id or default_user
+        for day in current.days:
+            if ((start is None or day.ordinal >= start)
+                    and (end is None or day.ordinal <= end)):
+                yield user, day
+
+
+def iter_project_sessions(directories, start=None, end=None, project=None,
+                          min_seconds=1):
+    '''
+    Yields a (user, day ordinal, project, start, last) tuple for each project
+    session of the user directories under directories, times in seconds since
+    midnight. start and end are date objects, None for no bound, project a
+    project name, None for all of them. Project sessions shorter than
+    min_seconds, a single event, are left out.
+    '''
+    start = start.toordinal() if start is not None else None
+    end = end.toordinal() if end is not None else None
+    for user_dir in get_user_dirs(directories):
+        for user, day in iter_days(user_dir, start, end):
+            for session in day.sessions:
+                if project is not None and session.project != project:
+                    continue
+                for project_session in session.project_sessions:
+                    if project_session.total >= min_seconds:
+                        yield (user, day.ordinal, session.project,
+                               project_session.start, project_session.last)
+
+
+def write_csv(rows, output):
+    '''
+    Writes the project session tuples of rows to output, a text file opened
+    with newline=''. Returns the number of rows.
+    '''
+    writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
+    count = 0
+    for user, ordinal, project, start, last in rows:
+        writer.writerow((user, date.fromordinal(ordinal).isoformat(), project,
+                         format_time(start), format_time(last),
+                         format_duration(last - start),
+                         '{:.2f}'.format((last - start) / 3600.0)))
+        count += 1
+    return count
+
+
+def escape_ics_text(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def fold_ics_line(line):
+    '''
+    Folds a content line in lines of 75 octets at most, RFC 5545 3.1.
+    '''
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Don't cut an utf-8 sequence
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def format_ics_time(ordinal, seconds):
+    '''
+    Returns the local, floating, date-time of seconds since midnight of a
+    date ordinal.
+    '''
+    day = date.fromordinal(ordinal)
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%04d%02d%02dT%02d%02d%02d' % (
+        day.year, day.month, day.day, hours, minutes, seconds)
+
+
+def write_ics(rows, output):
+    '''
+    Writes the project session tuples of rows to output, a text file opened
+    with newline='', as the events of an iCalendar file. Each event has a
+    stable UID, re-importing an export updates the events already imported.
+    Returns the number of events.
+    '''
+    stamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+    output.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'
+                 'PRODID:-//Prism//HoursTracker//EN\r\n')
+    count = 0
+    for user, ordinal, project, start, last in rows:
+        uid = hashlib.sha1('{}\n{}\n{}\n{}'.format(
+            user, ordinal, project, start).encode('utf-8')).hexdigest()
+        lines = (
+            'BEGIN:VEVENT',
+            'UID:{}@hourstracker'.format(uid),
+            'DTSTAMP:' + stamp,
+            'DTSTART:' + format_ics_time(ordinal, start),
+            'DTEND:' + format_ics_time(ordinal, last),
+            fold_ics_line('SUMMARY:' + escape_ics_text(project)),
+            fold_ics_line('DESCRIPTION:' + escape_ics_text(user)),
+            'END:VEVENT')
+        output.write('\r\n'.join(lines) + '\r\n')
+        count += 1
+    output.write('END:VCALENDAR\r\n')
+    return count
+
+
+WRITERS = {'csv': write_csv, 'ics': write_ics}
+
+
+def export(directories, output, output_format='csv', start=None, end=None,
+           project=None):
+    '''
+    Writes the project sessions of the user directories under directories
+    between the start and end dates to output, a text file opened with
+    newline='', in output_format ('csv' or 'ics'). Returns the number of project
+    sessions written.
+    '''
+    return WRITERS[output_format](
+        iter_project_sessions(directories, start, end, project), output)
+
+
+def parse_iso_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError('not a YYYY-MM-DD date: ' + value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('directories', nargs='+', metavar='DIR',
+                        help='user data directory, or a directory of them')
+    parser.add_argument('--start', type=parse_iso_date,
+                        help='first date exported, YYYY-MM-DD')
+    parser.add_argument('--end', type=parse_iso_date,
+                        help='last date exported, YYYY-MM-DD')
+    parser.add_argument('--project', help='only export this project')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help='file written, stdout by default')
+    args = parser.parse_args(argv)
+
+    begin = time.time()
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as output:
+            count = export(args.directories, output, args.format, args.start,
+                           args.end, args.project)
+        print('{} project sessions exported to {} in {:.2f} s'.format(
+            count, args.output, time.time() - begin))
+    else:
+        sys.stdout.reconfigure(newline='')
+        export(args.directories, sys.stdout, args.format, args.start,
+               args.end, args.project)
+
+
+if __name__ == '__main__':
+    main()
@@ -43,18 +43,71 @@ except:
     from PySide.QtGui import *
 
 from PrismUtils.Decorators import err_catcher_plugin as err_catcher
-from datetime import datetime, timedelta
-import json
+import atexit
 import os
 import shutil
+import socket
+import threading
+import time
 import traceback
 
+from Prism_HoursTracker_Metrics import get_metrics
+from Prism_HoursTracker_Variables import get_data_dirs, get_setting
+
 
 class Prism_HoursTracker_Functions(object):
     def __init__(self, core, plugin):
         self.core = core
         self.plugin = plugin
-        version = self.core.version.split('.', 3)[-1]
+
+# On disk data files, created on the first event, see initialise_data_dir()
+        # With a cache directory, the data is written locally and replicated
+        # to the data directory by the store
+        self.user_data_dir, self.user_replica_dir = get_data_dirs(
+            self.get_setting('data_dir'), self.get_setting('cache_dir'))
+        self.user_data_json = self.user_data_dir + 'hours.json'
+        self.user_data_js = self.user_data_dir + 'hours.js'
+        self.user_data_html = self.user_data_dir + 'hours.html'
+        self.user_data_css = self.user_data_dir + 'style.css'
+        self.user_data_backup = self.user_data_dir + '/backup/'
+        self.user_log = self.user_data_dir + 'log.txt'
+        self.user_history = None
+        if self.get_setting('history_file'):
+            self.user_history = self.user_data_dir + self.get_setting('history_file')
+
+        # Name of the current project, see get_current_project()
+        self._current_project = None
+
+        # Where events are sent, the tracker daemon or a HoursStore
+        # owned by this process. See get_backend()
+        self._backend = None
+        self._backend_lock = threading.Lock()
+
+        # Connection to the history database, see get_history()
+        self._history = None
+
+        # Activity sampler and its timer, see start_heartbeat(), and the
+        # time of the last event sent to the backend
+        self._heartbeat = None
+        self._heartbeat_timer = None
+        self._last_record_time = 0
+
+        # Timings of the callbacks, shared with the store of this process,
+        # see get_metrics_snapshot(). Each callback is timed by its name
+        self._metrics = get_metrics(
+            bool(self.get_setting('metrics')),
+            self.get_setting('metrics_dump_interval'),
+            lambda line: self.log(line, 'metrics'))
+        self._metrics.instrument(
+            self, '_update_data',
+            lambda callback, flush=False: callback or 'update_data')
+        self._metrics.instrument(self, 'get_current_project', 'plugin.project')
+        self._metrics.instrument(self, 'send_to_backend',
+                                 lambda method, *args: 'plugin.' + method)
+
+        # Farm jobs never track anything, don't even register the callbacks
+        if 'noUI' in self.core.prismArgs:
+            return
 
 # Register callback functions
         self.core.callbacks.registerCallback(
@@ -85,301 +138,342 @@ class Prism_HoursTracker_Functions(object):
             "onTaskCreated", self.onTaskCreated, plugin=self)
         self.core.callbacks.registerCallback(
             "postExport", self.postExport, plugin=self)
+        self.core.callbacks.registerCallback(
+            "onProjectChanged", self.onProjectChanged, plugin=self)
 
-# Check if exists/create on disk data files
-        self.user_data_dir = 'U:/mesDocuments/HoursTracker/'
-        self.user_data_json = self.user_data_dir + 'hours.json'
-        self.user_data_js = self.user_data_dir + 'hours.js'
-        self.user_data_html = self.user_data_dir + 'hours.html'
-        self.user_data_css = self.user_data_dir + 'style.css'
-        self.user_data_backup = self.user_data_dir + '/backup/'
-        self.user_log = self.user_data_dir + 'log.txt'
+        if self.get_setting('heartbeat'):
+            self.start_heartbeat()
+
+    # if returns true, the plugin will be loaded by Prism
+    @err_catcher(name=__name__)
+    def isActive(self):
+        return True
+
+# UTILITY FUNCTIONS
+    def get_setting(self, name):
+        '''
+        Returns the value of a plugin setting.
+        Defaults are set in Prism_HoursTracker_Variables, and can be overridden
+        with a HOURSTRACKER_<NAME> environment variable.
+        '''
+        return get_setting(self, name)
 
-        if not os.path.exists(self.user_data_dir):
+    def initialise_data_dir(self):
+        '''
+        Creates the data directory and its missing files.
+        Runs on the first event rather than while Prism loads the plugins,
+        and lists the directory once instead of probing each file.
+        '''
+        try:
+            files = set(os.listdir(self.user_data_dir))
+        except OSError:
             os.makedirs(self.user_data_dir)
+            files = set()
 
-        if not os.path.exists(self.user_data_backup):
+        if 'backup' not in files:
             os.makedirs(self.user_data_backup)
 
-        if not os.path.exists(self.user_data_json):
+        if 'hours.json' not in files:
             with open(self.user_data_json, 'a') as json_file:
                 json_file.write('{}')
 
-        if not os.path.exists(self.user_data_js):
+        if 'hours.js' not in files:
             open(self.user_data_js, 'a').close()
 
-        if not os.path.exists(self.user_log):
+        if 'log.txt' not in files:
             open(self.user_log, 'a').close()
 
-        if not os.path.exists(self.user_data_html):
-            src = 'R:/Prism/Plugins/{version}/HoursTracker/Scripts/templates/hours.html'.format(version=version)
-            dst = self.user_data_html
+        templates_dir = self.get_setting('templates_dir') or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+        # The page is replaced when the plugin ships a newer one, older
+        # pages don't know how to load the report shards
+        src = os.path.join(templates_dir, 'hours.html')
+        dst = self.user_data_html
+        if 'hours.html' not in files or os.path.getmtime(src) > os.path.getmtime(dst):
             shutil.copy(src, dst)
 
-        if not os.path.exists(self.user_data_css):
-            src = 'R:/Prism/Plugins/{version}/HoursTracker/Scripts/templates/style.css'.format(version=version)
+        if 'style.css' not in files:
+            src = os.path.join(templates_dir, 'style.css')
             dst = self.user_data_css
             shutil.copy(src, dst)
 
-    # if returns true, the plugin will be loaded by Prism
-    @err_catcher(name=__name__)
-    def isActive(self):
-        return True
-
-# UTILITY FUNCTIONS
-    def get_template_data(self, template):
-        """Returns the template data matching the template name that was
-        passed as arg.
-        possible args are : 'day', 'session', 'project_session'
-        """
-
-        template_dict = {
-                          'day': {
-                            'date': '',
-                            'sessions': [
-                              {
-                                'project': '',
-                                'project_sessions': [
-                                  {
-                                    'start_time': '',
-                                    'last_action_time': '',
-                                    'total_time': ''
-                                  }
-                                ]
-                              }
-                            ]
-                          },
-                          'session': {
-                            'project': '',
-                            'project_sessions': [
-                              {
-                                'start_time': '',
-                                'last_action_time': '',
-                                'total_time': ''
-                              }
-                            ]
-                          },
-                          'project_session': {
-                            'start_time': '',
-                            'last_action_time': '',
-                            'total_time': ''
-                          }
-                        }
-
-        return template_dict[template]
-
-    def reset_user_data(self):
-        """
-        Resets the json file containing the user's data
-        """
-        with open(self.user_data_json, 'a') as json_file:
-                json_file.write('{}')
+    def get_backend(self):
+        '''
+        Returns the object events are sent to, created on the first event.
+        A client of the tracker daemon if the daemon setting is set and the
+        daemon of the data directory can be reached, otherwise a HoursStore
+        owned by this process.
+        '''
+        with self._backend_lock:
+            if self._backend is None:
+                self.initialise_data_dir()
+                atexit.register(self.shutdown)
+                if self.get_setting('daemon'):
+                    # Imported when the daemon is used, it isn't needed to
+                    # load the plugin
+                    from Prism_HoursTracker_Daemon import HoursClient
+                    try:
+                        self._backend = HoursClient(
+                            self.user_data_dir,
+                            request_timeout=self.get_setting('daemon_timeout'))
+                    except (socket.error, IOError, ValueError, KeyError) as error:
+                        self.log('HoursTracker daemon of {} unreachable ({}), '
+                                 'tracking in process'.format(
+                                     self.user_data_dir, error))
+                if self._backend is None:
+                    self._backend = self.get_local_store()
+
+            return self._backend
+
+    def get_local_store(self):
+        '''
+        Returns a HoursStore writing the data directory from this process.
+        '''
+        # Imported on the first event, it isn't needed to load the plugin
+        from Prism_HoursTracker_Store import create_store
 
-    def get_date_delta(self, newest_date, oldest_date):
-        """
-            Returns a timedelta object of two giving dates.
-            Checks and converts if necessarey to datetime format before
-            calculating delta
+        # The store shares the plugin's log, configured by the settings
+        self.get_log()
+        return create_store(self, self.user_data_dir, self.user_replica_dir)
 
-            newest_date: str or datetime
-            oldest_date: str or datetime
-        """
+    def fall_back_to_local_store(self):
+        '''
+        Replaces the daemon client by a HoursStore for the rest of the
+        session, called when the daemon stops answering. The events the
+        daemon didn't acknowledge are recorded by the HoursStore.
+        '''
+        from Prism_HoursTracker_Daemon import HoursClient
+
+        with self._backend_lock:
+            if isinstance(self._backend, HoursClient):
+                events = self._backend.pop_unacked()
+                self._backend.close()
+                self.log('Lost the HoursTracker daemon, tracking in process')
+                self._backend = self.get_local_store()
+                for event in events:
+                    self._backend.record(*event)
+            return self._backend
+
+    def send_to_backend(self, method, *args):
+        '''
+        Calls method on the backend, falls back to the local store if the
+        daemon can't be reached. Raises socket.timeout if the daemon is slow
+        to answer, it still owns the data.
+        '''
+        backend = self.get_backend()
         try:
-            return newest_date - oldest_date
-        except TypeError:
-            try:
-                newest_date = self.get_date_as_datetime_obj(newest_date)
-            except TypeError:
-                pass
-            try:
-                oldest_date = self.get_date_as_datetime_obj(oldest_date)
-            except TypeError:
-                pass
-            return newest_date - oldest_date
+            return getattr(backend, method)(*args)
+        except socket.timeout:
+            raise
+        except socket.error:
+            from Prism_HoursTracker_Daemon import HoursClient
 
-    def is_new_week(self, data):
-        """
-        Checks if if today's date sets off a new work week, by retrieving the
-        last date present in the user's data, and deltaing it with today's date
+            if not isinstance(backend, HoursClient):
+                raise
+            return getattr(self.fall_back_to_local_store(), method)(*args)
 
-        Returns True if it has more than 3 days since last entry
-        """
-        last_day = data['days'][-1]['date']
-        last_day = self.get_date_as_datetime_obj(last_day)
-        today = datetime.now().strftime('%d/%m/%y')
-        delta = self.get_date_delta(today, last_day)
-        if delta.days >= 3:
-            return True
-        else:
-            False
-
-    def backup_data(self):
-        """
-        Copies the user's json data to a backup location
-        """
-        src = self.user_data_json
-        today = datetime.now().strftime('%d_%m_%y')
-        dst = self.user_data_backup + today + '_hours.json'
-        shutil.copy(src, dst)
-
-        src = self.user_log
-        today = datetime.now().strftime('%d_%m_%y')
-        dst = self.user_data_backup + today + '_log.txt'
-        shutil.copy(src, dst)
-
-        self.write_to_file('', self.user_log)
-
-    def initialise_data(self, data, date, start_time):
+    def generate_report(self):
         '''
-        Returns dict with user data. Initialises the data with a new day of hours tracked.
+        Compacts the data now, so hours.js and the html report are up to date.
         '''
-        data['days'] = []
-        day = self.initialise_day(date, start_time)
-        data['days'].append(day)
-        data['last_active_project'] = self.get_current_project()
+        self.send_to_backend('generate_report')
 
-        return data
-
-    def initialise_day(self, date, start_time):
+    def get_event_stats(self):
         '''
-        Returns a dict with the initial data of the current day.
-        Called when no previous data exists for the day.
+        Returns how many events each callback received, and how many of them
+        were absorbed by the coalescer. Helps tuning coalesce_window.
         '''
-        day = self.get_template_data('day')
-        day['date'] = date
-        day['sessions'][-1]['project'] = self.get_current_project()
-        day['sessions'][-1]['project_sessions'][-1]['start_time'] = start_time
-        day['sessions'][-1]['project_sessions'][-1]['last_action_time'] = start_time
-        day['sessions'][-1]['project_sessions'][-1]['total_time'] = str(
-            self.get_time_delta(start_time, start_time))
+        return self.send_to_backend('get_event_stats')
 
-        return day
+    def get_period_totals(self, period='day', day=None):
+        '''
+        Returns a dict of the seconds spent on each project during the day,
+        ISO week or month ('day', 'week' or 'month') holding day, a date
+        object, today by default.
+        Unlike get_project_totals(), doesn't need the history database and
+        includes the events not written yet.
+        '''
+        return self.send_to_backend('get_period_totals', period, day)
 
-    def initialise_session(self, start_time):
+    def get_metrics_snapshot(self):
         '''
-        Returns a dict of session data.
-        Sessions are group all work done on a project
+        Returns the timings of the callbacks and of the store's phases since
+        the process started, see Prism_HoursTracker_Metrics. The timings of
+        the tracker daemon, when it is used, are under the 'daemon' key.
+        Empty unless the metrics setting is 1.
         '''
-        session = self.get_template_data('session')
-        session['project'] = self.get_current_project()
-        session['project_sessions'][-1]['start_time'] = start_time
-        session['project_sessions'][-1]['last_action_time'] = start_time
-        session['project_sessions'][-1]['total_time'] = str(
-            self.get_time_delta(start_time, start_time))
+        snapshot = self._metrics.snapshot()
+        backend = self._backend
+        if backend is None or not self.get_setting('daemon'):
+            return snapshot
 
-        return session
+        from Prism_HoursTracker_Daemon import HoursClient
 
-    def initialise_project_session(self, start_time):
+        if isinstance(backend, HoursClient):
+            try:
+                snapshot['daemon'] = backend.get_metrics_snapshot()
+            except socket.error:
+                pass
+        return snapshot
+
+    def get_history(self):
         '''
-        Returns data for a project session.
-        A project session is work session on a project.
+        Returns the history database of the user, opened on first use.
+        None if the history_file setting is empty.
         '''
-        project_session = self.get_template_data('project_session')
-        project_session['start_time'] = start_time
-        project_session['last_action_time'] = start_time
-        project_session['total_time'] = str(
-            self.get_time_delta(start_time, start_time))
-        return project_session
+        if self._history is None and self.user_history:
+            from Prism_HoursTracker_History import HoursHistory
+            self._history = HoursHistory(
+                self.user_history, self.get_setting('lock_timeout'))
+        return self._history
 
-    def get_total_session_time(self, data):
+    def get_project_totals(self, start=None, end=None, project=None):
         '''
-        Returns a dict of user data, with the total time of each session added.
+        Returns a dict of the seconds spent on each project between the start
+        and end dates, included, over all the tracked weeks.
+        Dates are date objects, None for no bound. The events of the last
+        flush_interval seconds may not be in the history yet. Empty when the
+        history_file setting is empty.
         '''
-        for session in data['days'][-1]['sessions']:
-            total_time = timedelta(seconds=0)
-            for project_session in session['project_sessions']:
-                if 'total_time' in project_session:
-                    time = self.get_time_as_datetime(project_session['total_time'])
-                    delta = timedelta(hours=time.hour, minutes=time.minute, seconds=time.second)
-                    total_time += delta
-                    session['total_time'] = str(total_time)
+        history = self.get_history()
+        if history is None:
+            return {}
+        return history.get_project_totals(start, end, project)
 
-        return data
+    def get_day_totals(self, start=None, end=None, project=None):
+        '''
+        Returns a list of (date, project, seconds) tuples, the time spent on
+        each project each day between the start and end dates, by date.
+        '''
+        history = self.get_history()
+        if history is None:
+            return []
+        return history.get_day_totals(start, end, project)
 
-    def file_exists(self, filepath):
+    def get_intervals(self, start=None, end=None, project=None):
+        '''
+        Returns an IntervalTable of the project sessions between the start
+        and end dates, to compute report statistics in batch, see
+        Prism_HoursTracker_Report.
+        '''
+        from Prism_HoursTracker_Report import IntervalTable
+        history = self.get_history()
+        if history is None:
+            return IntervalTable.from_rows([])
+        return IntervalTable.from_history(history, start, end, project)
+
+    def export_timesheet(self, path, output_format='csv', start=None, end=None,
+                         project=None):
+        '''
+        Writes the user's project sessions between the start and end dates,
+        date objects, to path as a timesheet, 'csv' or 'ics'. Returns the
+        number of project sessions written.
+        '''
+        from Prism_HoursTracker_Export import export
+        # Writes the pending events to hours.json first
+        self.generate_report()
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            return export([self.user_data_dir], output, output_format, start,
+                          end, project)
+
+    def start_heartbeat(self):
+        '''
+        Samples the user's activity every heartbeat_interval seconds, and
+        records a heartbeat event when the user was active, see
+        Prism_HoursTracker_Heartbeat. Needs a QApplication.
+        '''
+        if QCoreApplication.instance() is None:
+            self.log('HoursTracker heartbeat needs a QApplication, not started')
+            return
+        from Prism_HoursTracker_Heartbeat import create_sampler
+        app_name = getattr(getattr(self.core, 'appPlugin', None), 'pluginName', None)
+        self._heartbeat = create_sampler(
+            app_name, self.get_setting('heartbeat_interval'),
+            self.get_setting('heartbeat_budget_ms'), self.log)
+        self._heartbeat_timer = QTimer()
+        self._heartbeat_timer.setInterval(int(self._heartbeat.interval * 1000))
+        self._heartbeat_timer.timeout.connect(self.on_heartbeat)
+        self._heartbeat_timer.start()
+
+    def on_heartbeat(self):
+        '''
+        Called by the heartbeat timer, records an event if the user was
+        active since the last sample.
         '''
-        Checks if file exists on disk
-        Return True or False
+        now = time.time()
+        # A callback recorded the activity of this interval already
+        if now - self._last_record_time < self._heartbeat.interval:
+            return
+        if self._heartbeat.sample(now):
+            self.update_data('heartbeat')
+
+    def get_heartbeat_stats(self):
         '''
-        return os.path.exists(filepath)
+        Returns the number of samples of the heartbeat, how many of them
+        found the user active, the longest sample in ms and the probes
+        turned off for going over budget. None if the heartbeat isn't on.
+        '''
+        if self._heartbeat is None:
+            return None
+        return dict(self._heartbeat.stats)
 
-    def is_file_empty(self, filepath):
+    def shutdown(self):
         '''
-        Check if file is empty
-        Returns True or False
+        Writes the data, or disconnects from the daemon. Runs at exit.
         '''
-        return os.stat(filepath).st_size == 0
+        if self._backend is not None:
+            # Writes the events the daemon didn't acknowledge in process
+            self.send_to_backend('shutdown')
+        if self._history is not None:
+            self._history.close()
+            self._history = None
 
     def get_current_project(self):
         '''
         Returns the project's name
+        The name is cached until a scene is opened or the project changes,
+        see invalidate_current_project()
         '''
+        if self._current_project is not None:
+            return self._current_project
+
         try:
             project_name = self.core.projectName
         except:
             project_path = self.core.getConfig("globals", "current project")
             project_name = os.path.basename(os.path.dirname(os.path.dirname(project_path)))
 
+        self._current_project = project_name
         return project_name
 
-    def write_to_file(self, content, filename):
-        '''
-        Writes given content to the given filename.
-        '''
-        output_file = open(filename, 'w')
-        output_file.write(content)
-        output_file.close()
-
-    def get_date_as_string(self, datetime_obj):
+    def invalidate_current_project(self):
         '''
-        Converts datetime object to string format %d/%m/%y.
-        Returns: string
+        Drops the cached project name, the next call to get_current_project()
+        resolves it again.
         '''
-        date_string = datetime_obj.strftime('%d/%m/%y')
-        return date_string
+        self._current_project = None
 
-    def get_date_as_datetime_obj(self, date_string):
+    def get_log(self):
         '''
-        Converts a string object representing a date, like this %d/%m/%y, to a datetime object
-        returns: datetime
+        Returns the HoursLog of log.txt, shared with the store of this
+        process, see Prism_HoursTracker_Log.
         '''
-        datetime_obj = datetime.strptime(date_string, '%d/%m/%y')
-        return datetime_obj
+        # Imported on first use, it isn't needed to load the plugin
+        from Prism_HoursTracker_Log import get_log
 
-    def get_time_as_string(self, datetime_obj):
-        '''
-        Converts a datetime.time object as string, in this format %H:%M:%S
-        returns: string
-        '''
-        return datetime_obj.strftime('%H:%M:%S')
+        return get_log(
+            self.user_log,
+            self.get_setting('log_max_bytes'),
+            self.get_setting('log_backup_count'),
+            self.get_setting('log_repeat_interval'),
+            self.get_setting('flush_interval'))
 
-    def get_time_as_datetime(self, time):
+    def log(self, message, level=None):
         '''
-        Converts string reprensenting time like this %H:%M:%S to a datetime.time object
-        returns: datetime.time
+        Queues message for log.txt, written in the background.
         '''
-        return datetime.strptime(time, '%H:%M:%S')
-
-    def get_time_delta(self, newest_time, oldest_time):
-        try:
-            return newest_time - oldest_time
-        except TypeError:
-            try:
-                newest_time = self.get_time_as_datetime(newest_time)
-            except TypeError:
-                pass
-            try:
-                oldest_time = self.get_time_as_datetime(oldest_time)
-            except TypeError:
-                pass
-            return newest_time - oldest_time
-
-    def log(self, error_message):
-        date = datetime.now().strftime('%d/%m/%y')
-        time = datetime.now().strftime('%H:%M:%S')
-        log_message = '\n' + date + ", " + time + " : " + error_message
-        with open(self.user_log, 'a') as logfile:
-            logfile.write(log_message)
+        self.get_log().write(message, level)
 
     def get_username(self):
         try:
@@ -387,118 +481,32 @@ class Prism_HoursTracker_Functions(object):
         except:
             return self.core.username
 
-    def is_project_in_sessions(self, data, project):
-        found = False
-        for session in data['days'][-1]['sessions']:
-            if session['project'] == project:
-                found = True
-                break
-            else:
-                pass
-
-        return found
-
-    def is_last_active_project(self, data, project):
-        if project == data['last_active_project']:
-            return True
-        else:
-            return False
-
-    def get_last_project_session(self, data):
-        today = data['days'][-1]
-        for session in today['sessions']:
-            if session['project'] == self.get_current_project():
-                today_session = session
-        project_session = today_session['project_sessions'][-1]
-
-        return project_session
-
-    def get_current_session(self, data):
-        today = data['days'][-1]
-        for session in today['sessions']:
-            if session['project'] == self.get_current_project():
-                return session
 # LOGIC
-    def update_data(self):
+    def update_data(self, callback=None, flush=False):
         """
         Function that runs everytime a callback is called in Prism. The logic happens here.
-        Retrieves user date from file
-        Creates data relevant to the scene opening action: user, date, time
-        Runs a series of checks on existing data to determine where to write the action's data
-        Writes the action's data
+        Creates data relevant to the action: user, project, time
+        Applies the action to the user's data, see apply_event()
+        Records the action in the journal, and writes it to disk right away
+        with flush
         """
         if 'noUI' not in self.core.prismArgs:
-            try:
-                # Get scene open action relevant data
-                user = self.get_username()
-                date = datetime.now().strftime('%d/%m/%y')
-                start_time = datetime.now().strftime('%H:%M:%S')
-
-                # Get data from file
-                try:
-                    # Open user json data and laod it to data
-                    with open(self.user_data_json, 'r') as json_file:
-                        raw_data = json_file.read()
-                        data = json.loads(raw_data)
-                except:
-                    # If json file empty return empty dict/json object
-                    data = {}
-
-                # If data is empty initialise it
-                if data == {}:
-                    data = self.initialise_data(data, date, start_time)
-
-                # Check if it's a new week, archive and reset data if it is
-                elif self.is_new_week(data) is True:
-                    self.backup_data()
-                    data = {}
-                    self.reset_user_data()
-                    data = self.initialise_data(data, date, start_time)
-
-                # Check if current day exists and create data if necessary
-                elif date != data['days'][-1]['date']:
-                    new_day = self.initialise_day(date, start_time)
-                    data['days'].append(new_day)
-                    data['last_active_project'] = self.get_current_project()
-
-                # Does the current project have a session if not initialise it
-                elif self.is_project_in_sessions(data, self.get_current_project()) == False:
-                    session = self.initialise_session(start_time)
-                    data['days'][-1]['sessions'].append(session)
-                    data['last_active_project'] = self.get_current_project()
-
-                #  Is the current project the last active project, if not start new project session
-                elif self.is_last_active_project(data, self.get_current_project()) == False:
-                    project_session  = self.initialise_project_session(start_time)
-                    for session in data['days'][-1]['sessions']:
-                        if session['project'] == self.get_current_project():
-                            session['project_sessions'].append(project_session)
-
-                    data['last_active_project'] = self.get_current_project()
-                # If current project is last active project, update action time
-                else:
-                    for index, session in enumerate(data['days'][-1]['sessions']):
-                        if session['project'] == self.get_current_project():
-                            data['days'][-1]['sessions'][index]['project_sessions'][-1]['last_action_time'] = start_time
-                            start = data['days'][-1]['sessions'][index]['project_sessions'][-1]['start_time']
-                            last = data['days'][-1]['sessions'][index]['project_sessions'][-1]['last_action_time']
-                            data['days'][-1]['sessions'][index]['project_sessions'][-1]['total_time'] = str(
-                                self.get_time_delta(last, start))
-
-
-                # Set total time for all sessions
-                data = self.get_total_session_time(data)
-
-                # Set user id data
-                data['user_id'] = user
-
-                # Write data to file
-                json_obj = json.dumps(data)
-                content = "var data = '{}'".format(json_obj)
-                self.write_to_file(json_obj, self.user_data_json)
-                self.write_to_file(content, self.user_data_js)
-            except Exception as e:
-                self.log(traceback.format_exc())
+            self._update_data(callback, flush)
+
+    def _update_data(self, callback, flush=False):
+        try:
+            # Get action relevant data
+            user = self.get_username()
+            project = self.get_current_project()
+            timestamp = int(time.time())
+
+            self.send_to_backend('record', timestamp, project, callback, user)
+            self._last_record_time = timestamp
+            if flush:
+                self.send_to_backend('flush')
+        except Exception as e:
+            self._metrics.count('plugin.errors')
+            self.log(traceback.format_exc())
 
 # CALLBACKS
     '''
@@ -508,43 +516,49 @@ class Prism_HoursTracker_Functions(object):
     3. Check in the Prism source code if the callback accepts *args and/or **kwargs (to avoid Prism Errors that can't be caught)
     '''
     def onSceneOpen(self, *args):
-        self.update_data()
+        # The scene may belong to another project
+        self.invalidate_current_project()
+        self.update_data('onSceneOpen', flush=True)
 
     def sceneSaved(self, *args):
-        self.update_data()
+        self.update_data('sceneSaved')
 
     def onStateManagerShow(self, *args):
-        self.update_data()
+        self.update_data('onStateManagerShow')
 
     def onStateManagerClose(self, *args):
-        self.update_data()
+        self.update_data('onStateManagerClose')
 
     def onStateDeleted(self, *args):
-        self.update_data()
+        self.update_data('onStateDeleted')
 
     def onStateCreated(self, *args, **kwargs):
-        self.update_data()
+        self.update_data('onStateCreated')
 
     def onPublish(self, *args):
-        self.update_data()
+        self.update_data('onPublish')
 
     def postPublish(self, *args, **kargs):
-        self.update_data()
+        self.update_data('postPublish')
 
     def onProductCreated(self, *args):
-        self.update_data()
+        self.update_data('onProductCreated')
 
     def onAssetCreated(self, *args):
-        self.update_data()
+        self.update_data('onAssetCreated')
 
     def onShotCreated(self, *args):
-        self.update_data()
+        self.update_data('onShotCreated')
 
     def onDepartmentCreated(self, *args):
-        self.update_data()
+        self.update_data('onDepartmentCreated')
 
     def onTaskCreated(self, *args):
-        self.update_data()
+        self.update_data('onTaskCreated')
 
     def postExport(self, **kwargs):
-        self.update_data()
+        self.update_data('postExport')
+
+    def onProjectChanged(self, *args):
+        # Not an activity, only drops the cached project name
+        self.invalidate_current_project()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Activity heartbeat, tracks the work done between two callbacks.
+
+The callbacks only fire on saves, publishes and State Manager actions: an
+artist animating for two hours without saving records nothing until the
+next callback, and a save storm records a lot. With the heartbeat setting,
+the plugin samples cheap activity signals on a low frequency QTimer, and
+records a 'heartbeat' event, like a callback, when the user was active
+since the last sample:
+- the input idle time, from the system on Windows, from the moves of the
+  cursor elsewhere,
+- the scene modified flag of the DCC, when it turns on.
+Samples taken while the DCC isn't the active application don't count.
+
+Overhead is bounded: each probe is timed, and a probe taking more than
+budget_ms twice in a row is turned off for the session. There is at most
+one heartbeat event per interval, none when a callback recorded an event
+during the interval, and the writes to disk stay paced by flush_interval.
+
+Combined with the idle_gap setting, the idle time between two events on the
+same project starts a new project session instead of being counted, see
+HoursStore.apply_event().
+"""
+
+import sys
+import time
+
+try:
+    from PySide2.QtGui import QCursor
+    from PySide2.QtWidgets import QApplication
+except ImportError:
+    try:
+        from PySide.QtGui import QApplication, QCursor
+    except ImportError:
+        QApplication = QCursor = None
+
+
+# Seconds, shorter intervals are raised to it
+MIN_INTERVAL = 5.0
+# Samples in a row over budget after which a probe is turned off
+MAX_SLOW_SAMPLES = 2
+
+
+def get_system_idle_probe():
+    '''
+    Returns a function returning the seconds since the last keyboard or
+    mouse input of the session, None where the system doesn't tell.
+    '''
+    if sys.platform != 'win32':
+        return None
+    import ctypes
+
+    class LASTINPUTINFO(ctypes.Structure):
+        _fields_ = [('cbSize', ctypes.c_uint), ('dwTime', ctypes.c_uint)]
+
+    info = LASTINPUTINFO()
+    info.cbSize = ctypes.sizeof(info)
+    user32 = ctypes.windll.user32
+    kernel32 = ctypes.windll.kernel32
+
+    def get_idle_seconds(now):
+        if not user32.GetLastInputInfo(ctypes.byref(info)):
+            return None
+        # Both tick counts wrap after 49 days
+        return ((kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000.0
+
+    return get_idle_seconds
+
+
+class CursorIdleProbe(object):
+    '''
+    Returns the seconds since the cursor last moved, as seen by the
+    samples. Key presses without cursor moves aren't seen.
+    '''
+    def __init__(self):
+        self._position = None
+        self._moved = None
+
+    def __call__(self, now):
+        position = QCursor.pos()
+        position = (position.x(), position.y())
+        if position != self._position:
+            first = self._position is None
+            self._position = position
+            self._moved = now
+            if first:
+                return None
+        return now - self._moved
+
+
+def is_application_active():
+    return QApplication.activeWindow() is not None
+
+
+def is_maya_modified():
+    from maya import cmds
+    return cmds.file(query=True, modified=True)
+
+
+def is_houdini_modified():
+    import hou
+    return hou.hipFile.hasUnsavedChanges()
+
+
+def is_blender_modified():
+    import bpy
+    return bpy.data.is_dirty
+
+
+def is_nuke_modified():
+    import nuke
+    return nuke.root().modified()
+
+
+def is_max_modified():
+    from pymxs import runtime
+    return runtime.getSaveRequired()
+
+
+# Scene modified flag of each DCC, by Prism app plugin name
+SCENE_MODIFIED_PROBES = {
+    'Maya': is_maya_modified,
+    'Houdini': is_houdini_modified,
+    'Blender': is_blender_modified,
+    'Nuke': is_nuke_modified,
+    '3dsMax': is_max_modified,
+}
+
+
+class ActivitySampler(object):
+    '''
+    Tells whether the user was active during the last interval seconds.
+    idle_probe(now) returns the input idle time in seconds,
+    modified_probe() the scene modified flag and focus_probe() whether the
+    DCC is the active application. Each of them is optional, and returns
+    None when it doesn't know.
+    '''
+    def __init__(self, interval=60.0, budget_ms=1.0, idle_probe=None,
+                 modified_probe=None, focus_probe=None, log_func=None):
+        self.interval = max(interval, MIN_INTERVAL)
+        self.budget = budget_ms / 1000.0
+        self.log_func = log_func
+        self.probes = {'idle': idle_probe, 'modified': modified_probe,
+                       'focus': focus_probe}
+        self._slow_samples = dict.fromkeys(self.probes, 0)
+        self._modified = None
+        self.stats = {'samples': 0, 'active': 0, 'max_ms': 0.0, 'disabled': []}
+
+    def disable(self, name, reason):
+        self.probes[name] = None
+        self.stats['disabled'].append(name)
+        if self.log_func:
+            self.log_func('HoursTracker heartbeat: {} probe turned off, {}'.format(
+                name, reason))
+
+    def run_probe(self, name, *args):
+        '''
+        Returns the value of a probe, None if it is off. Turns it off if it
+        fails, or if it goes over budget MAX_SLOW_SAMPLES times in a row.
+        '''
+        probe = self.probes[name]
+        if probe is None:
+            return None
+        start = time.perf_counter()
+        try:
+            value = probe(*args)
+        except Exception as error:
+            self.disable(name, 'it failed: {!r}'.format(error))
+            return None
+        cost = time.perf_counter() - start
+        if cost > self.budget:
+            self._slow_samples[name] += 1
+            if self._slow_samples[name] >= MAX_SLOW_SAMPLES:
+                self.disable(name, 'it took {:.2f} ms'.format(cost * 1e3))
+        else:
+            self._slow_samples[name] = 0
+        return value
+
+    def sample(self, now):
+        '''
+        Returns True if the user was active since the last sample, now
+        being the current timestamp.
+        '''
+        start = time.perf_counter()
+        active = False
+        if self.run_probe('focus') is not False:
+            idle = self.run_probe('idle', now)
+            modified = self.run_probe('modified')
+            turned_modified = bool(modified) and self._modified is False
+            if modified is not None:
+                self._modified = bool(modified)
+            active = turned_modified or (idle is not None and idle < self.interval)
+
+        self.stats['samples'] += 1
+        self.stats['active'] += active
+        self.stats['max_ms'] = max(self.stats['max_ms'],
+                                   (time.perf_counter() - start) * 1e3)
+        return active
+
+
+def create_sampler(app_name, interval=60.0, budget_ms=1.0, log_func=None):
+    '''
+    Returns an ActivitySampler with the probes available in this process,
+    app_name being the name of Prism's app plugin, e.g. 'Maya'.
+    '''
+    idle_probe = get_system_idle_probe()
+    if idle_probe is None and QCursor is not None:
+        idle_probe = CursorIdleProbe()
+    return ActivitySampler(
+        interval, budget_ms, idle_probe, SCENE_MODIFIED_PROBES.get(app_name),
+        is_application_active if QApplication is not None else None, log_func)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import date
+import os
+import sqlite3
+import sys
+import threading
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    user TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    project TEXT NOT NULL,
+    callback TEXT
+);
+CREATE INDEX IF NOT EXISTS events_project_time ON events (project, time);
+
+CREATE TABLE IF NOT EXISTS project_sessions (
+    user TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    project TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    last INTEGER NOT NULL,
+    PRIMARY KEY (user, day, project, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS days (
+    project TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    user TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (project, day, user)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS days_day ON days (day);
+
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+'''
+
+# Project of the sessions and events without one, None in HoursData. The
+# project columns are part of the primary keys, they can't be NULL. The
+# queries return None for it
+NO_PROJECT = ''
+
+
+def get_day_rows(day):
+    '''
+    Returns the ordinal of a Day, and its sessions as rows of the days and
+    project_sessions tables, without the user column.
+    Plain tuples, so they can be written after releasing the store's lock.
+    '''
+    day_rows = []
+    project_session_rows = []
+    for session in day.sessions:
+        project = NO_PROJECT if session.project is None else session.project
+        day_rows.append((project, day.ordinal, session.total))
+        # seq numbers the project sessions of a project within the day
+        project_session_rows.extend(
+            (day.ordinal, project, seq, project_session.start,
+             project_session.last)
+            for seq, project_session in enumerate(session.project_sessions))
+    return day.ordinal, day_rows, project_session_rows
+
+
+def to_ordinal(day):
+    '''
+    Returns the ordinal of a date, datetime or ordinal, None stays None.
+    '''
+    if day is None or isinstance(day, int):
+        return day
+    return day.toordinal()
+
+
+def is_remote_path(filepath):
+    '''
+    Whether filepath is on a network share, a UNC path or, on Windows, a
+    mapped network drive.
+    '''
+    filepath = os.path.abspath(filepath)
+    if filepath.startswith(('\\\\', '//')):
+        return True
+    if sys.platform != 'win32':
+        return False
+    import ctypes
+    drive = os.path.splitdrive(filepath)[0]
+    DRIVE_REMOTE = 4
+    return bool(drive) and \
+        ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == DRIVE_REMOTE
+
+
+class HoursHistory(object):
+    '''
+    SQLite database of the tracked hours, kept over the weekly resets of
+    hours.json so totals can be queried over any date range.
+
+    Holds the raw events, the project sessions, and a rollup of the seconds
+    per project and day indexed on (project, day). The store writes the
+    events it records and rewrites the days they touched, see
+    HoursStore.write_history(). Days are stored as date ordinals.
+    '''
+    def __init__(self, filepath, timeout=2.0):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            filepath, timeout=timeout, check_same_thread=False)
+        with self._lock, self._connection:
+            # Readers don't block the writers of other processes. WAL needs
+            # shared memory between the processes, it can't be used on a
+            # network share
+            if not is_remote_path(filepath):
+                self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(SCHEMA)
+
+    def write(self, user, events=(), days=()):
+        '''
+        Inserts events, a list of (timestamp, project, callback), and
+        replaces the sessions of days, a list of get_day_rows() tuples, in a
+        single transaction.
+        '''
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT INTO events VALUES (?, ?, ?, ?)',
+                [(user, timestamp,
+                  NO_PROJECT if project is None else project, callback)
+                 for timestamp, project, callback in events])
+            self._write_days(user, days)
+
+    def add_archives(self, archives):
+        '''
+        Writes the days of backup archives, a list of (path, mtime, size,
+        user, days) tuples with days a list of get_day_rows() tuples, and
+        records the archives as imported, in a single transaction.
+        '''
+        with self._lock, self._connection:
+            for path, mtime, size, user, days in archives:
+                self._write_days(user, days)
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO imports VALUES (?, ?, ?)',
+                [archive[:3] for archive in archives])
+
+    def get_imported(self):
+        '''
+        Returns a dict of the (mtime, size) of each imported archive by path.
+        '''
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT path, mtime, size FROM imports').fetchall()
+        return dict((path, (mtime, size)) for path, mtime, size in rows)
+
+    def add_data(self, data, user=None):
+        '''
+        Writes all the days of a HoursData, replacing the ones already known.
+        '''
+        self.write(user or data.user_id or '',
+                   days=[get_day_rows(day) for day in data.days])
+
+    def get_project_totals(self, start=None, end=None, project=None, user=None):
+        '''
+        Returns a dict of the seconds spent on each project between the start
+        and end dates, included. Dates are date objects or ordinals, None
+        for no bound.
+        '''
+        query, parameters = self._get_filter(start, end, project, user)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT NULLIF(project, ''), SUM(seconds) FROM days" + query
+                + ' GROUP BY project', parameters).fetchall()
+        return dict(rows)
+
+    def get_day_totals(self, start=None, end=None, project=None, user=None):
+        '''
+        Returns a list of (date, project, seconds) tuples, the time spent on
+        each project each day between the start and end dates, by date.
+        '''
+        query, parameters = self._get_filter(start, end, project, user)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT day, NULLIF(project, ''), SUM(seconds) FROM days"
+                + query + ' GROUP BY day, project ORDER BY day, project',
+                parameters).fetchall()
+        return [(date.fromordinal(day), project, seconds)
+                for day, project, seconds in rows]
+
+    def get_project_sessions(self, start=None, end=None, project=None,
+                             user=None):
+        '''
+        Returns a list of (user, day ordinal, project, start, last) tuples,
+        the project sessions between the start and end dates.
+        '''
+        query, parameters = self._get_filter(start, end, project, user)
+        with self._lock:
+            return self._connection.execute(
+                "SELECT user, day, NULLIF(project, ''), start, last"
+                " FROM project_sessions" + query, parameters).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _write_days(self, user, days):
+        for ordinal, day_rows, project_session_rows in days:
+            self._connection.execute(
+                'DELETE FROM days WHERE day = ? AND user = ?', (ordinal, user))
+            self._connection.execute(
+                'DELETE FROM project_sessions WHERE user = ? AND day = ?',
+                (user, ordinal))
+            self._connection.executemany(
+                'INSERT INTO days VALUES (?, ?, ?, ?)',
+                [(project, day, user, seconds)
+                 for project, day, seconds in day_rows])
+            self._connection.executemany(
+                'INSERT INTO project_sessions VALUES (?, ?, ?, ?, ?, ?)',
+                [(user,) + row for row in project_session_rows])
+
+    def _get_filter(self, start, end, project, user):
+        conditions = []
+        parameters = []
+        for condition, value in (('project = ?', project),
+                                 ('day >= ?', to_ordinal(start)),
+                                 ('day <= ?', to_ordinal(end)),
+                                 ('user = ?', user)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        if not conditions:
+            return '', parameters
+        return ' WHERE ' + ' AND '.join(conditions), parameters
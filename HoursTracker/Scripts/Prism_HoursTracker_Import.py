@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Imports the weekly archives of backup/ into the history database.
+
+The store only writes the weeks tracked since the history was enabled, the
+previous ones are archived as backup/<dd_mm_yy>_hours.json(.gz) files. The
+importer finds the archives under the given directories, parses them in a
+pool of processes, and writes them to the database in large transactions.
+
+The database records each imported archive with its mtime and size, so
+running the importer again only imports the new or modified archives, and
+an interrupted import resumes where it stopped.
+
+Usage: python Prism_HoursTracker_Import.py [--db DB] [--workers N]
+                                           [--user USER] [DIR ...]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from Prism_HoursTracker_Codec import load_data
+from Prism_HoursTracker_History import HoursHistory, get_day_rows
+from Prism_HoursTracker_Variables import (
+    Prism_HoursTracker_Variables, get_data_dirs, get_setting)
+
+# Archives written by previous versions, and the weekly archives
+ARCHIVE_SUFFIXES = ('_hours.json', '_hours.json.gz')
+# Archives written to the database per transaction
+BATCH_SIZE = 500
+
+
+def find_archives(directories):
+    '''
+    Returns the paths of the archives under directories, recursively.
+    '''
+    paths = []
+    for directory in directories:
+        for root, dirnames, filenames in os.walk(directory):
+            paths.extend(os.path.join(root, filename) for filename in filenames
+                         if filename.endswith(ARCHIVE_SUFFIXES))
+    paths.sort()
+    return paths
+
+
+def parse_archive(args):
+    '''
+    Returns a (path, mtime, size, user, days) tuple for
+    HoursHistory.add_archives(), or (path, error) if the archive can't be read.
+    Runs in the worker processes.
+    '''
+    path, mtime, size, default_user = args
+    try:
+        with open(path, 'rb') as archive_file:
+            data = load_data(archive_file.read())
+    except (IOError, OSError, ValueError, KeyError, TypeError) as error:
+        return path, str(error)
+
+    user = data.user_id or default_user
+    return path, mtime, size, user, [get_day_rows(day) for day in data.days]
+
+
+def import_archives(history, directories, workers=None, user=None, log=None):
+    '''
+    Imports the new or modified archives under directories to history.
+    user is the user of the archives without a user_id, by default the name
+    of the directory holding the backup folder.
+    Returns a dict of statistics of the import.
+    '''
+    start = time.time()
+    imported = history.get_imported()
+    tasks = []
+    skipped = 0
+    for path in find_archives(directories):
+        stat = os.stat(path)
+        if imported.get(path) == (stat.st_mtime, stat.st_size):
+            skipped += 1
+            continue
+        default_user = user or os.path.basename(
+            os.path.dirname(os.path.dirname(os.path.abspath(path))))
+        tasks.append((path, stat.st_mtime, stat.st_size, default_user))
+
+    stats = {'skipped': skipped, 'files': 0, 'errors': 0, 'days': 0,
+             'sessions': 0}
+    workers = workers or multiprocessing.cpu_count()
+    # Large chunks spare round trips, small ones keep the workers busy
+    chunksize = max(1, min(64, len(tasks) // (4 * workers)))
+    pool = multiprocessing.Pool(workers)
+    try:
+        batch = []
+        for result in pool.imap_unordered(parse_archive, tasks, chunksize):
+            if len(result) == 2:
+                stats['errors'] += 1
+                if log:
+                    log('Could not import {}: {}'.format(*result))
+                continue
+            batch.append(result)
+            stats['files'] += 1
+            for ordinal, day_rows, project_session_rows in result[4]:
+                stats['days'] += 1
+                stats['sessions'] += len(project_session_rows)
+            if len(batch) >= BATCH_SIZE:
+                history.add_archives(batch)
+                batch = []
+        history.add_archives(batch)
+    finally:
+        pool.close()
+        pool.join()
+
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def main(argv=None):
+    variables = Prism_HoursTracker_Variables(None, None)
+    data_dir = get_data_dirs(get_setting(variables, 'data_dir'))[0]
+    # The store writes the history next to the data it writes
+    history_dir = get_data_dirs(get_setting(variables, 'data_dir'),
+                                get_setting(variables, 'cache_dir'))[0]
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument(
+        'directories', nargs='*', default=[data_dir + 'backup'],
+        help='directories to search for archives, the backup folder of the '
+             'data directory by default')
+    parser.add_argument(
+        '--db', default=history_dir + (get_setting(variables, 'history_file')
+                                    or 'history.sqlite'),
+        help='history database to import to')
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help='number of parsing processes, one per core by default')
+    parser.add_argument(
+        '--user', default=None,
+        help='user of the archives without a user_id')
+    args = parser.parse_args(argv)
+
+    def log(message):
+        sys.stderr.write(message + '\n')
+
+    history = HoursHistory(args.db)
+    try:
+        stats = import_archives(history, args.directories, args.workers,
+                                args.user, log)
+    finally:
+        history.close()
+
+    seconds = max(stats['seconds'], 1e-6)
+    print('Imported {files} archives, {days} days, {sessions} project '
+          'sessions in {seconds:.2f} s, {errors} errors, {skipped} already '
+          'imported'.format(**stats))
+    print('{:.0f} files/s, {:.0f} project sessions/s'.format(
+        stats['files'] / seconds, stats['sessions'] / seconds))
+
+
+if __name__ == '__main__':
+    main()
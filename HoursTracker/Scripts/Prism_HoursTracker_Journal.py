@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+
+from Prism_HoursTracker_Codec import dumps, loads
+
+
+class HoursJournal(object):
+    '''
+    Append only journal of the tracked events.
+
+    Each event is a single line holding a [timestamp, project, callback]
+    json list, so recording an event costs one small append whatever the
+    size of the user's data. The journal is folded into hours.json and
+    emptied by the store's compaction.
+
+    The first line holds the generation of the hours.json the journal
+    applies to, see HoursStore.compact_data().
+    '''
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def append(self, records):
+        '''
+        Appends a list of [timestamp, project, callback] records to the
+        journal with a single write.
+        '''
+        if not records:
+            return
+        lines = b''.join(dumps(record) + b'\n' for record in records)
+        with open(self.filepath, 'ab') as journal_file:
+            journal_file.write(lines)
+
+    def read(self):
+        '''
+        Returns the generation of the journal, None if it has no header, and
+        the list of its records.
+        '''
+        return self.parse(self.read_content())
+
+    def read_content(self):
+        '''
+        Returns the content of the journal as bytes, empty if it doesn't
+        exist.
+        '''
+        try:
+            with open(self.filepath, 'rb') as journal_file:
+                return journal_file.read()
+        except (IOError, OSError):
+            return b''
+
+    def parse(self, content):
+        '''
+        Returns the generation and the records of the journal's content.
+        Lines that can't be parsed, like a line cut short by a crash, are
+        skipped.
+        '''
+        generation = None
+        records = []
+        for line in content.splitlines():
+            try:
+                record = loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, list) and len(record) == 3:
+                records.append(record)
+            elif isinstance(record, dict) and 'generation' in record:
+                generation = record['generation']
+
+        return generation, records
+
+    def reset(self, generation):
+        '''
+        Empties the journal, called once its records are in the hours.json
+        of the given generation.
+        '''
+        with open(self.filepath, 'wb') as journal_file:
+            journal_file.write(dumps({'generation': generation}) + b'\n')
+
+    def get_size(self):
+        '''
+        Returns the size of the journal in bytes, 0 if it doesn't exist.
+        '''
+        try:
+            return os.path.getsize(self.filepath)
+        except OSError:
+            return 0
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import collections
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(IOError):
+    pass
+
+
+class FileLock(object):
+    '''
+    Advisory lock shared by all the processes writing a data directory.
+
+    Used as a context manager around the short read-modify-write sections of
+    HoursStore. Waiting for the lock is bounded by timeout, LockTimeout is
+    raised past it. The last wait times are kept in waits, in seconds.
+    '''
+    def __init__(self, filepath, timeout=2.0, poll_interval=0.005):
+        self.filepath = filepath
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.waits = collections.deque(maxlen=1000)
+        self._file = None
+
+    def acquire(self):
+        lock_file = open(self.filepath, 'a+')
+        start = time.time()
+        while True:
+            try:
+                self._lock(lock_file)
+                break
+            except (IOError, OSError):
+                if time.time() - start >= self.timeout:
+                    lock_file.close()
+                    raise LockTimeout(
+                        'Timed out waiting for {}'.format(self.filepath))
+                time.sleep(self.poll_interval)
+
+        self.waits.append(time.time() - start)
+        self._file = lock_file
+
+    def release(self):
+        lock_file = self._file
+        self._file = None
+        try:
+            self._unlock(lock_file)
+        finally:
+            lock_file.close()
+
+    def _lock(self, lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(self, lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def write_file_atomic(filename, content, retries=5):
+    '''
+    Writes content, str or bytes, to filename through a temporary file
+    renamed over it, so readers never see a half written file.
+    On Windows the rename fails while another process has the file open,
+    it is retried a few times before giving up.
+    '''
+    temp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(temp_filename, 'wb' if isinstance(content, bytes) else 'w') as temp_file:
+        temp_file.write(content)
+
+    for attempt in range(retries):
+        try:
+            os.replace(temp_filename, filename)
+            return
+        except OSError:
+            if attempt == retries - 1:
+                os.remove(temp_filename)
+                raise
+            time.sleep(0.05)
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Buffered log of the plugin, the tracker daemon and the store.
+
+Messages are buffered in memory and appended to log.txt as json lines by a
+background thread, so logging never blocks a callback on the data
+directory, even when the share holding it is unreachable. The log is
+rotated when it outgrows max_bytes, and a message repeated within
+repeat_interval seconds, the same traceback of a failing write for
+instance, is only counted until the interval is over, then its count is
+written.
+"""
+
+import atexit
+from datetime import datetime
+import json
+import os
+import threading
+import time
+
+
+# Records kept in memory while they can't be written
+MAX_BUFFERED = 1000
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def get_log(path, max_bytes=1048576, backup_count=3, repeat_interval=60.0,
+            flush_interval=5.0):
+    '''
+    Returns the HoursLog writing to path, shared by the plugin and the store
+    of a process. The settings are those of the first call.
+    '''
+    with _logs_lock:
+        log = _logs.get(path)
+        if log is None:
+            log = _logs[path] = HoursLog(path, max_bytes, backup_count,
+                                         repeat_interval, flush_interval)
+            atexit.register(log.close)
+        return log
+
+
+class HoursLog(object):
+    '''
+    Appends json lines records to a log file from a background thread:
+    {"time": "2024-01-08T10:03:12", "level": "error", "pid": 1234,
+     "message": "Traceback...", "repeated": 12}
+
+    repeated is the number of times the message was logged, and not
+    written, since its previous record. A message logged again within
+    repeat_interval seconds of its record is only counted, and the count is
+    written in a record of the message when the interval is over, or when
+    the log is closed. When the file outgrows max_bytes, it is renamed to
+    path.1, path.1 to path.2... and the backups past backup_count are
+    deleted.
+    '''
+    def __init__(self, path, max_bytes=1048576, backup_count=3,
+                 repeat_interval=60.0, flush_interval=5.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.repeat_interval = repeat_interval
+        self.flush_interval = flush_interval
+
+        self._cond = threading.Condition()
+        self._records = []
+        self._dropped = 0
+        # [time of the last written record, times logged since, level] by
+        # message
+        self._repeats = {}
+        # The worker thread starts with the first record
+        self._thread = None
+        self._closed = False
+
+    def write(self, message, level=None):
+        '''
+        Queues a message for the log file. Doesn't block.
+        level defaults to 'error' for tracebacks and to 'info' otherwise.
+        '''
+        timestamp = time.time()
+        with self._cond:
+            repeat = self._repeats.get(message)
+            if repeat is not None and timestamp - repeat[0] < self.repeat_interval:
+                repeat[1] += 1
+                return
+
+            if level is None:
+                level = 'error' if message.startswith('Traceback') else 'info'
+            record = {'time': format_time(timestamp), 'level': level,
+                      'pid': os.getpid(), 'message': message}
+            if repeat is not None and repeat[1]:
+                record['repeated'] = repeat[1]
+            if len(self._repeats) >= MAX_BUFFERED:
+                self._queue_repeats()
+            self._repeats[message] = [timestamp, 0, level]
+
+            if len(self._records) >= MAX_BUFFERED:
+                self._dropped += 1
+                return
+            self._records.append(record)
+
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name='HoursTrackerLog')
+                self._thread.daemon = True
+                self._thread.start()
+            # The worker only needs waking for the first record of a burst
+            if len(self._records) == 1:
+                self._cond.notify()
+
+    def flush(self):
+        '''
+        Writes the queued records now, from the calling thread.
+        Returns False if the file couldn't be written, the records are kept
+        for the next try.
+        '''
+        with self._cond:
+            self._queue_repeats(time.time())
+            records = self._records
+            dropped = self._dropped
+            self._records = []
+            self._dropped = 0
+        if not records and not dropped:
+            return True
+
+        lines = [json.dumps(record, sort_keys=True) + '\n' for record in records]
+        if dropped:
+            lines.append(json.dumps({
+                'time': format_time(time.time()),
+                'level': 'error', 'pid': os.getpid(),
+                'message': '{} log records dropped'.format(dropped)}) + '\n')
+        content = ''.join(lines)
+
+        try:
+            self.rotate(len(content))
+            with open(self.path, 'a') as log_file:
+                log_file.write(content)
+        except (IOError, OSError):
+            with self._cond:
+                self._records[:0] = records
+                self._dropped += dropped
+                excess = len(self._records) - MAX_BUFFERED
+                if excess > 0:
+                    del self._records[:excess]
+                    self._dropped += excess
+            return False
+        return True
+
+    def rotate(self, size):
+        '''
+        Renames the log file to path.1, and the backups to the next number,
+        if writing size more bytes would make it outgrow max_bytes.
+        '''
+        try:
+            current = os.path.getsize(self.path)
+        except OSError:
+            return
+        if not self.max_bytes or current + size <= self.max_bytes or not current:
+            return
+
+        if not self.backup_count:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            src = '{}.{}'.format(self.path, index)
+            if os.path.exists(src):
+                os.replace(src, '{}.{}'.format(self.path, index + 1))
+        os.replace(self.path, self.path + '.1')
+
+    def close(self):
+        '''
+        Stops the worker thread and writes the queued records, and the counts
+        of the repeated messages. Runs at exit.
+        '''
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(self.flush_interval + 5)
+        with self._cond:
+            self._queue_repeats()
+        self.flush()
+
+    def _queue_repeats(self, now=None):
+        '''
+        Queues a record of the count of each message repeated within its
+        interval once the interval is over, of all of them if now is None,
+        and forgets these messages. Called with the condition held.
+        '''
+        for message, (timestamp, count, level) in list(self._repeats.items()):
+            if now is not None and now - timestamp < self.repeat_interval:
+                continue
+            del self._repeats[message]
+            if not count:
+                continue
+            if len(self._records) >= MAX_BUFFERED:
+                self._dropped += 1
+                continue
+            self._records.append({
+                'time': format_time(now or time.time()), 'level': level,
+                'pid': os.getpid(), 'message': message, 'repeated': count})
+
+    def _get_repeats_timeout(self):
+        '''
+        Returns the seconds until the interval of a repeated message is
+        over, None if no message was repeated. Called with the condition
+        held.
+        '''
+        ends = [timestamp + self.repeat_interval
+                for timestamp, count, level in self._repeats.values() if count]
+        if not ends:
+            return None
+        return max(0.0, min(ends) - time.time())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._records and not self._closed:
+                    # Wakes up to write the counts of the repeated messages
+                    self._cond.wait(self._get_repeats_timeout())
+                    self._queue_repeats(time.time())
+                if self._closed:
+                    return
+                # Wait a little, so a burst of records is a single write
+                self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            if not self.flush():
+                # The file can't be written, try again later
+                with self._cond:
+                    self._cond.wait(self.flush_interval)
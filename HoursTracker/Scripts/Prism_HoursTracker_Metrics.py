@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Opt-in timing of the plugin's callbacks and of the phases of the store.
+
+Durations are aggregated in memory into histograms with power of two
+microsecond buckets, and counters. HoursMetrics.snapshot() returns them,
+and a compact json line of the snapshot is passed to dump_func every
+dump_interval seconds.
+
+The hot paths are timed by instrument(), which replaces methods by timed
+wrappers on the instance when the metrics are enabled only: disabled, the
+code runs as is.
+"""
+
+from datetime import datetime
+import functools
+import json
+import threading
+import time
+from time import perf_counter
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics(enabled=False, dump_interval=300.0, dump_func=None):
+    '''
+    Returns the HoursMetrics of the process, shared by the plugin and the
+    store. The settings are those of the first call.
+    '''
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = HoursMetrics(enabled, dump_interval, dump_func)
+        return _metrics
+
+
+class Histogram(object):
+    '''
+    Counts durations in buckets, bucket n holding the durations of less
+    than 2 ** n microseconds and at least half of that.
+    '''
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def get_percentile(self, ratio):
+        '''
+        Returns the upper bound in seconds of the bucket holding the
+        percentile, at most the longest duration.
+        '''
+        rank = ratio * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'n': self.count,
+            'total_ms': round(self.total * 1e3, 3),
+            'p50_ms': round(self.get_percentile(0.5) * 1e3, 3),
+            'p99_ms': round(self.get_percentile(0.99) * 1e3, 3),
+            'max_ms': round(self.max * 1e3, 3),
+        }
+
+
+class _Timer(object):
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add(self.name, perf_counter() - self.start)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class HoursMetrics(object):
+    '''
+    Histograms of durations and counters, by name.
+
+        metrics.instrument(store, 'save_data', 'save')
+        with metrics.time('save.serialise'):
+            ...
+        metrics.count('plugin.errors')
+    '''
+    def __init__(self, enabled=False, dump_interval=300.0, dump_func=None):
+        self.enabled = enabled
+        self.dump_interval = dump_interval
+        self.dump_func = dump_func
+
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._since = datetime.now()
+        self._next_dump = perf_counter() + (dump_interval or 0)
+
+    def instrument(self, obj, method_name, name=None):
+        '''
+        Replaces the method method_name of obj by a wrapper adding the
+        duration of each call to the histogram name, method_name by default.
+        name can also be a function of the call's arguments returning the
+        name of the histogram. Does nothing when disabled.
+        '''
+        if not self.enabled:
+            return
+        method = getattr(obj, method_name)
+        if name is None:
+            name = method_name
+        get_name = name if callable(name) else (lambda *args, **kwargs: name)
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(get_name(*args, **kwargs), perf_counter() - start)
+
+        setattr(obj, method_name, wrapper)
+
+    def time(self, name):
+        '''
+        Returns a context manager adding the duration of its block to the
+        histogram name. Costs a few hundred nanoseconds when disabled, hot
+        paths are timed with instrument().
+        '''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def add(self, name, seconds):
+        '''
+        Adds a duration to the histogram name.
+        '''
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(seconds)
+        if self.dump_func and self.dump_interval and perf_counter() >= self._next_dump:
+            self.dump()
+
+    def count(self, name, value=1):
+        '''
+        Adds value to the counter name.
+        '''
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        '''
+        Returns the histograms and counters aggregated since the process
+        started:
+        {'since': '2024-01-08T10:03:12', 'counters': {name: value},
+         'histograms': {name: {'n', 'total_ms', 'p50_ms', 'p99_ms', 'max_ms'}}}
+        Percentiles are bucket bounds, exact to a factor of two.
+        '''
+        with self._lock:
+            return {
+                'since': self._since.strftime('%Y-%m-%dT%H:%M:%S'),
+                'counters': dict(self._counters),
+                'histograms': dict(
+                    (name, histogram.snapshot())
+                    for name, histogram in self._histograms.items()),
+            }
+
+    def dump(self):
+        '''
+        Passes a json line of the snapshot to dump_func, called by add()
+        every dump_interval seconds.
+        '''
+        with self._lock:
+            if perf_counter() < self._next_dump:
+                return
+            self._next_dump = perf_counter() + self.dump_interval
+        self.dump_func(json.dumps(self.snapshot(), sort_keys=True,
+                                  separators=(',', ':')))
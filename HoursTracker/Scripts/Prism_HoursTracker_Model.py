@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import date as date_type
+import sys
+
+
+# Dates are stored as proleptic ordinals, and times as seconds since midnight
+def parse_date(date_string):
+    '''
+    Converts a %d/%m/%y date string to a date ordinal.
+    '''
+    day, month, year = date_string.split('/')
+    year = int(year)
+    # Same pivot as strptime's %y
+    year += 2000 if year < 69 else 1900
+    return date_type(year, int(month), int(day)).toordinal()
+
+
+def format_date(ordinal):
+    '''
+    Converts a date ordinal to a %d/%m/%y date string.
+    '''
+    day = date_type.fromordinal(ordinal)
+    return '{:02d}/{:02d}/{:02d}'.format(day.day, day.month, day.year % 100)
+
+
+def get_week_start(ordinal):
+    '''
+    Returns the ordinal of the monday of the ISO week of a date ordinal.
+    '''
+    # Ordinal 1 is a monday
+    return ordinal - (ordinal - 1) % 7
+
+
+# encode() and decode() convert the times of every project session, the
+# 'HH:MM:' and 'SS' parts of the strings are looked up in these tables
+_MINUTE_STRINGS = ['%02d:%02d:' % (hours, minutes)
+                   for hours in range(24) for minutes in range(60)]
+_MINUTE_SECONDS = dict(zip(_MINUTE_STRINGS, range(0, 86400, 60)))
+_SECOND_STRINGS = ['%02d' % seconds for seconds in range(60)]
+_SECOND_VALUES = dict(zip(_SECOND_STRINGS, range(60)))
+# 'H:MM:' parts of the durations up to 25 hours
+_DURATION_STRINGS = ['%d:%02d:' % (hours, minutes)
+                     for hours in range(25) for minutes in range(60)]
+
+
+def parse_time(time_string):
+    '''
+    Converts a %H:%M:%S time string to a number of seconds since midnight.
+    '''
+    try:
+        return (_MINUTE_SECONDS[time_string[:6]]
+                + _SECOND_VALUES[time_string[6:]])
+    except KeyError:
+        hours, minutes, seconds = time_string.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def format_time(seconds):
+    '''
+    Converts a number of seconds since midnight to a %H:%M:%S time string.
+    '''
+    if type(seconds) is int and 0 <= seconds < 86400:
+        return _MINUTE_STRINGS[seconds // 60] + _SECOND_STRINGS[seconds % 60]
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%02d:%02d:%02d' % (hours, minutes, seconds)
+
+
+def format_duration(seconds):
+    '''
+    Converts a number of seconds to a H:MM:SS duration string, hours aren't
+    wrapped at 24.
+    '''
+    if type(seconds) is int and 0 <= seconds < 90000:
+        return _DURATION_STRINGS[seconds // 60] + _SECOND_STRINGS[seconds % 60]
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+def intern_project(project):
+    '''
+    Returns the interned project name, so all sessions of a project share
+    the same string.
+    '''
+    if isinstance(project, str):
+        return sys.intern(project)
+    return project
+
+
+class ProjectSession(object):
+    '''
+    A work session on a project, start and last action in seconds since
+    midnight.
+    '''
+    __slots__ = ('start', 'last')
+
+    def __init__(self, start, last=None):
+        self.start = start
+        self.last = start if last is None else last
+
+    @property
+    def total(self):
+        return self.last - self.start
+
+
+class Session(object):
+    '''
+    All the work done on a project during a day.
+    total is the sum of the project sessions in seconds, kept up to date by
+    touch() and add_project_session(), computed if not given.
+    '''
+    __slots__ = ('project', 'project_sessions', 'total')
+
+    def __init__(self, project, project_sessions=None, total=None):
+        self.project = intern_project(project)
+        self.project_sessions = project_sessions or []
+        if total is None:
+            total = sum(project_session.total
+                        for project_session in self.project_sessions)
+        self.total = total
+
+    def add_project_session(self, start):
+        project_session = ProjectSession(start)
+        self.project_sessions.append(project_session)
+        return project_session
+
+    def touch(self, seconds):
+        '''
+        Moves the last action time of the current project session.
+        Events of several processes can arrive out of order, the last action
+        time never goes back.
+        Returns the seconds added to the total.
+        '''
+        project_session = self.project_sessions[-1]
+        if seconds > project_session.last:
+            added = seconds - project_session.last
+            self.total += added
+            project_session.last = seconds
+            return added
+        return 0
+
+
+class Day(object):
+    '''
+    The sessions of a day, date is kept as the string it was read from.
+    index maps each project to its session, sessions must be added with
+    add_session() or append_session() to keep it up to date.
+    '''
+    __slots__ = ('date', 'ordinal', 'sessions', 'index')
+
+    def __init__(self, ordinal, sessions=None, date=None):
+        self.ordinal = ordinal
+        self.date = date or format_date(ordinal)
+        self.sessions = sessions or []
+        self.index = dict(
+            (session.project, session) for session in self.sessions)
+
+    def get_session(self, project):
+        return self.index.get(project)
+
+    def append_session(self, session):
+        self.sessions.append(session)
+        self.index[session.project] = session
+        return session
+
+    def add_session(self, project, start):
+        session = Session(project)
+        session.add_project_session(start)
+        return self.append_session(session)
+
+
+class HoursData(object):
+    '''
+    The user's tracked hours.
+    generation is incremented each time the data is compacted to hours.json.
+    extra holds the keys of hours.json the model doesn't know about, so they
+    are written back as they were read.
+    '''
+    __slots__ = ('days', 'last_active_project', 'user_id', 'last_event_time',
+                 'generation', 'extra')
+
+    def __init__(self):
+        self.days = []
+        self.last_active_project = None
+        self.user_id = None
+        self.last_event_time = 0
+        self.generation = 0
+        self.extra = {}
+
+    def is_empty(self):
+        return not self.days
+
+
+def merge_project_sessions(project_sessions, other_project_sessions):
+    '''
+    Returns the union of two lists of project sessions of a project, by
+    start. Overlapping sessions are merged so the time is counted once.
+    '''
+    merged = []
+    for start, last in sorted(
+            (project_session.start, project_session.last)
+            for project_session in project_sessions + other_project_sessions):
+        if merged and (start < merged[-1].last or start == merged[-1].start):
+            merged[-1].last = max(merged[-1].last, last)
+        else:
+            merged.append(ProjectSession(start, last))
+    return merged
+
+
+def merge_days(days, other_days):
+    '''
+    Returns the days of two lists of Day objects merged by date, the union
+    of the project sessions of each project, e.g. the days tracked on two
+    machines. The Day objects of days are updated in place.
+    '''
+    days_by_ordinal = dict((day.ordinal, day) for day in days)
+    for other_day in other_days:
+        day = days_by_ordinal.get(other_day.ordinal)
+        if day is None:
+            days_by_ordinal[other_day.ordinal] = other_day
+            continue
+        for other_session in other_day.sessions:
+            session = day.get_session(other_session.project)
+            if session is None:
+                day.append_session(other_session)
+                continue
+            session.project_sessions = merge_project_sessions(
+                session.project_sessions, other_session.project_sessions)
+            session.total = sum(project_session.total
+                                for project_session in session.project_sessions)
+    return [days_by_ordinal[ordinal] for ordinal in sorted(days_by_ordinal)]
+
+
+# Codec to and from the hours.json schema
+_KNOWN_KEYS = ('days', 'last_active_project', 'user_id', 'last_event_time',
+               'generation')
+
+
+def decode(legacy):
+    '''
+    Returns a HoursData object from the dict stored in hours.json.
+    Total times are recomputed from the start and last action times.
+    '''
+    data = HoursData()
+    minute_seconds = _MINUTE_SECONDS
+    second_values = _SECOND_VALUES
+    for legacy_day in legacy.get('days', []):
+        sessions = []
+        for legacy_session in legacy_day['sessions']:
+            project_sessions = []
+            total = 0
+            for legacy_project_session in legacy_session['project_sessions']:
+                start = legacy_project_session['start_time']
+                last = legacy_project_session['last_action_time']
+                # parse_time() inlined, it runs twice per project session
+                try:
+                    start = minute_seconds[start[:6]] + second_values[start[6:]]
+                    last = minute_seconds[last[:6]] + second_values[last[6:]]
+                except KeyError:
+                    start = parse_time(legacy_project_session['start_time'])
+                    last = parse_time(legacy_project_session['last_action_time'])
+                total += last - start
+                project_sessions.append(ProjectSession(start, last))
+            sessions.append(
+                Session(legacy_session['project'], project_sessions, total))
+        date = legacy_day['date']
+        data.days.append(Day(parse_date(date), sessions, date))
+
+    data.last_active_project = intern_project(legacy.get('last_active_project'))
+    data.user_id = legacy.get('user_id')
+    data.last_event_time = legacy.get('last_event_time', 0)
+    data.generation = legacy.get('generation', 0)
+    data.extra = dict(
+        (key, value) for key, value in legacy.items() if key not in _KNOWN_KEYS)
+
+    return data
+
+
+def encode(data):
+    '''
+    Returns the hours.json dict of a HoursData object.
+    '''
+    legacy = {}
+    if data.days:
+        legacy['days'] = [
+            {
+                'date': day.date,
+                'sessions': [
+                    {
+                        'project': session.project,
+                        'project_sessions': [
+                            {
+                                'start_time': format_time(project_session.start),
+                                'last_action_time': format_time(project_session.last),
+                                'total_time': format_duration(
+                                    project_session.last - project_session.start)
+                            }
+                            for project_session in session.project_sessions],
+                        'total_time': format_duration(session.total)
+                    }
+                    for session in day.sessions]
+            }
+            for day in data.days]
+        legacy['last_active_project'] = data.last_active_project
+    if data.user_id is not None:
+        legacy['user_id'] = data.user_id
+    if data.last_event_time:
+        legacy['last_event_time'] = data.last_event_time
+    if data.generation:
+        legacy['generation'] = data.generation
+    legacy.update(data.extra)
+
+    return legacy
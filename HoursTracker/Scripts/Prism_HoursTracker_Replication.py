@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import threading
+import time
+import traceback
+
+from Prism_HoursTracker_Lock import FileLock, write_file_atomic
+
+
+# Nanoseconds two mtimes of a file may differ by on the share and still be
+# the same copy, network and FAT file systems round them
+MTIME_TOLERANCE_NS = 2 * 10 ** 9
+
+
+class HoursReplicator(object):
+    '''
+    Copies a local data directory to its replica on the network share from a
+    background thread.
+
+    The store writes to a fast local directory, so tracking never waits for
+    the file server. The replicator copies the files that changed since the
+    last copy, retrying with an exponential backoff while the share can't be
+    reached.
+
+    Other machines can replicate to the same directory. When the replica's
+    hours.json or journal changed since the last copy, they are merged into
+    the local data by merge_func, see HoursStore.merge_replica(), before
+    the local files are copied over them.
+
+    The copies keep the mtime of the local files, so a file of the replica
+    with the same size and mtime isn't copied again by the next process.
+    The data files are written under the replica's lock, shared with the
+    stores writing the share directly.
+    '''
+    FILES = ('hours.json', 'hours.js', 'journal.txt', 'totals.json', 'hours.html',
+             'style.css')
+    DIRECTORIES = ('backup', 'report')
+    # Files written by the stores under the lock of their data directory
+    LOCKED_FILES = ('hours.json', 'hours.js', 'journal.txt', 'totals.json')
+
+    def __init__(self, source_dir, target_dir, interval=30.0, max_backoff=600.0,
+                 log_func=None, lock_timeout=2.0, merge_func=None):
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.log_func = log_func
+        self.merge_func = merge_func
+
+        # Same lock as the store writing source_dir
+        self._file_lock = FileLock(self.source_dir + 'hours.lock', lock_timeout)
+        # Same lock as the stores writing target_dir directly
+        self._target_lock = FileLock(self.target_dir + 'hours.lock', lock_timeout)
+        # Stamp of each local file when it was last copied, and of the
+        # replica's data files after the last copy or merge
+        self._copied = {}
+        self._target_stamps = None
+        self._cond = threading.Condition()
+        self._pending = True
+        self._stopped = False
+
+        self._thread = threading.Thread(
+            target=self._run, name='HoursTrackerReplicator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def notify(self):
+        '''
+        Tells the replicator the local files changed. Doesn't block.
+        '''
+        with self._cond:
+            self._pending = True
+            self._cond.notify()
+
+    def stop(self, timeout=5.0):
+        '''
+        Stops the worker after a last replication attempt of at most timeout
+        seconds.
+        '''
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def get_files(self):
+        '''
+        Returns the paths of the files to replicate, relative to the data
+        directories.
+        '''
+        files = [name for name in self.FILES
+                 if os.path.exists(self.source_dir + name)]
+        for directory in self.DIRECTORIES:
+            for root, dirnames, filenames in os.walk(self.source_dir + directory):
+                relative_dir = os.path.relpath(
+                    root, self.source_dir).replace('\\', '/')
+                files.extend(relative_dir + '/' + name for name in filenames
+                             if not name.endswith('.tmp'))
+
+        return files
+
+    def get_data_stamps(self):
+        '''
+        Returns the stamps of the replica's hours.json and journal.
+        '''
+        return (self.get_stamp(self.target_dir + 'hours.json'),
+                self.get_stamp(self.target_dir + 'journal.txt'))
+
+    def replicate(self):
+        '''
+        Copies the local files changed since their last copy to the replica.
+        '''
+        if not os.path.exists(self.target_dir):
+            os.makedirs(self.target_dir)
+
+        data_files = []
+        for name in self.get_files():
+            source = self.source_dir + name
+            stamp = self.get_stamp(source)
+            if stamp is None or self.is_copied(name, stamp):
+                continue
+            if name in self.LOCKED_FILES:
+                data_files.append(name)
+                continue
+
+            # Read under the lock, so the copy is never half written, and
+            # write to the share after releasing it
+            with self._file_lock:
+                stamp = self.get_stamp(source)
+                with open(source, 'rb') as source_file:
+                    content = source_file.read()
+
+            target = self.target_dir + name
+            if not os.path.exists(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            self.write_copy(target, content, stamp)
+            self._copied[name] = stamp
+
+        if data_files or self.get_data_stamps() != self._target_stamps:
+            self.copy_data_files(data_files)
+
+    def copy_data_files(self, names):
+        '''
+        Copies the local data files names to the replica under its lock.
+        If another machine wrote the replica since the last copy, its data
+        is merged into the local data first, and all the data files are
+        copied.
+        '''
+        with self._target_lock:
+            stamps = self.get_data_stamps()
+            if stamps != self._target_stamps and self.merge_func is not None:
+                contents = []
+                for name in ('hours.json', 'journal.txt'):
+                    try:
+                        with open(self.target_dir + name, 'rb') as target_file:
+                            contents.append(target_file.read())
+                    except (IOError, OSError):
+                        contents.append(b'')
+                if any(contents):
+                    if not self.merge_func(*contents):
+                        # Another local process wrote first, the merge is
+                        # compacted and copied on the next replication
+                        return
+                    if self.log_func:
+                        self.log_func('Merged the data written to {} from '
+                                      'another machine'.format(self.target_dir))
+                    names = [name for name in self.LOCKED_FILES
+                             if os.path.exists(self.source_dir + name)]
+
+            # The files of a compaction are read together, so the replica
+            # never gets a journal of another generation than its hours.json
+            copies = []
+            with self._file_lock:
+                for name in names:
+                    source = self.source_dir + name
+                    stamp = self.get_stamp(source)
+                    with open(source, 'rb') as source_file:
+                        copies.append((name, stamp, source_file.read()))
+            for name, stamp, content in copies:
+                self.write_copy(self.target_dir + name, content, stamp)
+            self._target_stamps = self.get_data_stamps()
+
+        for name, stamp, content in copies:
+            self._copied[name] = stamp
+
+    def write_copy(self, target, content, stamp):
+        write_file_atomic(target, content)
+        os.utime(target, ns=(stamp[0], stamp[0]))
+
+    def is_copied(self, name, stamp):
+        '''
+        Whether the local file name, as of stamp, is already in the replica.
+        '''
+        if name not in self._copied:
+            # First check in this process, the replica may hold a copy made
+            # by a previous one
+            target_stamp = self.get_stamp(self.target_dir + name)
+            if target_stamp is not None and target_stamp[1] == stamp[1] and \
+                    abs(target_stamp[0] - stamp[0]) <= MTIME_TOLERANCE_NS:
+                self._copied[name] = stamp
+        return self._copied.get(name) == stamp
+
+    def get_stamp(self, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _run(self):
+        retry_delay = None
+        while True:
+            with self._cond:
+                if not self._stopped:
+                    if retry_delay is not None:
+                        self._cond.wait(retry_delay)
+                    elif not self._pending:
+                        self._cond.wait(self.interval)
+                stopped = self._stopped
+                self._pending = False
+
+            try:
+                self.replicate()
+                retry_delay = None
+            except Exception:
+                # Share unreachable, back off before the next try
+                if retry_delay is None:
+                    if self.log_func:
+                        self.log_func(traceback.format_exc())
+                    retry_delay = 2.0
+                else:
+                    retry_delay = min(retry_delay * 2, self.max_backoff)
+
+            if stopped:
+                return
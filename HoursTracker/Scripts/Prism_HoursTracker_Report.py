@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import date
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from Prism_HoursTracker_Model import get_week_start
+
+
+# Ordinal of 1970-01-01, day 0 of numpy's datetime64
+EPOCH_ORDINAL = 719163
+PERIODS = ('day', 'week', 'month')
+
+
+def group_sum(columns, values):
+    '''
+    Returns a list of (key, total) tuples sorted by key, the sum of values
+    for each distinct key, the keys being the rows of columns, sequences of
+    integers. Uses numpy when it is installed.
+    '''
+    if not len(values):
+        return []
+
+    if numpy is not None:
+        columns = [numpy.asarray(column, dtype=numpy.int64)
+                   for column in columns]
+        lows = [int(column.min()) for column in columns]
+        sizes = [int(column.max()) - low + 1
+                 for column, low in zip(columns, lows)]
+        if numpy.prod(numpy.array(sizes, dtype=float)) >= 2 ** 62:
+            keys = numpy.array(columns).T
+            unique, inverse = numpy.unique(keys, axis=0, return_inverse=True)
+            unique = unique.T
+        else:
+            # Pack each key in a single integer, unique on a flat array is
+            # much faster than on rows
+            packed = numpy.zeros(len(values), dtype=numpy.int64)
+            for column, low, size in zip(columns, lows, sizes):
+                packed = packed * size + (column - low)
+            packed, inverse = numpy.unique(packed, return_inverse=True)
+            unique = []
+            for low, size in reversed(list(zip(lows, sizes))):
+                unique.insert(0, packed % size + low)
+                packed = packed // size
+        totals = numpy.bincount(inverse.ravel(), weights=values)
+        keys = zip(*[column.tolist() for column in unique])
+        return [(key, int(total)) for key, total in zip(keys, totals.tolist())]
+
+    totals = {}
+    for key, value in zip(zip(*columns), values):
+        totals[key] = totals.get(key, 0) + value
+    return sorted(totals.items())
+
+
+def get_period_starts(days, period):
+    '''
+    Returns the ordinal of the first day of the day, ISO week or month of
+    each day ordinal.
+    '''
+    if period == 'day':
+        return days
+
+    if numpy is not None:
+        days = numpy.asarray(days, dtype=numpy.int64)
+        if period == 'week':
+            return get_week_start(days)
+        months = (days - EPOCH_ORDINAL).astype('datetime64[D]').astype(
+            'datetime64[M]')
+        return months.astype('datetime64[D]').astype(numpy.int64) + EPOCH_ORDINAL
+
+    if period == 'week':
+        return [get_week_start(day) for day in days]
+    starts = {}
+    for day in set(days):
+        starts[day] = date.fromordinal(day).replace(day=1).toordinal()
+    return [starts[day] for day in days]
+
+
+class IntervalTable(object):
+    '''
+    Tracked intervals as columns, to compute report statistics in batch.
+
+    Each interval is a project session: the user and project columns hold
+    indexes in the users and projects lists, day the date ordinal, start
+    and end seconds since the start of day 1, so intervals of different
+    days compare. The columns are numpy arrays when numpy is installed,
+    lists otherwise.
+    '''
+    def __init__(self, users, projects, user, project, day, start, end):
+        self.users = users
+        self.projects = projects
+        if numpy is not None:
+            user, project, day, start, end = (
+                numpy.asarray(column, dtype=numpy.int64)
+                for column in (user, project, day, start, end))
+        self.user = user
+        self.project = project
+        self.day = day
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def from_rows(cls, rows):
+        '''
+        Returns a table of (user, day ordinal, project, start, last) rows,
+        start and last in seconds since midnight.
+        '''
+        users = []
+        user_indexes = {}
+        projects = []
+        project_indexes = {}
+        columns = ([], [], [], [], [])
+        for user, day, project, start, last in rows:
+            user_index = user_indexes.get(user)
+            if user_index is None:
+                user_index = user_indexes[user] = len(users)
+                users.append(user)
+            project_index = project_indexes.get(project)
+            if project_index is None:
+                project_index = project_indexes[project] = len(projects)
+                projects.append(project)
+            columns[0].append(user_index)
+            columns[1].append(project_index)
+            columns[2].append(day)
+            columns[3].append(day * 86400 + start)
+            columns[4].append(day * 86400 + last)
+        return cls(users, projects, *columns)
+
+    @classmethod
+    def from_data(cls, data, user=None):
+        '''
+        Returns a table of the project sessions of a HoursData.
+        '''
+        user = user or data.user_id or ''
+        return cls.from_rows(
+            (user, day.ordinal, session.project, project_session.start,
+             project_session.last)
+            for day in data.days for session in day.sessions
+            for project_session in session.project_sessions)
+
+    @classmethod
+    def from_history(cls, history, start=None, end=None, project=None,
+                     user=None):
+        '''
+        Returns a table of the project sessions of a HoursHistory between
+        the start and end dates.
+        '''
+        return cls.from_rows(
+            history.get_project_sessions(start, end, project, user))
+
+    def __len__(self):
+        return len(self.day)
+
+    def get_durations(self):
+        if numpy is not None:
+            return self.end - self.start
+        return [end - start for start, end in zip(self.start, self.end)]
+
+    def get_totals(self, period='day', by_user=False):
+        '''
+        Returns a list of (period start date, project, seconds) tuples, the
+        time spent on each project each day, ISO week or month, sorted by
+        date. With by_user, the tuples are (date, user, project, seconds).
+        '''
+        if period not in PERIODS:
+            raise ValueError('period must be one of {}'.format(PERIODS))
+
+        periods = get_period_starts(self.day, period)
+        if by_user:
+            return [(date.fromordinal(day), self.users[user],
+                     self.projects[project], seconds)
+                    for (day, user, project), seconds in group_sum(
+                        [periods, self.user, self.project],
+                        self.get_durations())]
+        return [(date.fromordinal(day), self.projects[project], seconds)
+                for (day, project), seconds in group_sum(
+                    [periods, self.project], self.get_durations())]
+
+    def get_top_projects(self, count=10):
+        '''
+        Returns the count projects the most time was spent on, as a list of
+        (project, seconds) tuples.
+        '''
+        totals = group_sum([self.project], self.get_durations())
+        totals.sort(key=lambda item: item[1], reverse=True)
+        return [(self.projects[project], seconds)
+                for (project,), seconds in totals[:count]]
+
+    def remove_overlaps(self):
+        '''
+        Returns a table where the intervals of a user don't overlap.
+        DCCs running at the same time track the same minutes on their own
+        projects, the time is kept in the interval starting first, the
+        others are clipped, or dropped if they are entirely covered.
+        '''
+        if numpy is not None:
+            # Users are moved far apart, so one accumulate covers them all
+            offset = self.user * (self.end.max() + 1 if len(self) else 0)
+            order = numpy.lexsort((self.start, self.user))
+            start = self.start[order] + offset[order]
+            end = self.end[order] + offset[order]
+            covered = numpy.maximum.accumulate(end)
+            start[1:] = numpy.maximum(start[1:], covered[:-1])
+            keep = order[start < end]
+            clipped = start[start < end] - offset[keep]
+            return IntervalTable(
+                self.users, self.projects, self.user[keep],
+                self.project[keep], self.day[keep], clipped, self.end[keep])
+
+        columns = ([], [], [], [], [])
+        covered = None
+        last_user = None
+        for index in sorted(range(len(self)),
+                            key=lambda index: (self.user[index], self.start[index])):
+            user = self.user[index]
+            start = self.start[index]
+            end = self.end[index]
+            if user != last_user:
+                covered = start
+                last_user = user
+            start = max(start, covered)
+            covered = max(covered, end)
+            if start >= end:
+                continue
+            for column, value in zip(columns, (user, self.project[index],
+                                               self.day[index], start, end)):
+                column.append(value)
+        return IntervalTable(self.users, self.projects, *columns)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Studio wide rollup of the hours tracked by all the users.
+
+Each user's data sits in its own data directory, the rollup scans a root
+holding one directory per user, and sums the hours of their hours.json and
+backup/*_hours.json(.gz) archives per user, project and day into a single
+compact json file production can read.
+
+Files are read one at a time and only their per day totals are kept. The
+totals of each file are cached next to the rollup with the file's mtime,
+size and hash, so a re-run only parses the files that changed.
+
+Usage: python Prism_HoursTracker_Rollup.py ROOT [--output FILE]
+"""
+
+import argparse
+from datetime import date
+import hashlib
+import json
+import os
+import time
+
+from Prism_HoursTracker_Codec import load_data
+from Prism_HoursTracker_Lock import write_file_atomic
+from Prism_HoursTracker_Report import group_sum
+
+
+def find_user_files(root):
+    '''
+    Returns the paths of the hours.json files and archives of each user
+    directory under root.
+    '''
+    paths = []
+    for entry in sorted(os.listdir(root)):
+        user_dir = os.path.join(root, entry)
+        if not os.path.isdir(user_dir):
+            continue
+        if os.path.isfile(os.path.join(user_dir, 'hours.json')):
+            paths.append(os.path.join(user_dir, 'hours.json'))
+        backup_dir = os.path.join(user_dir, 'backup')
+        if os.path.isdir(backup_dir):
+            paths.extend(
+                os.path.join(backup_dir, filename)
+                for filename in sorted(os.listdir(backup_dir))
+                if filename.endswith(('_hours.json', '_hours.json.gz')))
+    return paths
+
+
+def get_file_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+class StudioRollup(object):
+    '''
+    Sums the hours of all the users under root per user, project and day.
+    cache_file keeps the totals of each file between runs, see refresh().
+    '''
+    def __init__(self, root, cache_file=None):
+        self.root = root
+        self.cache_file = cache_file
+        # Totals of each file by path, see read_file()
+        self._files = {}
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r') as json_file:
+                    self._files = json.loads(json_file.read())
+            except (IOError, OSError, ValueError):
+                self._files = {}
+
+    def read_file(self, path, stat, cached):
+        '''
+        Returns the cache entry of a file: its mtime, size and hash, its
+        user, and its [project, day ordinal, seconds] totals.
+        The file is only parsed if its content changed since cached.
+        '''
+        with open(path, 'rb') as json_file:
+            content = json_file.read()
+        file_hash = get_file_hash(content)
+        if cached is not None and cached['hash'] == file_hash:
+            entry = dict(cached)
+        else:
+            data = load_data(content)
+            # The user directory holds the user's hours.json and backup/
+            user_dir = os.path.dirname(path)
+            if os.path.basename(user_dir) == 'backup':
+                user_dir = os.path.dirname(user_dir)
+            entry = {
+                'hash': file_hash,
+                'user': data.user_id or os.path.basename(user_dir),
+                'rows': [[session.project, day.ordinal, session.total]
+                         for day in data.days for session in day.sessions]}
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+        return entry
+
+    def refresh(self):
+        '''
+        Reads the files that changed since the last call and updates the
+        cache. Returns a dict of statistics of the run, changed is False if
+        the totals are the same as in the last call.
+        '''
+        stats = {'files': 0, 'parsed': 0, 'errors': 0}
+        start = time.time()
+        files = {}
+        for path in find_user_files(self.root):
+            stats['files'] += 1
+            try:
+                stat = os.stat(path)
+                cached = self._files.get(path)
+                if (cached is not None and cached['mtime'] == stat.st_mtime
+                        and cached['size'] == stat.st_size):
+                    files[path] = cached
+                    continue
+                files[path] = self.read_file(path, stat, cached)
+                if cached is None or cached['hash'] != files[path]['hash']:
+                    stats['parsed'] += 1
+            except (IOError, OSError, ValueError, KeyError, TypeError):
+                stats['errors'] += 1
+                # Keep the last readable version, the file may be half written
+                if path in self._files:
+                    files[path] = self._files[path]
+
+        stats['changed'] = bool(stats['parsed']) or set(files) != set(self._files)
+        cache_changed = files != self._files
+        self._files = files
+        if self.cache_file and cache_changed:
+            write_file_atomic(self.cache_file, json.dumps(
+                self._files, separators=(',', ':')))
+        stats['seconds'] = time.time() - start
+        return stats
+
+    def get_rollup(self):
+        '''
+        Returns the compact rollup dict: the list of users and projects, and
+        the totals per user, project and day as columns. user and project
+        hold indexes in the users and projects lists, day the number of days
+        since first_day. The totals per project and per user come with it.
+
+        A day found in several files of a user, e.g. in hours.json and an
+        archive, is counted from the most recent file only.
+        '''
+        # Most recent file holding each day of each user
+        owners = {}
+        for path, entry in sorted(self._files.items(),
+                                  key=lambda item: item[1]['mtime']):
+            for project, day, seconds in entry['rows']:
+                owners[(entry['user'], day)] = path
+
+        users = sorted(set(entry['user'] for entry in self._files.values()))
+        projects = sorted(set(row[0] for entry in self._files.values()
+                              for row in entry['rows']))
+        user_indexes = dict((user, index) for index, user in enumerate(users))
+        project_indexes = dict(
+            (project, index) for index, project in enumerate(projects))
+
+        user_column = []
+        project_column = []
+        day_column = []
+        values = []
+        for path, entry in self._files.items():
+            user = entry['user']
+            for project, day, seconds in entry['rows']:
+                if owners[(user, day)] != path:
+                    continue
+                user_column.append(user_indexes[user])
+                project_column.append(project_indexes[project])
+                day_column.append(day)
+                values.append(seconds)
+
+        totals = group_sum([user_column, project_column, day_column], values)
+        first_day = min(day_column) if day_column else date.today().toordinal()
+        return {
+            'generated': int(time.time()),
+            'users': users,
+            'projects': projects,
+            'first_day': date.fromordinal(first_day).isoformat(),
+            'user': [key[0] for key, seconds in totals],
+            'project': [key[1] for key, seconds in totals],
+            'day': [key[2] - first_day for key, seconds in totals],
+            'seconds': [seconds for key, seconds in totals],
+            'project_totals': dict(
+                (projects[project], seconds) for (project,), seconds
+                in group_sum([project_column], values)),
+            'user_totals': dict(
+                (users[user], seconds) for (user,), seconds
+                in group_sum([user_column], values)),
+        }
+
+    def write(self, output):
+        '''
+        Refreshes the totals and writes the rollup to output, if they changed.
+        Returns the statistics of the refresh.
+        '''
+        stats = self.refresh()
+        if stats['changed'] or not os.path.exists(output):
+            write_file_atomic(output, json.dumps(
+                self.get_rollup(), separators=(',', ':')))
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument(
+        'root', help='directory holding the data directory of each user')
+    parser.add_argument(
+        '--output', default='rollup.json', help='rollup file to write')
+    args = parser.parse_args(argv)
+
+    rollup = StudioRollup(args.root, args.output + '.cache')
+    stats = rollup.write(args.output)
+    print('{files} files, {parsed} parsed, {errors} errors in '
+          '{seconds:.2f} s'.format(**stats))
+
+
+if __name__ == '__main__':
+    main()
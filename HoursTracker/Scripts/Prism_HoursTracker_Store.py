@@ -0,0 +1,948 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import date, datetime
+import gzip
+import json
+import os
+import threading
+import time
+import traceback
+
+from Prism_HoursTracker_Backup import HoursBackup, format_stats
+from Prism_HoursTracker_Coalescer import EventCoalescer
+from Prism_HoursTracker_Codec import dump_data, dumps, load_data, loads
+from Prism_HoursTracker_History import HoursHistory, get_day_rows
+from Prism_HoursTracker_Journal import HoursJournal
+from Prism_HoursTracker_Lock import FileLock, write_file_atomic
+from Prism_HoursTracker_Log import get_log
+from Prism_HoursTracker_Metrics import get_metrics
+from Prism_HoursTracker_Model import (Day, HoursData, ProjectSession, Session,
+                                      encode, format_date, get_week_start,
+                                      merge_days)
+from Prism_HoursTracker_Replication import HoursReplicator
+from Prism_HoursTracker_Totals import HoursTotals
+from Prism_HoursTracker_Variables import get_idle_gap, get_setting
+from Prism_HoursTracker_WebReport import ReportWriter
+from Prism_HoursTracker_Writer import HoursWriter
+
+
+# Events kept for the history database while it can't be written
+MAX_HISTORY_RECORDS = 10000
+
+
+class HoursStore(object):
+    '''
+    Owns the user's data: keeps it in memory, applies the events to it, and
+    writes it to the data directory from a background thread.
+    Used in process by the plugin, or by the tracker daemon shared by all
+    the DCCs of a user, see Prism_HoursTracker_Daemon.
+
+    Several stores can write the same directory: writes happen under a file
+    lock, and the events of other processes are merged in when the files
+    changed since the last write, see save_data().
+
+    If replica_dir is given, user_data_dir is meant to be on a local disk and
+    its files are copied to replica_dir in the background, see
+    Prism_HoursTracker_Replication.
+
+    If history_file is given, the events and the sessions of the days they
+    touch are also written to that SQLite database, see write_history().
+
+    hours.json only holds the current week, at most hot_max_days days. Older
+    days are moved to compressed weekly archives in backup/, see
+    write_archives().
+
+    Every backup_interval seconds, hours.json, the journal and the log are
+    snapshotted to backup/, see backup_data() and Prism_HoursTracker_Backup.
+
+    The totals per project of each day, week and month are kept up to date
+    by apply_event() and written to totals.json on compaction, see
+    get_period_totals() and Prism_HoursTracker_Totals.
+
+    hours.json is written in store_format, 'json' or 'binary', and read in
+    either of them, see Prism_HoursTracker_Codec. hours.js, read by the
+    html report, is always json.
+
+    With idle_gap set, an event coming more than idle_gap seconds after the
+    last action on the same project starts a new project session instead of
+    extending the last one, so the idle time isn't counted, see
+    Prism_HoursTracker_Heartbeat.
+    '''
+    def __init__(self, user_data_dir, flush_interval=5.0, compact_interval=300.0,
+                 coalesce_window=2.0, lock_timeout=2.0, replica_dir=None,
+                 replication_interval=30.0, replication_max_backoff=600.0,
+                 history_file=None, hot_max_days=7, backup_interval=86400.0,
+                 backup_keep_weekly=8, backup_keep_monthly=12, store_format='json',
+                 idle_gap=0.0):
+        self.user_data_dir = user_data_dir
+        self.user_data_json = self.user_data_dir + 'hours.json'
+        self.user_data_js = self.user_data_dir + 'hours.js'
+        self.user_data_backup = self.user_data_dir + '/backup/'
+        self.user_log = self.user_data_dir + 'log.txt'
+        self.user_journal = self.user_data_dir + 'journal.txt'
+        self.user_lock = self.user_data_dir + 'hours.lock'
+        self.user_totals = self.user_data_dir + 'totals.json'
+        self.compact_interval = compact_interval
+        self.store_format = store_format
+        self.idle_gap = idle_gap
+
+        # Shared with the plugin or the daemon, configured by them
+        self._log = get_log(self.user_log)
+        self._metrics = get_metrics()
+        # Timed when the metrics are enabled, before the writer thread gets
+        # a reference to save_data
+        for method_name, name in (('record', 'store.record'),
+                                  ('record_event', 'store.event'),
+                                  ('read_data', 'store.read'),
+                                  ('save_data', 'save'),
+                                  ('merge_data', 'save.merge'),
+                                  ('write_archives', 'save.archives'),
+                                  ('compact_data', 'save.compact'),
+                                  ('write_history', 'save.history'),
+                                  ('backup_if_due', 'save.backup')):
+            self._metrics.instrument(self, method_name, name)
+
+        # In memory copy of the user's data, and the stamp of hours.json and
+        # of the journal when they were last read or written. See save_data()
+        self._data = None
+        self._disk_stamp = None
+        self._file_lock = FileLock(self.user_lock, lock_timeout)
+
+        # Running totals per period, read from totals.json with the data
+        self._totals = None
+
+        # Events are appended to the journal, and folded into hours.json
+        # by compact_data()
+        self._journal = HoursJournal(self.user_journal)
+        self._metrics.instrument(self._journal, 'append', 'save.journal')
+        self._pending_records = []
+        self._compact_requested = False
+        # The first flush compacts, so the report is up to date at startup
+        self._last_compaction = 0
+        self._uncompacted = False
+
+        # Events not written to the history database yet, and the database,
+        # opened by the writer thread. See write_history()
+        self.history_file = history_file
+        self._history = None
+        self._history_records = []
+        self._lock_timeout = lock_timeout
+
+        # Days rolled out of hours.json, written to the archives by the
+        # writer thread, see write_archives()
+        self.hot_max_days = hot_max_days
+        self._archive_queue = []
+        self._new_week = False
+
+        # Data of another machine merged by merge_replica(), until it is
+        # compacted to hours.json
+        self._replica = None
+
+        # Snapshots of the data, _last_backup is read from the last
+        # snapshot on the first write
+        self._backup = HoursBackup(self.user_data_backup)
+        self.backup_interval = backup_interval
+        self.backup_keep_weekly = backup_keep_weekly
+        self.backup_keep_monthly = backup_keep_monthly
+        self._last_backup = None
+
+        # Shards of the html report of the archived weeks
+        self._report = ReportWriter(self.user_data_dir + 'report')
+
+        # Bursts of callbacks on a project are merged into a single event
+        self._coalescer = EventCoalescer(coalesce_window)
+
+        # The data is written to disk by a background thread, see save_data()
+        self._lock = threading.RLock()
+        self._writer = HoursWriter(self.save_data, flush_interval, self.log)
+
+        self._replicator = None
+        if replica_dir:
+            self._replicator = HoursReplicator(
+                self.user_data_dir, replica_dir, replication_interval,
+                replication_max_backoff, self.log, lock_timeout,
+                self.merge_replica)
+
+# EVENTS
+    def record(self, timestamp, project, callback, user):
+        '''
+        Records an action of user on project at timestamp, triggered by the
+        callback of that name.
+        '''
+        with self._lock:
+            try:
+                # Only the first and last events of a burst are applied
+                for event in self._coalescer.offer(timestamp, project, callback):
+                    self.record_event(*event, user=user)
+
+                # The writer thread drains the coalescer before writing
+                self._writer.mark_dirty()
+            except Exception:
+                # The in memory data may be half updated, read it again next time
+                self.invalidate_data()
+                self._metrics.count('store.errors')
+                self.log(traceback.format_exc())
+
+    def record_event(self, timestamp, project, callback, user=None):
+        '''
+        Applies an event to the in memory data and queues it for the journal.
+        '''
+        # Get data from memory, or from file if it changed on disk
+        data = self.load_data()
+        data = self.apply_event(data, timestamp, project, self._totals)
+
+        # Set user id data
+        if user is not None:
+            data.user_id = user
+
+        # Keep the data in memory, the writer thread journals it
+        self._data = data
+        self._pending_records.append([timestamp, project, callback])
+        if self.history_file:
+            self._history_records.append((timestamp, project, callback))
+
+    def apply_event(self, data, timestamp, project, totals=None, archive=True):
+        """
+        Returns the user's data updated with an action on project at timestamp.
+        Runs a series of checks on existing data to determine where to write the action's data
+        Also used to replay the journal's events.
+        totals: HoursTotals the seconds added are added to
+        archive: whether the days rolled out are queued for the archives,
+        False for the data of another machine
+        """
+        action_time = datetime.fromtimestamp(timestamp)
+        today = action_time.toordinal()
+        start_time = (action_time.hour * 3600 + action_time.minute * 60
+                      + action_time.second)
+        added = 0
+
+        # If data is empty initialise it
+        if data.is_empty():
+            data = self.initialise_data(data, today, start_time, project)
+
+        # Events of another process can arrive late, skip the ones older than
+        # the current day
+        elif today < data.days[-1].ordinal:
+            return data
+
+        # Check if current day exists and create data if necessary, the days
+        # of the previous weeks are rolled out to the archives
+        elif today != data.days[-1].ordinal:
+            archived_days = self.get_days_to_archive(data, today)
+            if archived_days and archive:
+                self._archive_queue.append((data.user_id, archived_days))
+                self._new_week = self._new_week or self.is_new_week(data, today)
+                data.days = data.days[len(archived_days):]
+            new_day = self.initialise_day(today, start_time, project)
+            data.days.append(new_day)
+            data.last_active_project = project
+
+        else:
+            session = data.days[-1].get_session(project)
+
+            # Does the current project have a session if not initialise it
+            if session is None:
+                session = self.initialise_session(start_time, project)
+                data.days[-1].append_session(session)
+                data.last_active_project = project
+
+            #  Is the current project the last active project, if not start new project session
+            elif project != data.last_active_project:
+                session.project_sessions.append(
+                    self.initialise_project_session(start_time))
+                data.last_active_project = project
+
+            # Past an idle gap, the time since the last action isn't work
+            elif (self.idle_gap and start_time - session.project_sessions[-1].last
+                  > self.idle_gap):
+                session.project_sessions.append(
+                    self.initialise_project_session(start_time))
+
+            # If current project is last active project, update action time,
+            # total times are written as strings when the data is saved
+            else:
+                added = session.touch(start_time)
+
+        if totals is not None:
+            totals.add(today, project, added)
+
+        # Remember the last event folded in the data, see load_data()
+        data.last_event_time = timestamp
+
+        return data
+
+    def is_new_week(self, data, today=None):
+        """
+        Checks if if today's date sets off a new work week, by retrieving the
+        last date present in the user's data, and comparing the ISO weeks of
+        the two dates
+
+        today: date ordinal, defaults to the current date
+        Returns True if the last entry is from a previous week
+        """
+        if today is None:
+            today = datetime.now().toordinal()
+        return data.days[-1].ordinal < get_week_start(today)
+
+    def get_days_to_archive(self, data, today):
+        '''
+        Returns the days to roll out of the data before adding today, unless
+        it is the last day already: the days of the previous weeks, and the
+        oldest days past hot_max_days.
+        '''
+        week_start = get_week_start(today)
+        count = 0
+        while count < len(data.days) and data.days[count].ordinal < week_start:
+            count += 1
+        added = 0 if data.days and data.days[-1].ordinal == today else 1
+        count = max(count, len(data.days) + added - max(self.hot_max_days, 1))
+        return data.days[:count]
+
+    def initialise_data(self, data, date, start_time, project):
+        '''
+        Returns the user data. Initialises the data with a new day of hours tracked.
+        date is a date ordinal and start_time a number of seconds since midnight.
+        '''
+        data.days = [self.initialise_day(date, start_time, project)]
+        data.last_active_project = project
+
+        return data
+
+    def initialise_day(self, date, start_time, project):
+        '''
+        Returns a Day with the initial data of the current day.
+        Called when no previous data exists for the day.
+        '''
+        day = Day(date)
+        day.add_session(project, start_time)
+
+        return day
+
+    def initialise_session(self, start_time, project):
+        '''
+        Returns a Session.
+        Sessions are group all work done on a project
+        '''
+        session = Session(project)
+        session.add_project_session(start_time)
+
+        return session
+
+    def initialise_project_session(self, start_time):
+        '''
+        Returns a ProjectSession.
+        A project session is work session on a project.
+        '''
+        return ProjectSession(start_time)
+
+# PERSISTENCE
+    def get_file_stamp(self, filepath):
+        '''
+        Returns a (mtime, size) tuple identifying the state of a file on disk,
+        or None if the file can't be stat'ed.
+        '''
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get_disk_stamp(self):
+        '''
+        Returns the stamp of hours.json and the size of the journal.
+        '''
+        return (self.get_file_stamp(self.user_data_json),
+                self._journal.get_size())
+
+    def read_data(self):
+        '''
+        Returns the data of hours.json with the events of the journal folded in.
+        '''
+        return self.parse_data(*self.read_raw_data())
+
+    def read_raw_data(self):
+        '''
+        Returns the content of hours.json and of the journal, as bytes.
+        '''
+        try:
+            with open(self.user_data_json, 'rb') as data_file:
+                content = data_file.read()
+        except (IOError, OSError):
+            content = b''
+
+        return content, self._journal.read_content()
+
+    def parse_data(self, content, journal_content, archive=True):
+        '''
+        Returns the data of the content of hours.json with the events of the
+        content of the journal folded in.
+        archive: whether the days rolled out by the events are queued for the
+        archives, see apply_event()
+        '''
+        try:
+            data = load_data(content)
+        except:
+            # If json file empty return empty data
+            data = HoursData()
+
+        # A journal of another generation was already folded into hours.json
+        # by a compaction that didn't get to reset it
+        generation, records = self._journal.parse(journal_content)
+        if generation is None or generation == data.generation:
+            # The events of several processes can be interleaved
+            records.sort(key=lambda record: record[0])
+            for timestamp, project, callback in records:
+                data = self.apply_event(data, timestamp, project,
+                                        archive=archive)
+
+        return data
+
+    def load_data(self):
+        '''
+        Returns the user's data.
+        The data is read from disk once and then kept in memory, the changes
+        made by other processes are merged by save_data().
+        '''
+        if self._data is None:
+            self._disk_stamp = self.get_disk_stamp()
+            self._data = self.read_data()
+            if self._totals is None:
+                self._totals = self.read_totals()
+            self._totals.set_days(self._data.days)
+        return self._data
+
+    def read_totals(self):
+        '''
+        Returns the HoursTotals of the daily totals of the archives and of
+        the days of totals.json, which only holds the days of hours.json.
+        '''
+        days = self.read_daily_totals()
+        try:
+            with open(self.user_totals, 'rb') as totals_file:
+                hot_days = loads(totals_file.read())['days']
+        except (IOError, OSError, ValueError, KeyError):
+            hot_days = {}
+        # A day archived since totals.json was written is in both
+        for key, projects in hot_days.items():
+            days.setdefault(key, projects)
+        return HoursTotals.from_days(days)
+
+    def read_daily_totals(self):
+        '''
+        Returns the dict of {project: seconds} by ISO date of the archived
+        days, see update_daily_totals().
+        '''
+        try:
+            with open(self.user_data_backup + 'daily_totals.json', 'rb') as totals_file:
+                return loads(totals_file.read())
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def save_data(self):
+        '''
+        Writes the events recorded since the last call to the journal, or
+        compacts the data if compact_interval seconds went by since the last
+        compaction or if a compaction was requested.
+        Called from the writer thread.
+
+        The files are locked while they are read or written, so the file lock
+        is only held for I/O. When another process wrote since the last call,
+        the events of this process are journaled and the files read back
+        under the lock, the merge itself happens after releasing it.
+        '''
+        with self._lock:
+            # Apply the last event of the current burst before writing
+            for event in self._coalescer.drain():
+                self.record_event(*event)
+            if self._data is None:
+                return
+
+        raw_data = None
+        with self._file_lock:
+            if self.get_disk_stamp() != self._disk_stamp:
+                with self._lock:
+                    records = self._pending_records
+                    self._pending_records = []
+                try:
+                    self._journal.append(records)
+                except:
+                    with self._lock:
+                        self._pending_records[:0] = records
+                    raise
+                raw_data = self.read_raw_data()
+                daily_totals = self.read_daily_totals()
+                self._disk_stamp = self.get_disk_stamp()
+
+        if raw_data is not None:
+            self.merge_data(self.parse_data(*raw_data), daily_totals)
+
+        # The days rolled out of the data are archived before the compaction
+        # drops them from hours.json
+        self.write_archives()
+
+        with self._lock:
+            records = self._pending_records
+            self._pending_records = []
+            compact = (self._compact_requested
+                       or time.time() - self._last_compaction >= self.compact_interval)
+            if compact:
+                self._compact_requested = False
+                replica = self._replica
+                generation = self._data.generation + 1
+                self._data.generation = generation
+                with self._metrics.time('save.serialise'):
+                    content = dump_data(self._data, self.store_format)
+                    report_json = (content if self.store_format == 'json'
+                                   else dumps(encode(self._data)))
+                totals_obj = current_totals = None
+                if self._totals.dirty:
+                    self._totals.dirty = False
+                    # The archived days are in backup/daily_totals.json
+                    totals_obj = self._totals.to_json(
+                        [day.ordinal for day in self._data.days])
+                    if self._data.days:
+                        current_totals = self._totals.get_periods(
+                            self._data.days[-1].ordinal)
+
+        with self._file_lock:
+            # If another process wrote since the merge, the serialised data
+            # misses its events: only journal the records, the next call
+            # merges and compacts
+            merged = self.get_disk_stamp() == self._disk_stamp
+            try:
+                if compact and merged:
+                    self.compact_data(content, report_json, generation)
+                    if totals_obj is not None:
+                        self.write_totals(totals_obj, current_totals)
+                else:
+                    self._journal.append(records)
+                    self._uncompacted = True
+            except:
+                # Keep the records for the next try
+                with self._lock:
+                    self._pending_records[:0] = records
+                merged = False
+                raise
+            finally:
+                if compact and not merged:
+                    with self._lock:
+                        self._compact_requested = True
+                        if totals_obj is not None:
+                            self._totals.dirty = True
+                        if self._data.generation == generation:
+                            self._data.generation = generation - 1
+                    self._writer.mark_dirty()
+                if merged:
+                    self._disk_stamp = self.get_disk_stamp()
+                    if compact:
+                        with self._lock:
+                            if self._replica is replica:
+                                self._replica = None
+
+        # The history is a secondary copy, its failures mustn't stop the
+        # backups and the replication
+        try:
+            self.write_history()
+        except Exception:
+            self._metrics.count('store.errors')
+            self.log(traceback.format_exc())
+
+        if self.backup_interval:
+            self.backup_if_due()
+
+        if self._replicator:
+            self._replicator.notify()
+
+    def write_history(self):
+        '''
+        Writes the events recorded since the last call to the history
+        database, and rewrites the sessions of the days they touched.
+        The first call writes all the days of hours.json, so the database
+        catches up with what was tracked while it was disabled.
+        Called from the writer thread.
+        '''
+        if not self.history_file:
+            return
+
+        with self._lock:
+            if self._data is None or (
+                    not self._history_records and self._history is not None):
+                return
+            records = self._history_records
+            self._history_records = []
+            if self._history is None:
+                ordinals = None
+            else:
+                ordinals = set(
+                    datetime.fromtimestamp(record[0]).toordinal()
+                    for record in records)
+            user = self._data.user_id or ''
+            days = [get_day_rows(day) for day in self._data.days
+                    if ordinals is None or day.ordinal in ordinals]
+
+        try:
+            if self._history is None:
+                self._history = HoursHistory(self.history_file,
+                                             self._lock_timeout)
+            self._history.write(user, records, days)
+        except:
+            # Keep the events for the next try, up to MAX_HISTORY_RECORDS,
+            # the days are rewritten from the data anyway
+            with self._lock:
+                self._history_records[:0] = records
+                del self._history_records[:-MAX_HISTORY_RECORDS]
+            raise
+
+    def merge_data(self, data, daily_totals=None):
+        '''
+        Replaces the in memory data by data read back from disk, the events
+        recorded since they were journaled are applied on top of it.
+        daily_totals: totals of the archived days read back from disk, the
+        running totals of these days are replaced by them, as another process
+        may have archived the days last
+        '''
+        with self._lock:
+            for timestamp, project, callback in self._pending_records:
+                data = self.apply_event(data, timestamp, project)
+            if self._data is not None:
+                data.user_id = self._data.user_id or data.user_id
+            self._data = data
+            self._uncompacted = True
+            if self._totals is None:
+                self._totals = self.read_totals()
+            if daily_totals:
+                self._totals.update(daily_totals)
+            self._totals.set_days(data.days)
+            if self._replica is not None:
+                self.apply_replica(data, self._replica)
+
+    def merge_replica(self, content, journal_content):
+        '''
+        Merges the data another machine wrote to the replica, the content of
+        its hours.json and of its journal, into the user's data and compacts
+        it. Returns True if the merged data was written to hours.json.
+        Called by the replicator, under the replica's lock, before it copies
+        the data files over the replica's.
+
+        The counters of two machines can't be compared, the days are merged
+        instead, see merge_days(). Only the days of this store are archived,
+        the other machine archives its own.
+        '''
+        replica = self.parse_data(content, journal_content, archive=False)
+        with self._lock:
+            self.apply_replica(self.load_data(), replica)
+            # Applied again if the data is read back from disk before the
+            # compaction, see save_data()
+            self._replica = replica
+            self._compact_requested = True
+
+        self._writer.write()
+        with self._lock:
+            return self._replica is not replica
+
+    def apply_replica(self, data, replica):
+        '''
+        Merges the days of replica, the HoursData of another machine, into
+        data.
+        '''
+        if replica.days:
+            local_ordinals = set(day.ordinal for day in data.days)
+            days = merge_days(data.days, replica.days)
+            today = days[-1].ordinal
+            if data.days:
+                self._new_week = self._new_week or self.is_new_week(data, today)
+            data.days = days
+            archived_days = self.get_days_to_archive(data, today)
+            data.days = days[len(archived_days):]
+            archived_days = [day for day in archived_days
+                             if day.ordinal in local_ordinals]
+            if archived_days:
+                self._archive_queue.append((data.user_id, archived_days))
+            self._totals.set_days(archived_days + data.days)
+        if data.last_active_project is None:
+            data.last_active_project = replica.last_active_project
+        data.user_id = data.user_id or replica.user_id
+        data.last_event_time = max(data.last_event_time, replica.last_event_time)
+
+    def compact_data(self, content, report_json, generation):
+        '''
+        Writes the serialised data to hours.json, and its json to hours.js,
+        and resets the journal now that its events are in hours.json.
+        The files are replaced atomically, and the journal is tagged with the
+        new generation, so a crash between the two writes doesn't fold the
+        old journal twice.
+        '''
+        # As a json string literal, quotes in project names are escaped, and
+        # non ascii characters too, so the page reads it whatever its encoding
+        report = 'var data = {}'.format(json.dumps(report_json.decode('utf-8')))
+        write_file_atomic(self.user_data_json, content)
+        write_file_atomic(self.user_data_js, report)
+        self._journal.reset(generation)
+        self._last_compaction = time.time()
+        self._uncompacted = False
+
+    def write_totals(self, totals_obj, current_totals):
+        '''
+        Writes the running totals to totals.json, and the totals of the
+        periods of the last tracked day to the html report, see
+        HoursTotals.get_periods().
+        '''
+        write_file_atomic(self.user_totals, dumps(totals_obj, sort_keys=True))
+        if current_totals is not None:
+            self._report.write_totals(current_totals)
+
+    def write_archives(self):
+        '''
+        Writes the days rolled out of hours.json to their weekly archive and
+        to the daily totals, and snapshots the data on a new week.
+        Called from the writer thread before the compaction that drops the
+        days from hours.json. Writing the same days again is harmless, so the
+        days another process archived already can be written again.
+        '''
+        with self._lock:
+            queue = self._archive_queue
+            new_week = self._new_week
+            self._archive_queue = []
+            self._new_week = False
+        if not queue and not new_week:
+            return
+
+        try:
+            with self._file_lock:
+                weeks = {}
+                for user_id, days in queue:
+                    for day in days:
+                        week = weeks.setdefault(get_week_start(day.ordinal), {})
+                        week[day.ordinal] = (user_id, day)
+                for week_start, days in sorted(weeks.items()):
+                    archive = self.archive_week(week_start, days)
+                    self._report.write_week(week_start, archive)
+                daily_totals = self.update_daily_totals(
+                    day for days in weeks.values() for user_id, day in days.values())
+                self._report.write_summary(archive.user_id, daily_totals)
+                if new_week:
+                    self.backup_data()
+        except:
+            # Keep the days for the next try
+            with self._lock:
+                self._archive_queue[:0] = queue
+                self._new_week = self._new_week or new_week
+            raise
+
+    def get_archive_path(self, week_start):
+        '''
+        Returns the path of the archive of the week starting at week_start,
+        backup/<dd_mm_yy of the monday>_hours.json.gz
+        '''
+        return '{}{}_hours.json.gz'.format(
+            self.user_data_backup, format_date(week_start).replace('/', '_'))
+
+    def archive_week(self, week_start, days):
+        '''
+        Adds days, a dict of (user id, Day) by ordinal, to the gzip compressed
+        archive of their week, in the hours.json schema.
+        Returns the HoursData of the archive.
+        '''
+        path = self.get_archive_path(week_start)
+        archive = HoursData()
+        if os.path.exists(path):
+            with open(path, 'rb') as archive_file:
+                archive = load_data(archive_file.read())
+
+        archived_days = dict((day.ordinal, day) for day in archive.days)
+        for ordinal, (user_id, day) in days.items():
+            archived_days[ordinal] = day
+            archive.user_id = archive.user_id or user_id
+        archive.days = [archived_days[ordinal] for ordinal in sorted(archived_days)]
+        archive.last_active_project = archive.days[-1].sessions[-1].project
+
+        write_file_atomic(path, gzip.compress(dump_data(archive)))
+        return archive
+
+    def update_daily_totals(self, days):
+        '''
+        Adds the seconds spent on each project each day to
+        backup/daily_totals.json, a dict of {project: seconds} by ISO date.
+        Returns the updated dict.
+        '''
+        path = self.user_data_backup + 'daily_totals.json'
+        totals = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as totals_file:
+                totals = loads(totals_file.read())
+        for day in days:
+            totals[date.fromordinal(day.ordinal).isoformat()] = dict(
+                (session.project, session.total) for session in day.sessions)
+        write_file_atomic(path, dumps(totals, sort_keys=True))
+        return totals
+
+    def backup_data(self):
+        """
+        Snapshots hours.json, the journal and the log to the backup location,
+        and deletes the snapshots past the retention rules. The snapshot is
+        skipped if the files didn't change since the last one.
+        Called under the file lock, so hours.json and the journal match: the
+        events of the journal aren't in hours.json yet.
+        """
+        stats = self._backup.snapshot(
+            {'hours.json': self.user_data_json, 'journal.txt': self.user_journal,
+             'log.txt': self.user_log})
+        self._last_backup = time.time()
+        if stats['snapshot'] is not None:
+            self._backup.prune(self.backup_keep_weekly, self.backup_keep_monthly)
+            self.log(format_stats(stats))
+        return stats
+
+    def backup_if_due(self):
+        '''
+        Snapshots the data if backup_interval seconds went by since the last
+        snapshot. Failures are logged, the next try is an interval later.
+        '''
+        if self._last_backup is None:
+            snapshots = self._backup.list_snapshots()
+            self._last_backup = 0
+            if snapshots:
+                manifest = self._backup.read_manifest(snapshots[-1])
+                self._last_backup = manifest['time']
+        if time.time() - self._last_backup < self.backup_interval:
+            return
+
+        with self._file_lock:
+            try:
+                self.backup_data()
+            except Exception:
+                self._last_backup = time.time()
+                self.log(traceback.format_exc())
+
+    def invalidate_data(self):
+        '''
+        Drops the in memory data, next call to load_data() reads it from disk.
+        '''
+        self._data = None
+        self._disk_stamp = None
+
+    def flush(self):
+        '''
+        Asks the writer thread to write pending data now. Doesn't block.
+        '''
+        self._writer.flush()
+
+    def generate_report(self):
+        '''
+        Compacts the data now, so hours.js and the html report are up to date.
+        '''
+        with self._lock:
+            if self._data is None:
+                self.load_data()
+            self._compact_requested = True
+        self._writer.mark_dirty()
+        self._writer.flush(wait=True)
+
+    def get_period_totals(self, period='day', day=None):
+        '''
+        Returns a dict of the seconds spent on each project during the day,
+        ISO week or month holding day, a date object, today by default.
+        Read from the running totals, they include the events not written yet.
+        '''
+        if day is None:
+            day = date.today()
+        with self._lock:
+            self.load_data()
+            return dict(self._totals.get(period, day.toordinal()))
+
+    def get_metrics_snapshot(self):
+        '''
+        Returns the timings of the store's phases, see
+        Prism_HoursTracker_Metrics.
+        '''
+        return self._metrics.snapshot()
+
+    def get_event_stats(self):
+        '''
+        Returns how many events each callback received, and how many of them
+        were absorbed by the coalescer. Helps tuning coalesce_window.
+        '''
+        with self._lock:
+            return self._coalescer.get_stats()
+
+    def shutdown(self):
+        '''
+        Compacts the data and stops the writer thread, then the replicator
+        after a last copy, and writes the log.
+        '''
+        with self._lock:
+            if (self._uncompacted or self._pending_records
+                    or self._writer.is_dirty()):
+                self._compact_requested = True
+                self._writer.mark_dirty()
+        self._writer.stop()
+        if self._history is not None:
+            self._history.close()
+        if self._replicator:
+            self._replicator.notify()
+            self._replicator.stop()
+        self._log.flush()
+
+    def log(self, message, level=None):
+        '''
+        Queues message for the log, see Prism_HoursTracker_Log.
+        '''
+        self._log.write(message, level)
+
+
+def create_store(variables, user_data_dir, replica_dir=None):
+    '''
+    Returns a HoursStore writing user_data_dir, and replicating it to
+    replica_dir if given, configured by the plugin settings, see
+    Prism_HoursTracker_Variables. Used by the plugin and the daemon.
+    '''
+    history_file = None
+    if get_setting(variables, 'history_file'):
+        history_file = user_data_dir + get_setting(variables, 'history_file')
+    return HoursStore(
+        user_data_dir,
+        flush_interval=get_setting(variables, 'flush_interval'),
+        compact_interval=get_setting(variables, 'compact_interval'),
+        coalesce_window=get_setting(variables, 'coalesce_window'),
+        lock_timeout=get_setting(variables, 'lock_timeout'),
+        replica_dir=replica_dir,
+        replication_interval=get_setting(variables, 'replication_interval'),
+        replication_max_backoff=get_setting(variables, 'replication_max_backoff'),
+        history_file=history_file,
+        hot_max_days=get_setting(variables, 'hot_max_days'),
+        backup_interval=get_setting(variables, 'backup_interval'),
+        backup_keep_weekly=get_setting(variables, 'backup_keep_weekly'),
+        backup_keep_monthly=get_setting(variables, 'backup_keep_monthly'),
+        store_format=get_setting(variables, 'store_format'),
+        idle_gap=get_idle_gap(variables))
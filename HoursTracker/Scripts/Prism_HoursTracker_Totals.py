@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""
+Running totals of the seconds spent on each project per day, ISO week and
+month.
+
+HoursStore updates them with each event and writes them to totals.json
+along with hours.json, so today's or this week's totals are read without
+walking the sessions or the archives.
+"""
+
+from datetime import date
+
+from Prism_HoursTracker_Model import get_week_start
+
+
+PERIODS = ('day', 'week', 'month')
+
+
+def get_period_key(period, ordinal):
+    '''
+    Returns the key of the period holding a date ordinal: the ISO date of
+    the day or of the monday of the week, or the year and month.
+    '''
+    if period == 'week':
+        ordinal = get_week_start(ordinal)
+    day = date.fromordinal(ordinal)
+    if period == 'month':
+        return '{:04d}-{:02d}'.format(day.year, day.month)
+    return day.isoformat()
+
+
+def parse_day_key(key):
+    '''
+    Converts the ISO date key of a day to a date ordinal.
+    '''
+    return date(*map(int, key.split('-'))).toordinal()
+
+
+class HoursTotals(object):
+    '''
+    The seconds spent on each project per period, a dict of
+    {project: seconds} by period key for each period, see get_period_key().
+
+    The days are the reference, the weeks and months are updated along with
+    them by add() and set_day(). dirty is set when the totals change.
+    '''
+    def __init__(self):
+        self.periods = dict((period, {}) for period in PERIODS)
+        self.dirty = False
+        # The keys of the periods of each day, add() is called on every event
+        self._keys = {}
+
+    @classmethod
+    def from_days(cls, days):
+        '''
+        Returns the totals of days, a dict of {project: seconds} by ISO date,
+        the weeks and months are summed from them.
+        '''
+        totals = cls()
+        for key, projects in days.items():
+            ordinal = parse_day_key(key)
+            for project, seconds in projects.items():
+                totals.add(ordinal, project, seconds)
+        return totals
+
+    def to_json(self, ordinals=None):
+        '''
+        Returns the totals as a dict of {period key: {project: seconds}} by
+        period name, 'days', 'weeks' and 'months'. With ordinals, a list of
+        date ordinals, only these days are included, the weeks and months
+        are all included.
+        '''
+        totals_json = {}
+        for period in PERIODS:
+            periods = self.periods[period]
+            if period == 'day' and ordinals is not None:
+                keys = [self.get_keys(ordinal)[0] for ordinal in ordinals]
+                periods = dict((key, periods[key]) for key in keys
+                               if key in periods)
+            totals_json[period + 's'] = dict(
+                (key, dict(projects)) for key, projects in periods.items())
+        return totals_json
+
+    def get_keys(self, ordinal):
+        keys = self._keys.get(ordinal)
+        if keys is None:
+            keys = self._keys[ordinal] = tuple(
+                get_period_key(period, ordinal) for period in PERIODS)
+        return keys
+
+    def get(self, period, ordinal):
+        '''
+        Returns the dict of {project: seconds} of the period holding the
+        date ordinal, empty if nothing was tracked.
+        '''
+        return self.periods[period].get(
+            self.get_keys(ordinal)[PERIODS.index(period)], {})
+
+    def get_periods(self, ordinal):
+        '''
+        Returns the key and a copy of the totals of the day, week and month
+        of a date ordinal, {'key': key, 'totals': {project: seconds}} by
+        period name.
+        '''
+        return dict(
+            (period, {'key': key, 'totals': dict(self.periods[period].get(key, {}))})
+            for period, key in zip(PERIODS, self.get_keys(ordinal)))
+
+    def add(self, ordinal, project, seconds):
+        '''
+        Adds seconds spent on project on the day of a date ordinal to the
+        day, the week and the month. Adding 0 lists the project.
+        '''
+        for period, key in zip(PERIODS, self.get_keys(ordinal)):
+            projects = self.periods[period].get(key)
+            if projects is None:
+                projects = self.periods[period][key] = {}
+            projects[project] = projects.get(project, 0) + seconds
+        self.dirty = True
+
+    def set_day(self, ordinal, projects):
+        '''
+        Replaces the totals of a day by projects, a dict of
+        {project: seconds}, and adds the differences to the week and month.
+        '''
+        current = self.get('day', ordinal)
+        if current == projects:
+            return
+        current = dict(current)
+        for project in set(current) | set(projects):
+            self.add(ordinal, project,
+                     projects.get(project, 0) - current.get(project, 0))
+        # Projects dropped from the day are dropped from the day only, the
+        # week and month keep them at the seconds of their other days
+        self.periods['day'][self.get_keys(ordinal)[0]] = dict(projects)
+
+    def set_days(self, days):
+        '''
+        Replaces the totals of the days of a list of Day objects.
+        '''
+        for day in days:
+            self.set_day(day.ordinal, dict(
+                (session.project, session.total) for session in day.sessions))
+
+    def update(self, days):
+        '''
+        Replaces the totals of days, a dict of {project: seconds} by ISO date.
+        '''
+        for key, projects in days.items():
+            self.set_day(parse_day_key(key), projects)
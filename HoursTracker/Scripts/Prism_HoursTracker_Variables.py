@@ -30,9 +30,124 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Prism.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
+
+
+# Heartbeat intervals without an event after which the user is on a break,
+# see get_idle_gap()
+IDLE_GAP_HEARTBEATS = 10
+
+
+def get_setting(variables, name):
+    '''
+    Returns the value of a plugin setting.
+    Defaults are the attributes of Prism_HoursTracker_Variables, and can be
+    overridden with a HOURSTRACKER_<NAME> environment variable.
+    '''
+    default = getattr(variables, name)
+    value = os.environ.get('HOURSTRACKER_' + name.upper())
+    if value is None:
+        return default
+    try:
+        return type(default)(value)
+    except ValueError:
+        return default
+
+
+def get_idle_gap(variables):
+    '''
+    Returns the idle_gap setting. When it is negative, the default:
+    IDLE_GAP_HEARTBEATS heartbeat intervals when the heartbeat is on, as the
+    heartbeat records an event each interval the user is active, and 0
+    otherwise, a gap between two callbacks may be work.
+    '''
+    idle_gap = get_setting(variables, 'idle_gap')
+    if idle_gap >= 0:
+        return idle_gap
+    if get_setting(variables, 'heartbeat'):
+        return IDLE_GAP_HEARTBEATS * get_setting(variables, 'heartbeat_interval')
+    return 0.0
+
+
+def get_data_dirs(data_dir, cache_dir=''):
+    '''
+    Returns the (directory the user's data is written to, directory it is
+    replicated to or None) for the data_dir and cache_dir settings.
+    The directories end with a single slash, the file names are appended
+    to them.
+    '''
+    data_dir = data_dir.rstrip('/\\') + '/'
+    if not cache_dir:
+        return data_dir, None
+    return cache_dir.rstrip('/\\') + '/', data_dir
+
+
 class Prism_HoursTracker_Variables(object):
     def __init__(self, core, plugin):
         self.version = "v2.0.0.beta2"
         self.pluginName = "HoursTracker"
         self.pluginType = "Custom"
         self.platforms = ["Windows", "Linux", "Darwin"]
+
+        # Settings, can be overridden with HOURSTRACKER_<NAME> env variables
+        # Directory holding the user's data
+        self.data_dir = 'U:/mesDocuments/HoursTracker/'
+        # Local directory the data is written to, then copied to data_dir in
+        # the background. Empty to write data_dir directly
+        self.cache_dir = ''
+        # Seconds between two checks for local changes to copy to data_dir
+        self.replication_interval = 30.0
+        # Maximum seconds between two copies while data_dir is unreachable
+        self.replication_max_backoff = 600.0
+        # Directory of the html report templates, empty for the plugin's own
+        self.templates_dir = ''
+        # SQLite database of the hours of all the weeks, in cache_dir if set
+        # or else in data_dir. Keep it on a local disk. Empty to disable
+        self.history_file = ''
+        # Seconds between two writes of the user's data to disk
+        self.flush_interval = 5.0
+        # Seconds between two compactions of the journal into hours.json
+        self.compact_interval = 300.0
+        # Seconds during which events on the same project are merged, 0 to disable
+        self.coalesce_window = 2.0
+        # Seconds a write waits for the other processes writing the data
+        self.lock_timeout = 2.0
+        # Maximum number of days kept in hours.json, older days and the days
+        # of the previous weeks are moved to the weekly archives of backup/
+        self.hot_max_days = 7
+        # Seconds between two snapshots of the data in backup/, 0 to disable
+        self.backup_interval = 86400.0
+        # Number of weeks and months of which the last snapshot is kept
+        self.backup_keep_weekly = 8
+        self.backup_keep_monthly = 12
+        # Format of hours.json, 'json' or 'binary', see
+        # Prism_HoursTracker_Codec. Either of them is read
+        self.store_format = 'json'
+        # 1 to sample the user's activity between two callbacks, see
+        # Prism_HoursTracker_Heartbeat
+        self.heartbeat = 0
+        # Seconds between two samples, at least 5
+        self.heartbeat_interval = 60.0
+        # Milliseconds a probe of a sample may take, a probe taking longer
+        # twice in a row is turned off
+        self.heartbeat_budget_ms = 1.0
+        # Seconds without action after which the next action on the same
+        # project starts a new project session, 0 to never split them.
+        # Negative for 10 heartbeat intervals with the heartbeat, 0 without
+        self.idle_gap = -1.0
+        # 1 to send the events to the tracker daemon of the data directory,
+        # see Prism_HoursTracker_Daemon, 0 to always track in process
+        self.daemon = 0
+        # Seconds waited for the daemon to answer a request, a report may
+        # wait for the other processes writing the data
+        self.daemon_timeout = 30.0
+        # Size in bytes past which log.txt is rotated, and number of rotated
+        # logs kept, log.txt.1 being the most recent
+        self.log_max_bytes = 1048576
+        self.log_backup_count = 3
+        # Seconds during which a repeated message is counted, not written
+        self.log_repeat_interval = 60.0
+        # 1 to time the callbacks and the writes, see get_metrics_snapshot()
+        self.metrics = 0
+        # Seconds between two dumps of the timings to the log, 0 to disable
+        self.metrics_dump_interval = 300.0
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+from datetime import date
+import json
+import os
+
+from Prism_HoursTracker_Lock import write_file_atomic
+from Prism_HoursTracker_Model import encode, format_date, get_week_start
+
+
+def get_js(function, *args):
+    '''
+    Returns a line of javascript calling function with json serialisable
+    args. The report loads its data as scripts, browsers don't let pages
+    opened from disk fetch json files.
+    '''
+    return '{}({});\n'.format(
+        function, ', '.join(json.dumps(arg, sort_keys=True) for arg in args))
+
+
+class ReportWriter(object):
+    '''
+    Writes the data of the html report of past weeks to report_dir.
+
+    Each archived week has its own shard, report/<dd_mm_yy>.js named after
+    its monday, loaded by hours.html when the week is opened. The summary,
+    report/summary.js, lists the weeks with their totals per project, so
+    the report opens without loading any shard. report/totals.js holds the
+    totals of the last tracked day, week and month. Files are only written
+    when their content changed.
+    '''
+    def __init__(self, report_dir):
+        self.report_dir = report_dir
+
+    def get_shard_name(self, week_start):
+        return format_date(week_start).replace('/', '_') + '.js'
+
+    def write_if_changed(self, filename, content):
+        '''
+        Writes content to filename in report_dir, unless the file already
+        holds it. Returns True if the file was written.
+        '''
+        path = os.path.join(self.report_dir, filename)
+        try:
+            with open(path, 'r') as report_file:
+                if report_file.read() == content:
+                    return False
+        except (IOError, OSError):
+            if not os.path.exists(self.report_dir):
+                os.makedirs(self.report_dir)
+        write_file_atomic(path, content)
+        return True
+
+    def write_week(self, week_start, data):
+        '''
+        Writes the shard of the week starting at week_start, data being a
+        HoursData holding the days of the week.
+        '''
+        return self.write_if_changed(
+            self.get_shard_name(week_start),
+            get_js('HoursReport.addWeek', format_date(week_start),
+                   encode(data)))
+
+    def write_summary(self, user_id, daily_totals):
+        '''
+        Writes the summary of the weeks from daily_totals, a dict of
+        {project: seconds} by ISO date.
+        '''
+        weeks = {}
+        for iso_date, totals in daily_totals.items():
+            ordinal = date(*map(int, iso_date.split('-'))).toordinal()
+            week = weeks.setdefault(get_week_start(ordinal), {})
+            for project, seconds in totals.items():
+                week[project] = week.get(project, 0) + seconds
+
+        summary = {
+            'user_id': user_id,
+            'weeks': [{'date': format_date(week_start),
+                       'shard': self.get_shard_name(week_start),
+                       'totals': totals,
+                       'total': sum(totals.values())}
+                      for week_start, totals in sorted(weeks.items(), reverse=True)],
+        }
+        return self.write_if_changed(
+            'summary.js', get_js('HoursReport.setSummary', summary))
+
+    def write_totals(self, periods):
+        '''
+        Writes the totals of the day, week and month of the last tracked day,
+        see HoursTotals.get_periods().
+        '''
+        return self.write_if_changed(
+            'totals.js', get_js('HoursReport.setTotals', periods))
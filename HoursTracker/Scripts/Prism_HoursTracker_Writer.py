@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+####################################################
+#
+# PRISM - Pipeline for animation and VFX projects
+#
+# www.prism-pipeline.com
+#
+# contact: contact@prism-pipeline.com
+#
+####################################################
+#
+#
+# Copyright (C) 2016-2021 Richard Frangenberg
+#
+# Licensed under GNU LGPL-3.0-or-later
+#
+# This file is part of Prism.
+#
+# Prism is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Prism is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Prism.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+import traceback
+
+
+class HoursWriter(object):
+    '''
+    Writes the user's data to disk from a background thread.
+
+    Callbacks only mark the data as dirty, the worker thread calls the
+    flush function once every `interval` seconds at most, so a burst of
+    callbacks ends up as a single write of the latest data.
+    '''
+    def __init__(self, flush_func, interval=5.0, log_func=None):
+        self.flush_func = flush_func
+        self.interval = interval
+        self.log_func = log_func
+
+        self._cond = threading.Condition()
+        # Serialises the flushes of the worker and of flush(wait=True)
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._dirty_since = None
+        self._flush_requested = False
+        self._stopped = False
+
+        self._thread = threading.Thread(
+            target=self._run, name='HoursTrackerWriter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def is_dirty(self):
+        '''
+        Returns True if some data hasn't been written to disk yet.
+        '''
+        return self._dirty
+
+    def mark_dirty(self):
+        '''
+        Tells the worker the data changed. Doesn't block.
+        '''
+        with self._cond:
+            if not self._dirty:
+                self._dirty = True
+                self._dirty_since = time.time()
+                self._cond.notify()
+
+    def flush(self, wait=False):
+        '''
+        Writes pending data now.
+        If wait is False the worker is woken up and the call returns
+        straight away, otherwise the data is written by the calling thread.
+        '''
+        if not wait:
+            with self._cond:
+                self._flush_requested = True
+                self._cond.notify()
+            return
+
+        with self._cond:
+            dirty = self._dirty
+            self._dirty = False
+            self._dirty_since = None
+            self._flush_requested = False
+        if dirty:
+            self._flush()
+
+    def write(self):
+        '''
+        Writes the data now from the calling thread, dirty or not, and
+        raises the errors of the flush function.
+        '''
+        with self._flush_lock:
+            with self._cond:
+                self._dirty = False
+                self._dirty_since = None
+            self.flush_func()
+
+    def stop(self):
+        '''
+        Writes pending data and stops the worker. Registered to run at exit.
+        '''
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(self.interval + 5)
+        self.flush(wait=True)
+
+    def _flush(self):
+        with self._flush_lock:
+            try:
+                self.flush_func()
+            except Exception:
+                # Keep the data dirty so the next flush tries again
+                with self._cond:
+                    self._dirty = True
+                    if self._dirty_since is None:
+                        self._dirty_since = time.time()
+                if self.log_func:
+                    self.log_func(traceback.format_exc())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._dirty:
+                        delay = self._dirty_since + self.interval - time.time()
+                        if self._flush_requested or delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._flush_requested = False
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                self._dirty = False
+                self._dirty_since = None
+                self._flush_requested = False
+
+            self._flush()
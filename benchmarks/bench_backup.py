@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the snapshots of Prism_HoursTracker_Backup with full copies of
+the data files, over a series of daily backups of a growing week.
+
+Usage: python benchmarks/bench_backup.py [backups]
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_model import make_legacy_data
+from Prism_HoursTracker_Backup import HoursBackup
+
+
+def get_size(directory):
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, dirnames, filenames in os.walk(directory)
+               for filename in filenames)
+
+
+def main():
+    backups = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    tmp = tempfile.mkdtemp()
+    try:
+        files = {'hours.json': os.path.join(tmp, 'hours.json'),
+                 'log.txt': os.path.join(tmp, 'log.txt')}
+        copy_dir = os.path.join(tmp, 'copies')
+        os.makedirs(copy_dir)
+        backup = HoursBackup(os.path.join(tmp, 'snapshots'))
+        copy_time = snapshot_time = 0.0
+
+        with open(files['log.txt'], 'w') as log_file:
+            log_file.write('\n18/10/26, 09:00:00 : Traceback...' * 200)
+        for index in range(backups):
+            # Every other backup sees new data, the log rarely changes
+            data = make_legacy_data(days=index // 2 % 7 + 1, seed=index // 2)
+            with open(files['hours.json'], 'w') as json_file:
+                json_file.write(json.dumps(data))
+
+            start = time.perf_counter()
+            for name, path in files.items():
+                shutil.copy(path, os.path.join(copy_dir, '{}_{}'.format(index, name)))
+            copy_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            backup.snapshot(files)
+            snapshot_time += time.perf_counter() - start
+
+        copy_size = get_size(copy_dir)
+        snapshot_size = get_size(backup.backup_dir)
+        print('{} backups'.format(backups))
+        print('full copies  {:>10,} bytes  {:>8.1f} ms'.format(
+            copy_size, copy_time * 1e3))
+        print('snapshots    {:>10,} bytes  {:>8.1f} ms  ({:.1f}x smaller)'.format(
+            snapshot_size, snapshot_time * 1e3, float(copy_size) / snapshot_size))
+
+        # Restoring the last snapshot gives the last files back
+        restored = backup.restore(backup.list_snapshots()[-1],
+                                  os.path.join(tmp, 'restored'))
+        for path in restored:
+            with open(path, 'rb') as restored_file:
+                with open(files[os.path.basename(path)], 'rb') as source_file:
+                    assert restored_file.read() == source_file.read()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
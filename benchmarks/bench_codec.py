@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the encode and decode times and the sizes of the formats of the
+user's data: json with the stdlib, json with orjson when it is installed,
+and the binary format, on synthetic histories of a week, a quarter and a
+year. The gzip compressed size is the size of an archive in that format.
+Each format is first checked to give the data back unchanged.
+
+Usage: python benchmarks/bench_codec.py [runs]
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_model import make_legacy_data
+import Prism_HoursTracker_Codec
+from Prism_HoursTracker_Codec import DATA_FORMATS, dump_data, load_data
+from Prism_HoursTracker_Model import decode, encode
+
+HISTORIES = (('week', 7), ('quarter', 91), ('year', 365))
+
+
+def get_codecs():
+    '''
+    Returns the (name, data format, json module) of the codecs to compare.
+    '''
+    codecs = [('json', 'json', None)]
+    if Prism_HoursTracker_Codec.orjson is not None:
+        codecs.append(('orjson', 'json', Prism_HoursTracker_Codec.orjson))
+    codecs.append(('binary', 'binary', Prism_HoursTracker_Codec.orjson))
+    return codecs
+
+
+def check_round_trip(data):
+    '''
+    Checks that the json and the binary formats give back the data, types
+    included, so changing store_format doesn't change the data.
+    '''
+    expected = json.dumps(encode(data), sort_keys=True)
+    for data_format in DATA_FORMATS:
+        content = dump_data(data, data_format)
+        decoded = json.dumps(encode(load_data(content)), sort_keys=True)
+        assert decoded == expected, '{} round trip changed the data'.format(
+            data_format)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    orjson = Prism_HoursTracker_Codec.orjson
+    print('json backend by default: {}'.format(
+        Prism_HoursTracker_Codec.get_json_backend()))
+    print('{:<8} {:<8} {:>11} {:>11} {:>10} {:>10}'.format(
+        'history', 'codec', 'encode ms', 'decode ms', 'kB', 'gzip kB'))
+    try:
+        for label, days in HISTORIES:
+            data = decode(make_legacy_data(days))
+            data.last_event_time = int(time.time())
+            check_round_trip(data)
+            for name, data_format, module in get_codecs():
+                Prism_HoursTracker_Codec.orjson = module
+                content = dump_data(data, data_format)
+                assert encode(load_data(content)) == encode(data)
+                encode_time = timeit.timeit(
+                    lambda: dump_data(data, data_format), number=runs) / runs
+                decode_time = timeit.timeit(
+                    lambda: load_data(content), number=runs) / runs
+                print('{:<8} {:<8} {:>11.3f} {:>11.3f} {:>10.1f} {:>10.1f}'.format(
+                    label, name, encode_time * 1e3, decode_time * 1e3,
+                    len(content) / 1024.0, len(gzip.compress(content)) / 1024.0))
+    finally:
+        Prism_HoursTracker_Codec.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
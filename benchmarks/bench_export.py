@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Times the timesheet export of synthetic user directories, and checks its
+peak memory stays flat as the number of archives grows. The peak memory is
+traced in a second run, tracing slows the export down.
+
+Usage: python benchmarks/bench_export.py [users] [weeks]
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_import import write_archives
+from Prism_HoursTracker_Export import export
+
+
+class NullOutput(io.TextIOBase):
+    '''
+    Counts the characters written and drops them.
+    '''
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text)
+        return len(text)
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    weeks = int(sys.argv[2]) if len(sys.argv) > 2 else 156
+    tmp = tempfile.mkdtemp()
+    try:
+        print('{:>6} {:>6} {:>9} {:>10} {:>9} {:>9} {:>10}'.format(
+            'format', 'weeks', 'files', 'sessions', 'seconds', 'MB out',
+            'peak kB'))
+        for week_count in sorted(set((weeks // 4, weeks))):
+            root = os.path.join(tmp, 'users_{}'.format(week_count))
+            write_archives(root, users, week_count)
+            for output_format in ('csv', 'ics'):
+                output = NullOutput()
+                start = time.time()
+                count = export([root], output, output_format)
+                seconds = time.time() - start
+                tracemalloc.start()
+                export([root], NullOutput(), output_format)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print('{:>6} {:>6} {:>9} {:>10} {:>9.2f} {:>9.1f} {:>10.0f}'.format(
+                    output_format, week_count, users * week_count, count,
+                    seconds, output.size / 1048576.0, peak / 1024.0))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the activity heartbeat: the cost of a sample and of a heartbeat
+tick recording an event, against the 16.7 ms of a frame at 60 fps, the
+turning off of a probe going over budget, and the hours tracked on a
+synthetic day with the callbacks only and with the heartbeat.
+
+Usage: python benchmarks/bench_heartbeat.py [samples]
+
+The day: two hours of animation after opening the scene without any
+callback, a break, three quarters of an hour with a save every quarter, a
+lunch break, then a save storm and three hours and a half of work without
+callbacks, until the DCC is closed without saving.
+
+Qt isn't needed, the probes are stubs and the timer is replaced by calls to
+on_heartbeat() with a replay clock.
+"""
+
+from datetime import date, datetime, timedelta
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_replay import ReplayClock, percentile
+from bench_startup import StubCore, stub_prism_modules
+
+FRAME_MS = 1000.0 / 60
+INTERVAL = 60.0
+
+# Periods of activity of the day, in seconds since 9:00
+ACTIVITY = [(0, 7200), (9900, 12600), (16200, 28800)]
+CALLBACKS = ([(0, 'onSceneOpen'), (7200, 'sceneSaved')]
+             + [(seconds, 'sceneSaved') for seconds in (10800, 11700, 12600)]
+             + [(18000 + index * 5, 'sceneSaved') for index in range(10)])
+
+
+def get_idle_seconds(offset):
+    '''
+    Returns the seconds since the last activity of the day at offset.
+    '''
+    idle = None
+    for start, end in ACTIVITY:
+        if start <= offset <= end:
+            return 0.0
+        if offset > end:
+            idle = offset - end
+    return idle
+
+
+def time_samples(samples):
+    '''
+    Returns the durations in seconds of samples with stub probes as cheap
+    as Qt's, and whether a slow probe was turned off after MAX_SLOW_SAMPLES.
+    '''
+    from Prism_HoursTracker_Heartbeat import MAX_SLOW_SAMPLES, ActivitySampler
+
+    position = [0]
+
+    def idle_probe(now):
+        position[0] += 1
+        return 0.0 if position[0] % 2 else 120.0
+
+    sampler = ActivitySampler(INTERVAL, 1.0, idle_probe, lambda: False,
+                              lambda: True)
+    durations = []
+    for index in range(samples):
+        start = time.perf_counter()
+        sampler.sample(float(index))
+        durations.append(time.perf_counter() - start)
+
+    slow = ActivitySampler(INTERVAL, 1.0, idle_probe,
+                           lambda: time.sleep(0.005), lambda: True)
+    for index in range(MAX_SLOW_SAMPLES + 1):
+        slow.sample(float(index))
+    return durations, slow.stats['disabled'] == ['modified']
+
+
+def replay_day(heartbeat):
+    '''
+    Replays the day through a plugin, with heartbeat ticks every INTERVAL
+    seconds and the heartbeat setting on if heartbeat is True, so idle_gap
+    takes its default. Returns the seconds tracked and the durations of the
+    ticks that recorded an event.
+    '''
+    tmp = tempfile.mkdtemp()
+    os.environ['HOURSTRACKER_DATA_DIR'] = os.path.join(tmp, 'HoursTracker') + '/'
+    os.environ['HOURSTRACKER_FLUSH_INTERVAL'] = '3600'
+    os.environ['HOURSTRACKER_HEARTBEAT_INTERVAL'] = str(INTERVAL)
+    for name in ('HOURSTRACKER_CACHE_DIR', 'HOURSTRACKER_DAEMON',
+                 'HOURSTRACKER_HEARTBEAT', 'HOURSTRACKER_IDLE_GAP'):
+        os.environ.pop(name, None)
+
+    stub_prism_modules()
+    import Prism_HoursTracker_Functions
+    import Prism_HoursTracker_Store
+    from Prism_HoursTracker_Heartbeat import ActivitySampler
+    from Prism_HoursTracker_init import Prism_HoursTracker
+
+    start = datetime.combine(date.today(), datetime.min.time()) + timedelta(hours=9)
+    origin = time.mktime(start.timetuple())
+    clock = ReplayClock(origin)
+    Prism_HoursTracker_Functions.time = clock
+    Prism_HoursTracker_Store.time = clock
+
+    plugin = Prism_HoursTracker(StubCore())
+    events = [(offset, callback) for offset, callback in CALLBACKS]
+    if heartbeat:
+        # Set once the plugin is loaded, there is no QApplication to start
+        # the timer. The store reads it on the first event
+        os.environ['HOURSTRACKER_HEARTBEAT'] = '1'
+        # As started by start_heartbeat(), without the QTimer
+        plugin._heartbeat = ActivitySampler(
+            INTERVAL, 1.0, lambda now: get_idle_seconds(now - origin),
+            None, lambda: True)
+        offset = INTERVAL
+        while offset <= ACTIVITY[-1][1] + 3600:
+            events.append((offset, None))
+            offset += INTERVAL
+    events.sort(key=lambda event: (event[0], event[1] is None))
+
+    ticks = []
+    try:
+        for offset, callback in events:
+            clock.now = origin + offset
+            if callback is None:
+                count = plugin._heartbeat.stats['active']
+                begin = time.perf_counter()
+                plugin.on_heartbeat()
+                duration = time.perf_counter() - begin
+                if plugin._heartbeat.stats['active'] > count:
+                    ticks.append(duration)
+            else:
+                getattr(plugin, callback)()
+        tracked = sum(plugin.get_period_totals('day', start.date()).values())
+        plugin.shutdown()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return tracked, ticks
+
+
+def format_hours(seconds):
+    return '{}:{:02d}'.format(int(seconds // 3600), int(seconds % 3600 // 60))
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    stub_prism_modules()
+    durations, disabled = time_samples(samples)
+    print('sample           p50 {:>7.2f} us  p99 {:>7.2f} us  max {:>8.2f} us  '
+          '{:.4f}% of a frame'.format(
+              percentile(durations, 0.5) * 1e6, percentile(durations, 0.99) * 1e6,
+              max(durations) * 1e6, percentile(durations, 0.99) * 1e3 / FRAME_MS * 100))
+    print('slow probe turned off: {}'.format('yes' if disabled else 'NO'))
+
+    results = {}
+    for heartbeat in (False, True):
+        # A process per run, the plugin's modules are patched by the replay
+        pool = multiprocessing.Pool(1)
+        try:
+            results[heartbeat] = pool.apply(replay_day, (heartbeat,))
+        finally:
+            pool.close()
+            pool.join()
+
+    ticks = results[True][1]
+    print('recording tick   p50 {:>7.2f} us  p99 {:>7.2f} us  max {:>8.2f} us  '
+          '{} ticks'.format(percentile(ticks, 0.5) * 1e6,
+                            percentile(ticks, 0.99) * 1e6, max(ticks) * 1e6,
+                            len(ticks)))
+    active = sum(end - start for start, end in ACTIVITY)
+    print('day              active {}  callbacks only {}  heartbeat {}'.format(
+        format_hours(active), format_hours(results[False][0]),
+        format_hours(results[True][0])))
+    if not disabled:
+        sys.exit('the slow probe was not turned off')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Times the range queries of the SQLite history database, filled with years
+of synthetic data.
+
+Usage: python benchmarks/bench_history.py [years]
+"""
+
+from datetime import date, timedelta
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_model import make_legacy_data
+from Prism_HoursTracker_History import HoursHistory
+from Prism_HoursTracker_Model import decode
+
+
+def time_query(query, number=20):
+    '''
+    Returns the median time of query in seconds, and its last result.
+    '''
+    times = []
+    for _ in range(number):
+        start = time.perf_counter()
+        result = query()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[number // 2], result
+
+
+def main():
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    tmp = tempfile.mkdtemp()
+    try:
+        history = HoursHistory(os.path.join(tmp, 'history.sqlite'))
+        data = decode(make_legacy_data(days=years * 365))
+        start = time.perf_counter()
+        history.add_data(data, 'bench')
+        print('{} years, {} days written in {:.2f} s'.format(
+            years, len(data.days), time.perf_counter() - start))
+
+        last_day = data.days[-1].ordinal
+        quarter = date.fromordinal(last_day) - timedelta(days=91)
+        project = data.days[-1].sessions[0].project
+        for label, query in (
+                ('all projects, all time',
+                 lambda: history.get_project_totals()),
+                ('all projects, last quarter',
+                 lambda: history.get_project_totals(quarter)),
+                ('one project, last quarter',
+                 lambda: history.get_project_totals(quarter, project=project)),
+                ('one project, days of the last quarter',
+                 lambda: history.get_day_totals(quarter, project=project))):
+            seconds, result = time_query(query)
+            print('{:<40} {:>8.3f} ms  ({} rows)'.format(
+                label, seconds * 1e3, len(result)))
+        history.close()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Times the import of weekly backup archives into the history database with
+an increasing number of worker processes.
+
+Usage: python benchmarks/bench_import.py [users] [weeks]
+"""
+
+from datetime import date, timedelta
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_model import make_legacy_data
+from Prism_HoursTracker_History import HoursHistory
+from Prism_HoursTracker_Import import import_archives
+
+
+def write_archives(root, users, weeks):
+    '''
+    Writes weeks archives of 5 days for each user, in <root>/<user>/backup.
+    '''
+    first_day = date(2020, 1, 6)
+    for user_index in range(users):
+        user = 'user_{:03d}'.format(user_index)
+        backup_dir = os.path.join(root, user, 'backup')
+        os.makedirs(backup_dir)
+        for week in range(weeks):
+            monday = first_day + timedelta(weeks=week)
+            data = make_legacy_data(days=5, seed=user_index * weeks + week,
+                                    first_day=monday)
+            data['user_id'] = user
+            filename = (monday + timedelta(days=7)).strftime('%d_%m_%y')
+            with open(os.path.join(backup_dir, filename + '_hours.json'),
+                      'w') as archive_file:
+                archive_file.write(json.dumps(data))
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    weeks = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    tmp = tempfile.mkdtemp()
+    try:
+        root = os.path.join(tmp, 'users')
+        write_archives(root, users, weeks)
+        print('{} archives, {} cores'.format(
+            users * weeks, multiprocessing.cpu_count()))
+
+        workers = 1
+        while True:
+            db = os.path.join(tmp, 'history_{}.sqlite'.format(workers))
+            history = HoursHistory(db)
+            stats = import_archives(history, [root], workers)
+            assert stats['files'] == users * weeks and not stats['errors']
+            print('{:>2} workers  {:>8.0f} files/s  {:>10.0f} project '
+                  'sessions/s'.format(workers, stats['files'] / stats['seconds'],
+                                      stats['sessions'] / stats['seconds']))
+
+            # Already imported archives are skipped
+            stats = import_archives(history, [root], workers)
+            assert stats['files'] == 0 and stats['skipped'] == users * weeks
+            history.close()
+
+            if workers >= multiprocessing.cpu_count():
+                break
+            workers = min(workers * 2, multiprocessing.cpu_count())
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the typed model of Prism_HoursTracker_Model with the nested dicts
+of hours.json, on a year of synthetic data.
+
+Usage: python benchmarks/bench_model.py [days]
+"""
+
+from datetime import date, datetime, timedelta
+import gc
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from Prism_HoursTracker_Model import decode, encode, format_time
+
+
+def make_legacy_data(days=365, projects=8, sessions_per_day=5,
+                     project_sessions=4, seed=0, first_day=date(2022, 1, 3)):
+    '''
+    Returns a hours.json dict with `days` days of synthetic sessions.
+    '''
+    rng = random.Random(seed)
+    names = ['project_{:02d}'.format(index) for index in range(projects)]
+    legacy_days = []
+    for day_index in range(days):
+        day = first_day + timedelta(days=day_index)
+        clock = 9 * 3600
+        sessions = []
+        for project in rng.sample(names, sessions_per_day):
+            legacy_project_sessions = []
+            for _ in range(project_sessions):
+                start = clock
+                clock += rng.randint(60, 1800)
+                legacy_project_sessions.append({
+                    'start_time': format_time(start),
+                    'last_action_time': format_time(clock),
+                    'total_time': str(timedelta(seconds=clock - start))})
+                clock += rng.randint(0, 600)
+            total = sum(
+                (datetime.strptime(project_session['last_action_time'], '%H:%M:%S')
+                 - datetime.strptime(project_session['start_time'], '%H:%M:%S')
+                 for project_session in legacy_project_sessions), timedelta())
+            sessions.append({'project': project,
+                             'project_sessions': legacy_project_sessions,
+                             'total_time': str(total)})
+        legacy_days.append({'date': day.strftime('%d/%m/%y'),
+                            'sessions': sessions})
+
+    return {'days': legacy_days, 'last_active_project': names[0],
+            'user_id': 'bench'}
+
+
+def measure_memory(build):
+    '''
+    Returns the number of bytes still allocated by the object build() returns.
+    '''
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del obj
+    return current
+
+
+def dict_event(data, start_time):
+    '''
+    The per event path on the nested dicts: linear scan of the day's sessions,
+    strptime of the times and of every total_time of the day.
+    '''
+    project = data['last_active_project']
+    for session in data['days'][-1]['sessions']:
+        if session['project'] == project:
+            project_session = session['project_sessions'][-1]
+            project_session['last_action_time'] = start_time
+            project_session['total_time'] = str(
+                datetime.strptime(start_time, '%H:%M:%S')
+                - datetime.strptime(project_session['start_time'], '%H:%M:%S'))
+    for session in data['days'][-1]['sessions']:
+        total_time = timedelta(seconds=0)
+        for project_session in session['project_sessions']:
+            time = datetime.strptime(project_session['total_time'], '%H:%M:%S')
+            total_time += timedelta(hours=time.hour, minutes=time.minute,
+                                    seconds=time.second)
+        session['total_time'] = str(total_time)
+
+
+def model_event(data, start_time):
+    '''
+    The per event path on the typed model.
+    '''
+    data.days[-1].get_session(data.last_active_project).touch(start_time)
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    legacy = make_legacy_data(days)
+    raw = json.dumps(legacy)
+    legacy['last_active_project'] = legacy['days'][-1]['sessions'][-1]['project']
+    print('{} days, hours.json is {:.1f} kB'.format(days, len(raw) / 1024.0))
+
+    dict_bytes = measure_memory(lambda: json.loads(raw))
+    model_bytes = measure_memory(lambda: decode(json.loads(raw)))
+    print('memory     dict {:>10,} B   model {:>10,} B   ({:.1f}x smaller)'.format(
+        dict_bytes, model_bytes, float(dict_bytes) / model_bytes))
+
+    number = 2000
+    data = json.loads(raw)
+    data['last_active_project'] = legacy['last_active_project']
+    dict_time = timeit.timeit(
+        lambda: dict_event(data, '23:59:00'), number=number) / number
+    model = decode(data)
+    model_time = timeit.timeit(
+        lambda: model_event(model, 86340), number=number) / number
+    print('per event  dict {:>10.2f} us  model {:>10.2f} us  ({:.0f}x faster)'.format(
+        dict_time * 1e6, model_time * 1e6, dict_time / model_time))
+
+    number = 5
+    decode_time = timeit.timeit(
+        lambda: decode(json.loads(raw)), number=number) / number
+    loads_time = timeit.timeit(lambda: json.loads(raw), number=number) / number
+    encode_time = timeit.timeit(
+        lambda: json.dumps(encode(model)), number=number) / number
+    dumps_time = timeit.timeit(lambda: json.dumps(data), number=number) / number
+    print('load       dict {:>10.2f} ms  model {:>10.2f} ms'.format(
+        loads_time * 1e3, decode_time * 1e3))
+    print('save       dict {:>10.2f} ms  model {:>10.2f} ms'.format(
+        dumps_time * 1e3, encode_time * 1e3))
+
+    # The codec is lossless on data written by the plugin
+    assert encode(decode(json.loads(raw))) == json.loads(raw)
+
+
+if __name__ == '__main__':
+    main()
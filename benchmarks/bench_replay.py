@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Replays synthetic event streams through the plugin's callbacks, with a stub
+Prism core and a temporary data directory.
+
+Usage: python benchmarks/bench_replay.py [scenario...]
+
+Scenarios: typical_day, publish_storm, many_projects, year_history, all of
+them by default. Each one runs in its own process and reports:
+- the latency of the callbacks, p50 and p99, the first event aside, as it
+  creates the data directory,
+- the latency of the writes of the background writer, run every
+  flush_interval seconds of the stream,
+- the bytes written per event, data files and history database included,
+  read from /proc/self/io where available,
+- the peak resident memory of the process, where available.
+
+The stream's timestamps are fed to the plugin and the store by a replay
+clock, so a day of events replays in a few seconds.
+"""
+
+from datetime import date, datetime, timedelta
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_model import make_legacy_data
+from bench_startup import StubCore, stub_prism_modules
+
+# Seconds of the stream between two writes, the flush_interval default
+FLUSH_INTERVAL = 5.0
+
+# Callbacks of a working session and how often they happen
+WORK_CALLBACKS = (['sceneSaved'] * 6 + ['onStateManagerShow', 'onStateManagerClose',
+                                        'onStateCreated', 'onStateDeleted',
+                                        'postExport', 'onPublish', 'postPublish'])
+PUBLISH_CALLBACKS = ['onPublish', 'onStateCreated', 'onProductCreated',
+                     'postExport', 'postPublish']
+
+
+class ReplayClock(object):
+    '''
+    Stands in for the time module of the plugin and the store, time()
+    returns the timestamp of the event being replayed.
+    '''
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def make_typical_day(rng, projects=3):
+    '''
+    Returns a list of (seconds since 9:00, callback, project): a working day
+    on a few projects, switching project by opening a scene.
+    '''
+    names = ['project_{:02d}'.format(index) for index in range(projects)]
+    events = []
+    clock = 0
+    while clock < 9 * 3600:
+        project = rng.choice(names)
+        events.append((clock, 'onSceneOpen', project))
+        end = clock + rng.randint(1800, 7200)
+        while clock < end:
+            clock += rng.randint(20, 300)
+            events.append((clock, rng.choice(WORK_CALLBACKS), project))
+    return events
+
+
+def make_publish_storm(rng, bursts=200):
+    '''
+    Returns bursts of publish callbacks a fraction of a second apart, one
+    burst a minute on the same project.
+    '''
+    events = [(0, 'onSceneOpen', 'project_00')]
+    clock = 0.0
+    for _ in range(bursts):
+        clock += 60
+        for callback in PUBLISH_CALLBACKS * rng.randint(1, 4):
+            clock += rng.uniform(0.05, 0.5)
+            events.append((clock, callback, 'project_00'))
+    return events
+
+
+def make_many_projects(rng, projects=50):
+    '''
+    Returns a day switching between 50 projects every few minutes.
+    '''
+    names = ['project_{:02d}'.format(index) for index in range(projects)]
+    events = []
+    clock = 0
+    while clock < 9 * 3600:
+        project = rng.choice(names)
+        events.append((clock, 'onSceneOpen', project))
+        for _ in range(rng.randint(1, 5)):
+            clock += rng.randint(10, 120)
+            events.append((clock, rng.choice(WORK_CALLBACKS), project))
+    return events
+
+
+def write_year_history(user_data_dir, first_day):
+    '''
+    Writes a year of days ending the day before first_day to hours.json,
+    the first event rolls them out to the archives.
+    '''
+    os.makedirs(user_data_dir)
+    legacy = make_legacy_data(365, first_day=first_day - timedelta(days=365))
+    with open(user_data_dir + 'hours.json', 'w') as json_file:
+        json.dump(legacy, json_file)
+
+
+SCENARIOS = {
+    'typical_day': make_typical_day,
+    'publish_storm': make_publish_storm,
+    'many_projects': make_many_projects,
+    'year_history': make_typical_day,
+}
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def get_bytes_written():
+    '''
+    Returns the bytes written by this process so far, None if unknown.
+    '''
+    try:
+        with open('/proc/self/io') as io_file:
+            for line in io_file:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def get_peak_memory():
+    '''
+    Returns the peak resident memory of this process in bytes, None if
+    unknown.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_scenario(name):
+    '''
+    Replays the stream of a scenario through a plugin, returns its stats.
+    '''
+    tmp = tempfile.mkdtemp()
+    user_data_dir = os.path.join(tmp, 'HoursTracker') + '/'
+    os.environ['HOURSTRACKER_DATA_DIR'] = user_data_dir
+    os.environ.pop('HOURSTRACKER_CACHE_DIR', None)
+    os.environ.pop('HOURSTRACKER_DAEMON', None)
+    os.environ['HOURSTRACKER_HISTORY_FILE'] = 'history.sqlite'
+    # The replay writes every FLUSH_INTERVAL seconds of the stream, the
+    # writer thread must not write on its own
+    os.environ['HOURSTRACKER_FLUSH_INTERVAL'] = '3600'
+
+    stub_prism_modules()
+    import Prism_HoursTracker_Functions
+    import Prism_HoursTracker_Store
+    from Prism_HoursTracker_init import Prism_HoursTracker
+
+    start = datetime.combine(date.today(), datetime.min.time()) + timedelta(hours=9)
+    clock = ReplayClock(time.mktime(start.timetuple()))
+    Prism_HoursTracker_Functions.time = clock
+    Prism_HoursTracker_Store.time = clock
+
+    if name == 'year_history':
+        write_year_history(user_data_dir, start.date())
+    events = SCENARIOS[name](random.Random(0))
+
+    core = StubCore()
+    plugin = Prism_HoursTracker(core)
+    latencies = []
+    flushes = []
+    first_event = None
+    last_flush = clock.now
+    bytes_before = get_bytes_written()
+    try:
+        for offset, callback, project in events:
+            clock.now = time.mktime(start.timetuple()) + offset
+            core.projectName = project
+            method = getattr(plugin, callback)
+            begin = time.perf_counter()
+            method()
+            latency = time.perf_counter() - begin
+            if first_event is None:
+                first_event = latency
+            else:
+                latencies.append(latency)
+
+            if clock.now - last_flush >= FLUSH_INTERVAL:
+                last_flush = clock.now
+                begin = time.perf_counter()
+                plugin.get_backend()._writer.flush(wait=True)
+                flushes.append(time.perf_counter() - begin)
+
+        plugin.shutdown()
+        bytes_after = get_bytes_written()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        'events': len(events),
+        'first_event': first_event,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'flushes': len(flushes),
+        'flush_p50': percentile(flushes, 0.5) if flushes else 0.0,
+        'flush_p99': percentile(flushes, 0.99) if flushes else 0.0,
+        'bytes_per_event': (None if bytes_before is None else
+                            (bytes_after - bytes_before) / float(len(events))),
+        'peak_memory': get_peak_memory(),
+    }
+
+
+def main():
+    names = sys.argv[1:] or sorted(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            sys.exit('unknown scenario {}, pick from {}'.format(
+                name, ', '.join(sorted(SCENARIOS))))
+
+    print('{:<14} {:>6} {:>9} {:>9} {:>9} {:>8} {:>10} {:>10} {:>9} {:>8}'.format(
+        'scenario', 'events', 'first ms', 'p50 ms', 'p99 ms', 'flushes',
+        'flush p50', 'flush p99', 'B/event', 'peak MB'))
+    for name in names:
+        # A process per scenario, so the peak memory is the scenario's own
+        pool = multiprocessing.Pool(1)
+        try:
+            stats = pool.apply(run_scenario, (name,))
+        finally:
+            pool.close()
+            pool.join()
+        print('{:<14} {:>6} {:>9.2f} {:>9.3f} {:>9.3f} {:>8} {:>10.2f} {:>10.2f} '
+              '{:>9} {:>8}'.format(
+                  name, stats['events'], stats['first_event'] * 1e3,
+                  stats['p50'] * 1e3, stats['p99'] * 1e3, stats['flushes'],
+                  stats['flush_p50'] * 1e3, stats['flush_p99'] * 1e3,
+                  'n/a' if stats['bytes_per_event'] is None
+                  else '{:.0f}'.format(stats['bytes_per_event']),
+                  'n/a' if stats['peak_memory'] is None
+                  else '{:.1f}'.format(stats['peak_memory'] / 1048576.0)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the batch statistics of Prism_HoursTracker_Report with a loop over
+hours.json style dicts parsing each time with strptime, on synthetic
+intervals.
+
+Usage: python benchmarks/bench_report.py [intervals]
+"""
+
+from datetime import date, datetime, timedelta
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+import Prism_HoursTracker_Report
+from Prism_HoursTracker_Model import format_date, format_time
+from Prism_HoursTracker_Report import IntervalTable
+
+
+def make_rows(count, users=20, projects=30, years=5, seed=0):
+    '''
+    Returns count (user, day ordinal, project, start, last) rows.
+    '''
+    rng = random.Random(seed)
+    first_day = date(2020, 1, 1).toordinal()
+    rows = []
+    for _ in range(count):
+        start = rng.randint(8 * 3600, 20 * 3600)
+        rows.append(('user_{:02d}'.format(rng.randrange(users)),
+                     first_day + rng.randrange(years * 365),
+                     'project_{:02d}'.format(rng.randrange(projects)),
+                     start, start + rng.randint(60, 3600)))
+    return rows
+
+
+def dict_daily_totals(intervals):
+    '''
+    The per dict loop: parses the date and times of each interval.
+    '''
+    totals = {}
+    for interval in intervals:
+        day = datetime.strptime(interval['date'], '%d/%m/%y').date()
+        delta = (datetime.strptime(interval['last_action_time'], '%H:%M:%S')
+                 - datetime.strptime(interval['start_time'], '%H:%M:%S'))
+        key = (day, interval['project'])
+        totals[key] = totals.get(key, timedelta()) + delta
+    return totals
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rows = make_rows(count)
+    intervals = [{'date': format_date(day), 'project': project,
+                  'start_time': format_time(start),
+                  'last_action_time': format_time(last)}
+                 for user, day, project, start, last in rows]
+    print('{} intervals, numpy {}'.format(
+        count, 'on' if Prism_HoursTracker_Report.numpy is not None else 'off'))
+
+    dict_time, dict_totals = timed(dict_daily_totals, intervals)
+    print('{:<28} {:>8.3f} s'.format('dict loop, daily totals', dict_time))
+
+    load_time, table = timed(IntervalTable.from_rows, rows)
+    print('{:<28} {:>8.3f} s'.format('table, load', load_time))
+    daily_time, daily = timed(table.get_totals, 'day')
+    print('{:<28} {:>8.3f} s  ({:.0f}x faster than the dict loop)'.format(
+        'table, daily totals', daily_time, dict_time / daily_time))
+    for label, function, args in (
+            ('table, weekly totals', table.get_totals, ('week',)),
+            ('table, monthly totals', table.get_totals, ('month',)),
+            ('table, top 10 projects', table.get_top_projects, (10,)),
+            ('table, remove overlaps', table.remove_overlaps, ())):
+        seconds, result = timed(function, *args)
+        print('{:<28} {:>8.3f} s'.format(label, seconds))
+
+    # Both compute the same totals
+    assert len(daily) == len(dict_totals)
+    assert all(dict_totals[(day, project)].total_seconds() == seconds
+               for day, project, seconds in daily)
+
+
+if __name__ == '__main__':
+    main()
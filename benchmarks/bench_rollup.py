@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Times the studio rollup on synthetic user directories: the first run, a
+re-run with nothing changed, and a re-run after every user's hours.json
+changed.
+
+Usage: python benchmarks/bench_rollup.py [users] [weeks]
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from bench_import import write_archives
+from bench_model import make_legacy_data
+import Prism_HoursTracker_Report
+from Prism_HoursTracker_Rollup import StudioRollup
+
+
+def write_current_weeks(root, seed):
+    '''
+    Writes the hours.json of each user directory under root.
+    '''
+    for user in os.listdir(root):
+        data = make_legacy_data(days=5, seed=seed)
+        data['user_id'] = user
+        with open(os.path.join(root, user, 'hours.json'), 'w') as json_file:
+            json_file.write(json.dumps(data))
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    weeks = int(sys.argv[2]) if len(sys.argv) > 2 else 52
+    tmp = tempfile.mkdtemp()
+    try:
+        root = os.path.join(tmp, 'users')
+        write_archives(root, users, weeks)
+        write_current_weeks(root, 0)
+        output = os.path.join(tmp, 'rollup.json')
+        print('{} users, {} files, numpy {}'.format(
+            users, users * (weeks + 1),
+            'on' if Prism_HoursTracker_Report.numpy is not None else 'off'))
+
+        for label, change in (('first run', None),
+                              ('nothing changed', None),
+                              ('hours.json changed', 1)):
+            if change is not None:
+                # Let the mtimes move
+                time.sleep(0.01)
+                write_current_weeks(root, change)
+            start = time.time()
+            stats = StudioRollup(root, output + '.cache').write(output)
+            print('{:<20} {:>8.2f} s  {:>6} parsed  rollup {:.0f} kB'.format(
+                label, time.time() - start, stats['parsed'],
+                os.path.getsize(output) / 1024.0))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the cost of loading the plugin in Prism, with a stub core.
+Loading must not touch the data directory, the files are created on the
+first tracked event, and noUI sessions must not even register callbacks.
+
+Usage: python benchmarks/bench_startup.py [runs]
+
+Exits with an error if importing the plugin takes more than IMPORT_BUDGET_MS,
+or building it more than STARTUP_BUDGET_MS.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+# Time to import the plugin's modules, the standard modules Prism has
+# already imported excluded, in milliseconds
+IMPORT_BUDGET_MS = 15.0
+# Median time to build the plugin, in milliseconds
+STARTUP_BUDGET_MS = 1.0
+
+# Standard modules imported by Prism before it loads the plugins
+PRISM_MODULES = ('atexit', 'datetime', 'functools', 'json', 'shutil',
+                 'socket', 'threading', 'traceback')
+# Modules of the plugin only needed once an event is tracked
+DEFERRED_MODULES = ('Prism_HoursTracker_Daemon', 'Prism_HoursTracker_Model',
+                    'Prism_HoursTracker_Store')
+
+
+def stub_prism_modules():
+    '''
+    Registers the Prism and Qt modules the plugin imports.
+    '''
+    for name in ('PySide2', 'PySide2.QtCore', 'PySide2.QtGui',
+                 'PySide2.QtWidgets', 'PrismUtils', 'PrismUtils.Decorators'):
+        sys.modules.setdefault(name, types.ModuleType(name))
+    sys.modules['PrismUtils.Decorators'].err_catcher_plugin = (
+        lambda name=None: (lambda func: func))
+
+
+class StubCallbacks(object):
+    def __init__(self):
+        self.registered = []
+
+    def registerCallback(self, name, func, plugin=None):
+        self.registered.append(name)
+
+
+class StubCore(object):
+    def __init__(self, prism_args=()):
+        self.version = 'v2.0.0.beta11.8'
+        self.callbacks = StubCallbacks()
+        self.prismArgs = list(prism_args)
+        self.projectName = 'bench_project'
+        self.username = 'bench'
+
+    def getConfig(self, *args, **kwargs):
+        return self.username
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def time_startup(plugin_class, runs, prism_args=()):
+    '''
+    Returns the median time to build the plugin in seconds, and the last core.
+    '''
+    times = []
+    for _ in range(runs):
+        core = StubCore(prism_args)
+        start = time.perf_counter()
+        plugin_class(core)
+        times.append(time.perf_counter() - start)
+    return median(times), core
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tmp = tempfile.mkdtemp()
+    user_data_dir = os.path.join(tmp, 'HoursTracker') + '/'
+    os.environ['HOURSTRACKER_DATA_DIR'] = user_data_dir
+    os.environ.pop('HOURSTRACKER_CACHE_DIR', None)
+    os.environ.pop('HOURSTRACKER_DAEMON', None)
+    try:
+        stub_prism_modules()
+        for name in PRISM_MODULES:
+            __import__(name)
+        start = time.perf_counter()
+        from Prism_HoursTracker_init import Prism_HoursTracker
+        import_time = time.perf_counter() - start
+        print('import           {:>8.2f} ms'.format(import_time * 1e3))
+        imported = [name for name in DEFERRED_MODULES if name in sys.modules]
+        assert not imported, 'loading the plugin imported {}'.format(
+            ', '.join(imported))
+
+        startup_time, core = time_startup(Prism_HoursTracker, runs)
+        print('load             {:>8.3f} ms  ({} callbacks)'.format(
+            startup_time * 1e3, len(core.callbacks.registered)))
+        assert not os.path.exists(user_data_dir), \
+            'loading the plugin touched the data directory'
+
+        noui_time, core = time_startup(Prism_HoursTracker, runs, ['noUI'])
+        print('load, noUI       {:>8.3f} ms  ({} callbacks)'.format(
+            noui_time * 1e3, len(core.callbacks.registered)))
+        assert not core.callbacks.registered
+
+        # The deferred work, paid once by the first event
+        plugin = Prism_HoursTracker(StubCore())
+        start = time.perf_counter()
+        plugin.update_data('onSceneOpen')
+        first_event_time = time.perf_counter() - start
+        start = time.perf_counter()
+        plugin.update_data('sceneSaved')
+        event_time = time.perf_counter() - start
+        plugin.shutdown()
+        print('first event      {:>8.2f} ms'.format(first_event_time * 1e3))
+        print('next event       {:>8.3f} ms'.format(event_time * 1e3))
+        assert set(os.listdir(user_data_dir)) >= set([
+            'backup', 'hours.html', 'hours.js', 'hours.json', 'log.txt',
+            'style.css'])
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if import_time * 1e3 > IMPORT_BUDGET_MS:
+        sys.exit('importing the plugin takes {:.2f} ms, budget is {} ms'.format(
+            import_time * 1e3, IMPORT_BUDGET_MS))
+    if startup_time * 1e3 > STARTUP_BUDGET_MS:
+        sys.exit('loading the plugin takes {:.3f} ms, budget is {} ms'.format(
+            startup_time * 1e3, STARTUP_BUDGET_MS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Hammers one data directory from several processes, each with its own
+HoursStore, like DCCs tracking in process without the daemon.
+Checks that no event is lost and reports the lock wait percentiles.
+
+Then replicates the data of several machines, each writing its own local
+cache, to one shared directory at the same time, and checks that the
+shared hours.json holds the events of all of them.
+
+Usage: python benchmarks/stress_concurrent_writers.py [processes] [events] [machines]
+"""
+
+from datetime import datetime
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'HoursTracker', 'Scripts'))
+
+from Prism_HoursTracker_Store import HoursStore
+
+
+def get_project(process_index, event_index):
+    # Each event has its own project so it shows up as its own session
+    return 'p{}_{}'.format(process_index, event_index)
+
+
+def hammer(args):
+    '''
+    Records events from one process, returns its lock wait times.
+    '''
+    user_data_dir, process_index, processes, events, start = args
+    store = HoursStore(user_data_dir, flush_interval=0.01,
+                       compact_interval=0.2, coalesce_window=0,
+                       lock_timeout=30.0)
+    for event_index in range(events):
+        timestamp = start + event_index * processes + process_index
+        store.record(timestamp, get_project(process_index, event_index),
+                     'sceneSaved', 'stress')
+        time.sleep(0.001)
+    store.shutdown()
+
+    return list(store._file_lock.waits)
+
+
+def track_machine(args):
+    '''
+    Records events from one machine, its store writing a local cache
+    replicated to the shared directory.
+    '''
+    share_dir, cache_dir, machine_index, machines, events, start = args
+    store = HoursStore(cache_dir, flush_interval=0.01, compact_interval=0.2,
+                       coalesce_window=0, lock_timeout=30.0,
+                       replica_dir=share_dir, replication_interval=0.05)
+    for event_index in range(events):
+        timestamp = start + event_index * machines + machine_index
+        store.record(timestamp, get_project(machine_index, event_index),
+                     'sceneSaved', 'stress')
+        time.sleep(0.001)
+    store.shutdown()
+
+
+def get_lost_events(user_data_dir, processes, events):
+    '''
+    Returns the projects of the events missing from the data of a directory.
+    '''
+    data = HoursStore(user_data_dir).read_data()
+    found = set(session.project for day in data.days for session in day.sessions)
+    expected = set(
+        get_project(process_index, event_index)
+        for process_index in range(processes) for event_index in range(events))
+    return expected - found
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(ratio * len(values)))]
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    user_data_dir = tempfile.mkdtemp() + '/'
+    os.makedirs(user_data_dir + 'backup')
+    # All the events happen during the same day
+    midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = int(time.mktime(midnight.timetuple())) + 3600
+
+    begin = time.time()
+    pool = multiprocessing.Pool(processes)
+    results = pool.map(hammer, [
+        (user_data_dir, index, processes, events, start)
+        for index in range(processes)])
+    pool.close()
+    pool.join()
+    duration = time.time() - begin
+
+    lost = get_lost_events(user_data_dir, processes, events)
+
+    waits = [wait for result in results for wait in result]
+    print('{} processes x {} events in {:.2f}s, {} lock acquisitions'.format(
+        processes, events, duration, len(waits)))
+    print('lock wait  p50 {:.2f} ms  p90 {:.2f} ms  p99 {:.2f} ms  max {:.2f} ms'.format(
+        percentile(waits, 0.5) * 1e3, percentile(waits, 0.9) * 1e3,
+        percentile(waits, 0.99) * 1e3, max(waits) * 1e3))
+    print('lost events: {}'.format(len(lost)))
+
+    shutil.rmtree(user_data_dir)
+    assert not lost, sorted(lost)[:10]
+
+    machines = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    tmp = tempfile.mkdtemp()
+    share_dir = os.path.join(tmp, 'share') + '/'
+    cache_dirs = [os.path.join(tmp, 'cache{}'.format(index)) + '/'
+                  for index in range(machines)]
+    for cache_dir in cache_dirs:
+        os.makedirs(cache_dir + 'backup')
+
+    begin = time.time()
+    pool = multiprocessing.Pool(machines)
+    pool.map(track_machine, [
+        (share_dir, cache_dir, index, machines, events, start)
+        for index, cache_dir in enumerate(cache_dirs)])
+    pool.close()
+    pool.join()
+    duration = time.time() - begin
+
+    lost = get_lost_events(share_dir, machines, events)
+    print('{} machines x {} events replicated in {:.2f}s'.format(
+        machines, events, duration))
+    print('lost events on the share: {}'.format(len(lost)))
+
+    shutil.rmtree(tmp)
+    assert not lost, sorted(lost)[:10]
+
+
+if __name__ == '__main__':
+    main()